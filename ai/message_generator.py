@@ -1,12 +1,22 @@
+import asyncio
+import json
 import logging
 import re
+import time
 from collections import Counter
-from groq import Groq
+from groq import AsyncGroq
 import config
+from ai import template_renderer
+from database import db
 from models.product import Product
 
 logger = logging.getLogger("AI")
 
+# Cliente único durante toda a execução (reaproveita conexões HTTP/TLS com a Groq)
+_client: AsyncGroq | None = None
+# Gerações em andamento ao mesmo tempo (criado no primeiro uso, dentro do event loop)
+_semaphore: asyncio.Semaphore | None = None
+
 SYSTEM_PROMPT = """Você cria mensagens promocionais curtas para WhatsApp no Brasil.
 
 FORMATAÇÃO WHATSAPP (OBRIGATÓRIA):
@@ -60,28 +70,13 @@ EXEMPLO SEM DESCONTO:
 
 Por *R$ 45,90* à vista"""
 
+BATCH_PROMPT = """
 
-def _parse_price(price_str: str) -> float:
-    """Converte string de preço para float. Ex: 'R$ 1.234,56' -> 1234.56"""
-    if not price_str:
-        return 0.0
-    cleaned = re.sub(r'[^\d,.]', '', price_str)
-    # Formato BR: 1.234,56 -> remover pontos de milhar, trocar vírgula por ponto
-    if ',' in cleaned:
-        cleaned = cleaned.replace('.', '').replace(',', '.')
-    try:
-        return float(cleaned)
-    except ValueError:
-        return 0.0
-
-
-def _has_valid_discount(product: Product) -> bool:
-    """Verifica se o desconto é real (preço original > preço atual)."""
-    if not product.original_price:
-        return False
-    original = _parse_price(product.original_price)
-    current = _parse_price(product.price)
-    return original > current > 0
+MODO LOTE:
+- Você vai receber VÁRIOS produtos numerados. Crie UMA mensagem para CADA produto, seguindo todas as regras acima
+- Cada mensagem do lote DEVE ter uma frase de abertura DIFERENTE das outras mensagens do lote
+- Responda SOMENTE com JSON neste formato: {"messages": [{"id": 1, "message": "..."}, {"id": 2, "message": "..."}]}
+- "id" é o número do produto e "message" é a mensagem completa (quebras de linha como \\n no JSON)"""
 
 
 def _sanitize_message(message: str) -> str:
@@ -121,58 +116,101 @@ def _is_garbled(message: str) -> bool:
 
 def _format_sales_info(product: Product) -> str:
     """Retorna info de vendas formatada apenas se relevante (>1000 vendas e rating >= 4.9)."""
-    if not product.sales_info or not product.rating:
-        return "N/A"
-    # Extrair número de vendas
-    sales_match = re.search(r'(\d[\d.]*)', product.sales_info.replace('.', ''))
-    rating_match = re.search(r'(\d+[.,]?\d*)', product.rating)
-    if not sales_match or not rating_match:
-        return "N/A"
-    try:
-        sales_num = int(sales_match.group(1))
-        rating_num = float(rating_match.group(1).replace(',', '.'))
-    except ValueError:
-        return "N/A"
-    if sales_num >= 1000 and rating_num >= 4.9:
-        return f"{product.sales_info} com {product.rating} estrelas (INCLUIR em itálico usando _texto_)"
+    info = template_renderer.top_seller_info(product)
+    if info:
+        return f"{info} (INCLUIR em itálico usando _texto_)"
     return "N/A"
 
 
-def generate_message(product: Product, used_titles: list[str] | None = None) -> str:
-    logger.info(f"Gerando mensagem para produto {product.mlb_id}...")
+def _get_client() -> AsyncGroq:
+    global _client
+    if _client is None:
+        _client = AsyncGroq(api_key=config.GROQ_API_KEY, timeout=config.GROQ_TIMEOUT_SECONDS)
+    return _client
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(max(1, config.GROQ_MAX_CONCURRENCY))
+    return _semaphore
 
-    client = Groq(api_key=config.GROQ_API_KEY)
 
+def _product_fields(product: Product) -> str:
     # Validar desconto real
     original_price_info = "Não informado"
-    if _has_valid_discount(product):
+    if template_renderer.has_valid_discount(product):
         original_price_info = product.original_price
 
     sales_info = _format_sales_info(product)
 
-    user_content = f"""Crie uma mensagem promocional para este produto:
-- Nome: {product.title}
+    return f"""- Nome: {product.title}
 - Preço atual: {product.price}
 - Preço original (de): {original_price_info}
 - Avaliação: {sales_info}
 - Vendas: {sales_info}"""
 
-    if used_titles:
-        titles_list = "\n".join(f"- {t}" for t in used_titles)
-        user_content += f"\n\nFrases de abertura já utilizadas hoje (NÃO repita nenhuma delas, crie algo DIFERENTE):\n{titles_list}"
+
+def _used_titles_section(used_titles: list[str] | None) -> str:
+    if not used_titles:
+        return ""
+    titles_list = "\n".join(f"- {t}" for t in used_titles)
+    return f"\n\nFrases de abertura já utilizadas hoje (NÃO repita nenhuma delas, crie algo DIFERENTE):\n{titles_list}"
+
+
+def _reuse_cached(product: Product, cached: str, used_titles: list[str] | None) -> str:
+    """Mensagem do cache com frase de abertura inédita: se a dela já foi usada, troca só a primeira linha."""
+    logger.info(f"Mensagem de {product.mlb_id} reaproveitada do cache (mesmo preço/cupom), sem chamar a IA")
+    title = extract_title(cached)
+    if title.upper() not in {t.strip().upper() for t in used_titles or []}:
+        return cached
+    emoji, opening = template_renderer.pick_opening(product, used_titles)
+    logger.info(f"Abertura '{title}' do cache já usada hoje, trocando por '{opening}'")
+    _, _, body = cached.partition("\n")
+    return f"{emoji} {opening}\n{body}"
+
+
+async def generate_message(product: Product, used_titles: list[str] | None = None) -> str:
+    cache_key = (product.mlb_id, product.price, product.original_price, product.coupon)
+    cached = db.get_cached_message(*cache_key, ttl_hours=config.MESSAGE_CACHE_TTL_HOURS)
+    if cached:
+        return _reuse_cached(product, cached, used_titles)
+
+    if not config.TEMPLATE_FALLBACK:
+        return await _generate_with_llm(product, used_titles, cache_key)
+
+    # Teto de latência: passou do orçamento (ou a IA falhou), a mensagem sai do template
+    budget = config.LLM_LATENCY_BUDGET_SECONDS or None
+    try:
+        return await asyncio.wait_for(_generate_with_llm(product, used_titles, cache_key), timeout=budget)
+    except asyncio.TimeoutError:
+        logger.warning(f"IA passou do orçamento de {budget:.0f}s para {product.mlb_id}, usando template")
+    except Exception as e:
+        logger.warning(f"IA falhou para {product.mlb_id} ({e}), usando template")
+    return template_renderer.render_message(product, used_titles)
+
+
+async def _generate_with_llm(product: Product, used_titles: list[str] | None, cache_key: tuple) -> str:
+    logger.info(f"Gerando mensagem para produto {product.mlb_id}...")
+
+    client = _get_client()
+
+    user_content = f"Crie uma mensagem promocional para este produto:\n{_product_fields(product)}"
+    user_content += _used_titles_section(used_titles)
 
     max_retries = 3
     last_error = None
     for attempt in range(1, max_retries + 1):
         try:
-            response = client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                max_tokens=300,
-                messages=[
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {"role": "user", "content": user_content},
-                ],
-            )
+            async with _get_semaphore():
+                response = await client.chat.completions.create(
+                    model="llama-3.3-70b-versatile",
+                    max_tokens=300,
+                    messages=[
+                        {"role": "system", "content": SYSTEM_PROMPT},
+                        {"role": "user", "content": user_content},
+                    ],
+                )
             message = response.choices[0].message.content.strip()
             if _is_garbled(message):
                 logger.warning(f"Output inválido na tentativa {attempt}/{max_retries}, retentando...")
@@ -180,6 +218,10 @@ def generate_message(product: Product, used_titles: list[str] | None = None) ->
                 continue
             message = _sanitize_message(message)
             logger.info(f"Mensagem gerada ({len(message)} caracteres)")
+            db.save_cached_message(
+                *cache_key, message,
+                ttl_hours=config.MESSAGE_CACHE_TTL_HOURS, max_entries=config.MESSAGE_CACHE_MAX_ENTRIES,
+            )
             return message
         except Exception as e:
             logger.error(f"ERRO na geração para {product.mlb_id} ({product.title[:50]}) tentativa {attempt}/{max_retries}: {e}")
@@ -188,8 +230,166 @@ def generate_message(product: Product, used_titles: list[str] | None = None) ->
     raise last_error or Exception("Falha ao gerar mensagem após todas as tentativas")
 
 
+async def _request_batch(products: list[Product], used_titles: list[str] | None) -> dict[int, str]:
+    """Uma chamada para o lote inteiro. Retorna {índice do produto: mensagem bruta}."""
+    blocks = [f"Produto {i}:\n{_product_fields(p)}" for i, p in enumerate(products, 1)]
+    user_content = (
+        f"Crie uma mensagem promocional para cada um dos {len(products)} produtos abaixo.\n\n"
+        + "\n\n".join(blocks)
+        + _used_titles_section(used_titles)
+    )
+    async with _get_semaphore():
+        response = await _get_client().chat.completions.create(
+            model="llama-3.3-70b-versatile",
+            max_tokens=300 * len(products),
+            response_format={"type": "json_object"},
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT + BATCH_PROMPT},
+                {"role": "user", "content": user_content},
+            ],
+        )
+    data = json.loads(response.choices[0].message.content)
+    raw = {}
+    for item in data.get("messages") or []:
+        try:
+            index = int(item["id"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if 1 <= index <= len(products) and isinstance(item.get("message"), str):
+            raw[index - 1] = item["message"].strip()
+    return raw
+
+
+async def generate_messages(products: list[Product], used_titles: list[str] | None = None) -> list[str | Exception]:
+    """Gera as mensagens de vários produtos numa única chamada à IA (mesma ordem da entrada).
+
+    Cada mensagem do lote é validada (_is_garbled/_sanitize_message) e a
+    frase de abertura tem que ser inédita no dia e no lote. Produto sem
+    mensagem válida é retentado individualmente, em paralelo, dentro do
+    mesmo orçamento de latência do lote; o que estourar vai para o template.
+    """
+    results: list[str | Exception | None] = [None] * len(products)
+    taken = list(used_titles or [])
+    pending = []
+    for i, product in enumerate(products):
+        cached = db.get_cached_message(
+            product.mlb_id, product.price, product.original_price, product.coupon,
+            ttl_hours=config.MESSAGE_CACHE_TTL_HOURS,
+        )
+        if cached:
+            results[i] = _reuse_cached(product, cached, taken)
+            taken.append(extract_title(results[i]))
+        else:
+            pending.append(i)
+
+    if len(pending) == 1:
+        i = pending.pop()
+        try:
+            results[i] = await generate_message(products[i], used_titles=taken)
+        except Exception as e:
+            results[i] = e
+
+    raw: dict[int, str] = {}
+    # Um orçamento só para o lote inteiro, incluindo as retentativas individuais
+    budget = (config.LLM_LATENCY_BUDGET_SECONDS or None) if config.TEMPLATE_FALLBACK else None
+    deadline = time.monotonic() + budget if budget else None
+    if pending:
+        batch = [products[i] for i in pending]
+        logger.info(f"Gerando mensagens em lote para {len(batch)} produtos...")
+        try:
+            raw = await asyncio.wait_for(_request_batch(batch, taken), timeout=budget)
+        except asyncio.TimeoutError:
+            logger.warning(f"Lote passou do orçamento de {budget:.0f}s, usando template para {len(batch)} produtos")
+            for i in pending:
+                results[i] = template_renderer.render_message(products[i], taken)
+                taken.append(extract_title(results[i]))
+            pending = []
+        except Exception as e:
+            logger.error(f"ERRO na geração em lote ({len(batch)} produtos): {e} - gerando individualmente")
+
+    used_upper = {t.strip().upper() for t in taken}
+    retry = []
+    for position, i in enumerate(pending):
+        product = products[i]
+        message = raw.get(position, "")
+        if not message or _is_garbled(message):
+            retry.append(i)
+            continue
+        message = _sanitize_message(message)
+        title = extract_title(message)
+        if not title or title.upper() in used_upper:
+            logger.warning(f"Lote: abertura repetida ou ausente para {product.mlb_id} ({title!r}), gerando individualmente")
+            retry.append(i)
+            continue
+        used_upper.add(title.upper())
+        taken.append(title)
+        results[i] = message
+        db.save_cached_message(
+            product.mlb_id, product.price, product.original_price, product.coupon, message,
+            ttl_hours=config.MESSAGE_CACHE_TTL_HOURS, max_entries=config.MESSAGE_CACHE_MAX_ENTRIES,
+        )
+    if pending:
+        logger.info(f"Lote: {len(pending) - len(retry)}/{len(pending)} mensagens válidas")
+
+    if retry:
+        await _retry_individually(products, retry, results, taken, used_upper, deadline)
+    return results
+
+
+async def _retry_individually(
+    products: list[Product], retry: list[int], results: list, taken: list[str], used_upper: set[str],
+    deadline: float | None,
+):
+    """Retentativas individuais em paralelo (sob GROQ_MAX_CONCURRENCY) até o fim do orçamento do lote.
+
+    O que falhar, estourar o prazo ou repetir abertura vai para o template
+    (sem fallback configurado, o erro/mensagem da IA fica como está).
+    """
+    remaining = deadline - time.monotonic() if deadline else None
+    if remaining is not None and remaining <= 0:
+        messages = [asyncio.TimeoutError() for _ in retry]
+    else:
+        messages = await asyncio.gather(
+            *(
+                asyncio.wait_for(
+                    _generate_with_llm(
+                        products[i], taken,
+                        (products[i].mlb_id, products[i].price, products[i].original_price, products[i].coupon),
+                    ),
+                    timeout=remaining,
+                )
+                for i in retry
+            ),
+            return_exceptions=True,
+        )
+
+    for i, message in zip(retry, messages):
+        product = products[i]
+        failed = isinstance(message, BaseException)
+        title = "" if failed else extract_title(message)
+        if config.TEMPLATE_FALLBACK and (failed or not title or title.upper() in used_upper):
+            reason = "estourou o orçamento" if isinstance(message, asyncio.TimeoutError) else (
+                f"falhou ({message})" if failed else "repetiu abertura"
+            )
+            logger.warning(f"Lote: IA {reason} para {product.mlb_id}, usando template")
+            message = template_renderer.render_message(product, taken)
+            title = extract_title(message)
+        results[i] = message
+        if title:
+            used_upper.add(title.upper())
+            taken.append(title)
+
+
 def extract_title(message: str) -> str:
     """Extrai a frase de abertura da mensagem gerada (primeira linha, sem emoji)."""
     first_line = message.split("\n")[0].strip()
     title = re.sub(r'^[\U0001F000-\U0001FFFF\u2600-\u27FF\u200d\ufe0f]+\s*', '', first_line).strip()
     return title
+
+
+async def close():
+    """Fecha o cliente da Groq (chamar no shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
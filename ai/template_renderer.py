@@ -0,0 +1,193 @@
+"""Mensagem promocional montada localmente, sem IA.
+
+Gera a mesma estrutura que o SYSTEM_PROMPT pede à IA (emoji + frase de
+abertura, título em negrito, ~De~/Por e a linha de vendas em itálico).
+A frase de abertura vem de um banco de frases por categoria (detectada
+por palavras-chave no título), pulando as já usadas hoje. É determinística:
+o mesmo produto com os mesmos títulos usados gera a mesma mensagem.
+Usada como fallback quando a IA falha ou passa do orçamento de latência.
+"""
+import re
+import zlib
+
+from models.product import Product
+
+# Título maior que isso é resumido (mesma regra do prompt)
+_MAX_TITLE_LENGTH = 60
+
+# Categoria -> palavras-chave no título (comparadas como palavra inteira, em minúsculo)
+_CATEGORY_KEYWORDS = {
+    "eletronicos": (
+        "fone", "headset", "smartphone", "celular", "iphone", "galaxy", "notebook", "tablet", "monitor",
+        "smart tv", "tv", "ssd", "hd externo", "pendrive", "mouse", "teclado", "carregador", "caixa de som",
+        "smartwatch", "câmera", "camera", "roteador", "kindle", "echo", "alexa", "processador", "placa de vídeo",
+    ),
+    "games": ("playstation", "ps5", "ps4", "xbox", "nintendo", "switch", "controle", "gamer"),
+    "casa": (
+        "panela", "frigideira", "air fryer", "fritadeira", "liquidificador", "cafeteira", "micro-ondas",
+        "geladeira", "aspirador", "lixeira", "jogo de cama", "toalha", "travesseiro", "colchão", "organizador",
+        "cozinha", "potes", "ventilador", "ar condicionado", "purificador",
+    ),
+    "ferramentas": (
+        "furadeira", "parafusadeira", "ferramenta", "chave de", "alicate", "serra", "martelo", "trena",
+        "lixadeira", "esmerilhadeira", "compressor", "jogo de soquetes", "bosch", "makita", "dewalt",
+    ),
+    "beleza": (
+        "perfume", "shampoo", "condicionador", "hidratante", "maquiagem", "protetor solar", "secador",
+        "chapinha", "barbeador", "aparador", "creme", "sérum", "serum", "desodorante",
+    ),
+    "moda": ("tênis", "tenis", "camiseta", "camisa", "calça", "bermuda", "jaqueta", "mochila", "relógio", "bolsa"),
+    "esporte": ("bicicleta", "halter", "academia", "whey", "creatina", "esteira", "bola", "yoga"),
+    "bebe": ("fralda", "bebê", "bebe", "infantil", "carrinho de bebê", "mamadeira"),
+    "pet": ("ração", "racao", "pet", "cachorro", "gato", "areia higiênica"),
+    "livros": ("livro", "box", "edição", "mangá"),
+}
+
+_CATEGORY_PATTERNS = {
+    category: re.compile(r"\b(?:" + "|".join(re.escape(k) for k in keywords) + r")\b")
+    for category, keywords in _CATEGORY_KEYWORDS.items()
+}
+
+# Categoria -> (emoji, frases de abertura). "generico" completa quando a categoria se esgota.
+_PHRASE_BANK = {
+    "eletronicos": ("📱", (
+        "HORA DE TROCAR O SEU", "TECNOLOGIA COM DESCONTO", "UPGRADE NO SETUP", "TECH EM PROMOÇÃO",
+        "SEU GADGET NOVO CHEGOU", "PREÇO DE OUTLET TECH",
+    )),
+    "games": ("🎮", (
+        "PLAYER, OLHA ISSO", "GAME ON COM DESCONTO", "HORA DE ZERAR O PREÇO", "SETUP GAMER EM OFERTA",
+    )),
+    "casa": ("🏠", (
+        "SUA CASA MERECE", "UPGRADE NA COZINHA", "CASA NOVA, PREÇO BOM", "PRA DEIXAR O LAR NO CAPRICHO",
+        "ACHADINHO PRA CASA",
+    )),
+    "ferramentas": ("🔧", (
+        "FAZ TU MESMO E ECONOMIZA", "CAIXA DE FERRAMENTAS APROVADA", "MÃO NA MASSA COM DESCONTO",
+        "OFERTA PRA QUEM CONSERTA",
+    )),
+    "beleza": ("💄", (
+        "AUTOCUIDADO EM PROMOÇÃO", "BELEZA COM DESCONTO", "SE CUIDAR FICOU MAIS BARATO", "SKINCARE EM OFERTA",
+    )),
+    "moda": ("👟", (
+        "ESTILO COM DESCONTO", "LOOK NOVO, PREÇO BAIXO", "MODA EM OFERTA", "RENOVA O GUARDA-ROUPA",
+    )),
+    "esporte": ("💪", (
+        "BORA TREINAR ECONOMIZANDO", "SAÚDE EM PROMOÇÃO", "FOCO NO TREINO E NO PREÇO",
+    )),
+    "bebe": ("🍼", (
+        "ECONOMIA PRO PEQUENO", "OFERTA PRA FAMÍLIA", "MAMÃE E PAPAI, OLHA ISSO",
+    )),
+    "pet": ("🐾", (
+        "SEU PET MERECE", "OFERTA PRO MELHOR AMIGO", "MIMO PET COM DESCONTO",
+    )),
+    "livros": ("📚", (
+        "LEITURA EM PROMOÇÃO", "PRA ESTANTE FICAR COMPLETA", "LIVRO BOM E BARATO",
+    )),
+    "generico": ("🔥", (
+        "ACHEI ESSE PRECINHO", "OLHA ESSE PREÇO", "QUE OFERTAÇO", "BARATO ASSIM É RARO",
+        "NOBODY BATE ESSE PREÇO", "TÁ MAIS BARATO QUE ÁGUA", "PREÇO DE BANANA", "VAI ACABAR",
+        "CORRE QUE TÁ VOANDO", "PROMOÇÃO RELÂMPAGO", "PREÇO QUE DÁ GOSTO", "DESCONTO DE RESPEITO",
+    )),
+}
+
+# Conectores que não devem terminar um título resumido
+_TRAILING_WORDS = {"de", "da", "do", "das", "dos", "e", "com", "para", "pra", "em", "a", "o", "-", "|", "/", "+"}
+
+
+def parse_price(price_str: str) -> float:
+    """Converte string de preço para float. Ex: 'R$ 1.234,56' -> 1234.56, 'R$ 1.299' -> 1299.0"""
+    if not price_str:
+        return 0.0
+    cleaned = re.sub(r'[^\d,.]', '', price_str)
+    # Formato BR: 1.234,56 -> remover pontos de milhar, trocar vírgula por ponto
+    if ',' in cleaned:
+        cleaned = cleaned.replace('.', '').replace(',', '.')
+    elif re.fullmatch(r'\d{1,3}(\.\d{3})+', cleaned):
+        # Só milhar, sem centavos (carimbo do Pelando): 1.299 -> 1299
+        cleaned = cleaned.replace('.', '')
+    try:
+        return float(cleaned)
+    except ValueError:
+        return 0.0
+
+
+def has_valid_discount(product: Product) -> bool:
+    """Verifica se o desconto é real (preço original > preço atual)."""
+    if not product.original_price:
+        return False
+    original = parse_price(product.original_price)
+    current = parse_price(product.price)
+    return original > current > 0
+
+
+def top_seller_info(product: Product) -> str:
+    """'<vendas> com <nota> estrelas' se o produto for destaque (>1000 vendas e nota >= 4.9), senão ""."""
+    if not product.sales_info or not product.rating:
+        return ""
+    # Extrair número de vendas
+    sales_match = re.search(r'(\d[\d.]*)', product.sales_info.replace('.', ''))
+    rating_match = re.search(r'(\d+[.,]?\d*)', product.rating)
+    if not sales_match or not rating_match:
+        return ""
+    try:
+        sales_num = int(sales_match.group(1))
+        rating_num = float(rating_match.group(1).replace(',', '.'))
+    except ValueError:
+        return ""
+    if sales_num >= 1000 and rating_num >= 4.9:
+        return f"{product.sales_info} com {product.rating} estrelas"
+    return ""
+
+
+def _format_brl(value: float) -> str:
+    """1234.5 -> 'R$ 1.234,50'"""
+    return "R$ " + f"{value:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def detect_category(title: str) -> str:
+    lowered = title.lower()
+    for category, pattern in _CATEGORY_PATTERNS.items():
+        if pattern.search(lowered):
+            return category
+    return "generico"
+
+
+def _summarize_title(title: str) -> str:
+    title = " ".join(title.replace("*", "").replace("~", "").split())
+    if len(title) <= _MAX_TITLE_LENGTH:
+        return title
+    words = title[:_MAX_TITLE_LENGTH + 1].split()[:-1] or [title[:_MAX_TITLE_LENGTH]]
+    while len(words) > 1 and words[-1].lower().strip(",;:") in _TRAILING_WORDS:
+        words.pop()
+    return " ".join(words).rstrip(",;:-")
+
+
+def pick_opening(product: Product, used_titles: list[str] | None = None) -> tuple[str, str]:
+    """(emoji, frase de abertura) da categoria do produto, evitando as frases já usadas."""
+    used = {t.strip().upper() for t in used_titles or []}
+    category = detect_category(product.title)
+    emoji, phrases = _PHRASE_BANK[category]
+    candidates = [p for p in phrases if p not in used]
+    if not candidates:
+        emoji, phrases = _PHRASE_BANK["generico"]
+        candidates = [p for p in phrases if p not in used] or list(phrases)
+    # Escolha estável por produto (mesma entrada -> mesma mensagem)
+    index = zlib.crc32(product.mlb_id.encode()) % len(candidates)
+    return emoji, candidates[index]
+
+
+def render_message(product: Product, used_titles: list[str] | None = None) -> str:
+    """Monta a mensagem no formato do SYSTEM_PROMPT (sem link nem cupom, adicionados depois)."""
+    emoji, opening = pick_opening(product, used_titles)
+    lines = [f"{emoji} {opening}", "", f"*{_summarize_title(product.title)}*", ""]
+
+    current = parse_price(product.price)
+    price = _format_brl(current) if current else product.price
+    if has_valid_discount(product):
+        lines.append(f"De ~{_format_brl(parse_price(product.original_price))}~")
+    lines.append(f"Por *{price}* à vista")
+
+    sales = top_seller_info(product)
+    if sales:
+        lines += ["", f"_{sales}_"]
+    return "\n".join(lines)
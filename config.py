@@ -11,9 +11,28 @@ ML_EMAIL = os.getenv("ML_EMAIL", "")
 
 # Groq
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
+# Timeout de cada chamada à Groq e gerações simultâneas (requisições em voo)
+GROQ_TIMEOUT_SECONDS = float(os.getenv("GROQ_TIMEOUT_SECONDS", "30"))
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "3"))
+# Fallback sem IA: mensagem por template se a IA falhar ou passar do orçamento (segundos, 0 = sem limite)
+TEMPLATE_FALLBACK = os.getenv("TEMPLATE_FALLBACK", "true").lower() == "true"
+LLM_LATENCY_BUDGET_SECONDS = float(os.getenv("LLM_LATENCY_BUDGET_SECONDS", "20"))
+# Geração em lote: até N produtos por chamada à IA (1 = uma chamada por produto), esperando até X s para juntar o lote
+GROQ_BATCH_SIZE = int(os.getenv("GROQ_BATCH_SIZE", "10"))
+GROQ_BATCH_LINGER_SECONDS = float(os.getenv("GROQ_BATCH_LINGER_SECONDS", "1"))
+# Cache de mensagens geradas (mlb_id + preços + cupom): validade e tamanho máximo
+MESSAGE_CACHE_TTL_HOURS = int(os.getenv("MESSAGE_CACHE_TTL_HOURS", "24"))
+MESSAGE_CACHE_MAX_ENTRIES = int(os.getenv("MESSAGE_CACHE_MAX_ENTRIES", "2000"))
 
 # Telegram
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
+# Limites de envio do bot (Telegram: ~30 msg/s no total e ~20 msg/min por grupo)
+TELEGRAM_GLOBAL_RATE_PER_SECOND = float(os.getenv("TELEGRAM_GLOBAL_RATE_PER_SECOND", "25"))
+TELEGRAM_CHAT_RATE_PER_MINUTE = float(os.getenv("TELEGRAM_CHAT_RATE_PER_MINUTE", "18"))
+# Quantas vezes reagendar um envio que recebeu RetryAfter (flood wait)
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+# Validade do cache URL da imagem -> file_id (repost após mudança de preço não sobe a foto de novo)
+TELEGRAM_FILE_ID_TTL_HOURS = int(os.getenv("TELEGRAM_FILE_ID_TTL_HOURS", "24"))
 TELEGRAM_CHAT_IDS = [
     cid.strip()
     for cid in os.getenv("TELEGRAM_CHAT_IDS", "").split(",")
@@ -22,18 +41,69 @@ TELEGRAM_CHAT_IDS = [
 
 # WhatsApp
 WHATSAPP_BRIDGE_URL = os.getenv("WHATSAPP_BRIDGE_URL", "http://localhost:3001")
+# Por quantos segundos o /status do bridge é reaproveitado antes de consultar de novo
+WHATSAPP_STATUS_TTL_SECONDS = int(os.getenv("WHATSAPP_STATUS_TTL_SECONDS", "10"))
+# Acompanhamento dos jobs enfileirados no bridge (intervalo de consulta e prazo máximo)
+WHATSAPP_JOB_POLL_SECONDS = float(os.getenv("WHATSAPP_JOB_POLL_SECONDS", "2"))
+WHATSAPP_JOB_TIMEOUT_SECONDS = int(os.getenv("WHATSAPP_JOB_TIMEOUT_SECONDS", "300"))
 WHATSAPP_GROUP_IDS = [
     gid.strip()
     for gid in os.getenv("WHATSAPP_GROUP_IDS", "").split(",")
     if gid.strip()
 ]
 
+# Outbox de entregas: tentativas por destinatário e backoff exponencial entre elas
+DELIVERY_MAX_ATTEMPTS = int(os.getenv("DELIVERY_MAX_ATTEMPTS", "8"))
+DELIVERY_BACKOFF_BASE_SECONDS = int(os.getenv("DELIVERY_BACKOFF_BASE_SECONDS", "30"))
+DELIVERY_BACKOFF_MAX_SECONDS = int(os.getenv("DELIVERY_BACKOFF_MAX_SECONDS", "1800"))
+# Intervalo máximo entre varreduras do outbox (enfileirar acorda o worker na hora)
+DELIVERY_POLL_SECONDS = float(os.getenv("DELIVERY_POLL_SECONDS", "5"))
+
 # Scraper
 SCRAPE_INTERVAL_SECONDS = int(os.getenv("SCRAPE_INTERVAL_SECONDS", "60"))
+# Feed em streaming: aba fixa em /recentes empurra cards novos (substitui o polling)
+PELANDO_FEED_MODE = os.getenv("PELANDO_FEED_MODE", "false").lower() == "true"
+PELANDO_FEED_RELOAD_SECONDS = int(os.getenv("PELANDO_FEED_RELOAD_SECONDS", "300"))
+# Listagem do Pelando: "http" (sem browser, cai pro Chrome se desafiado) ou "browser"
+PELANDO_LISTING_BACKEND = os.getenv("PELANDO_LISTING_BACKEND", "http").lower()
+# Dados do produto Amazon: "http" (GET /dp/{ASIN} sem browser, cai pro Chrome em captcha) ou "browser"
+AMAZON_PRODUCT_BACKEND = os.getenv("AMAZON_PRODUCT_BACKEND", "http").lower()
+# Validade do cache de short links resolvidos (horas)
+SHORT_LINK_CACHE_HOURS = int(os.getenv("SHORT_LINK_CACHE_HOURS", "72"))
 AMAZON_AFFILIATE_TAG = os.getenv("AMAZON_AFFILIATE_TAG", "kop057-20")
 HEADLESS = os.getenv("HEADLESS", "false").lower() == "true"
 CHROME_BINARY = os.getenv("CHROME_BINARY", "")  # Ex: /usr/bin/chromium-browser
 CHROMEDRIVER_PATH = os.getenv("CHROMEDRIVER_PATH", "")  # Ex: /usr/bin/chromedriver
+# Instâncias do Chrome em paralelo (cada uma com cópia do perfil principal)
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "1"))
+# Reciclagem preventiva do Chrome (entre deals) ao passar de qualquer limite. 0 = desativado
+BROWSER_MAX_RSS_MB = int(os.getenv("BROWSER_MAX_RSS_MB", "1500"))  # memória da árvore de processos
+BROWSER_MAX_TABS = int(os.getenv("BROWSER_MAX_TABS", "20"))
+BROWSER_MAX_PAGES = int(os.getenv("BROWSER_MAX_PAGES", "200"))  # deals atendidos desde o start
+# Pipeline de deals: fila entre estágios e workers por estágio (extract 0 = soma do limite das lojas)
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "20"))
+PIPELINE_EXTRACT_CONCURRENCY = int(os.getenv("PIPELINE_EXTRACT_CONCURRENCY", "0"))
+PIPELINE_GENERATE_CONCURRENCY = int(os.getenv("PIPELINE_GENERATE_CONCURRENCY", "3"))
+# Deals processados em paralelo por loja (cada um na sua aba). Override: STORE_CONCURRENCY_{STORE_UPPER}
+STORE_CONCURRENCY = int(os.getenv("STORE_CONCURRENCY", "3"))
+
+# Filtro de requisições (CDP Fetch) - bloqueia recursos que o scraper não lê
+BLOCK_RESOURCES = os.getenv("BLOCK_RESOURCES", "true").lower() == "true"
+BLOCK_RESOURCE_TYPES = [
+    rt.strip()
+    for rt in os.getenv("BLOCK_RESOURCE_TYPES", "Image,Media,Font").split(",")
+    if rt.strip()
+]
+REQUEST_FILTER_ALLOW_HOSTS = [
+    h.strip().lower()
+    for h in os.getenv("REQUEST_FILTER_ALLOW_HOSTS", "").split(",")
+    if h.strip()
+]
+REQUEST_FILTER_DENY_HOSTS = [
+    h.strip().lower()
+    for h in os.getenv("REQUEST_FILTER_DENY_HOSTS", "").split(",")
+    if h.strip()
+]
 
 # URLs
 PELANDO_URL = "https://www.pelando.com.br/recentes"
@@ -59,6 +129,12 @@ def get_whatsapp_ids(store: str) -> list[str]:
     return store_ids or WHATSAPP_GROUP_IDS
 
 
+def get_store_concurrency(store: str) -> int:
+    """Retorna quantos deals da loja podem rodar em paralelo. Padrão: STORE_CONCURRENCY_{STORE_UPPER}. Fallback: STORE_CONCURRENCY."""
+    value = os.getenv(f"STORE_CONCURRENCY_{store.upper()}", "").strip()
+    return max(1, int(value)) if value else max(1, STORE_CONCURRENCY)
+
+
 def setup_logging():
     os.makedirs(LOGS_DIR, exist_ok=True)
 
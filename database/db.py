@@ -46,6 +46,70 @@ def init_db():
             created_at TEXT DEFAULT CURRENT_TIMESTAMP
         )
     """)
+    # Histórico de challenges do Cloudflare (tempo de resolução, taxa de sucesso, validade do clearance)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cf_challenges (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            solved_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            solve_seconds REAL,
+            attempts INTEGER,
+            success INTEGER NOT NULL,
+            clearance_expires_at REAL
+        )
+    """)
+    # Cache de short links (mercadolivre.com/sec/..., meli.la, amzn.to) -> URL final do produto
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS short_links (
+            short_url TEXT PRIMARY KEY,
+            resolved_url TEXT NOT NULL,
+            resolved_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # Outbox: mensagem pronta para envio + ledger de entrega por destinatário
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            mlb_id TEXT NOT NULL,
+            product_json TEXT NOT NULL,
+            message TEXT NOT NULL,
+            product_saved INTEGER DEFAULT 0,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS deliveries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            outbox_id INTEGER NOT NULL,
+            channel TEXT NOT NULL,
+            chat_id TEXT NOT NULL,
+            status TEXT DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            next_attempt_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            last_error TEXT,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (outbox_id, channel, chat_id)
+        )
+    """)
+    # Job do bridge do WhatsApp da última tentativa (acompanhado em vez de reenviar)
+    try:
+        conn.execute("ALTER TABLE deliveries ADD COLUMN job_id TEXT")
+        logger.info("Coluna job_id adicionada à tabela deliveries")
+    except sqlite3.OperationalError:
+        pass  # Coluna já existe
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_deliveries_due ON deliveries (status, next_attempt_at)")
+    # Cache de mensagens geradas: mesmo produto com mesmos preços/cupom não chama a IA de novo
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS message_cache (
+            mlb_id TEXT NOT NULL,
+            price TEXT NOT NULL,
+            original_price TEXT NOT NULL,
+            coupon TEXT NOT NULL,
+            message TEXT NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            last_used_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (mlb_id, price, original_price, coupon)
+        )
+    """)
     conn.commit()
     conn.close()
     logger.info("Banco de dados inicializado")
@@ -170,3 +234,249 @@ def cleanup_used_titles():
     conn.close()
     if deleted > 0:
         logger.info(f"Limpeza: {deleted} títulos usados removidos")
+
+
+def record_cf_challenge(solve_seconds: float, attempts: int, success: bool, clearance_expires_at: float | None = None):
+    """Registra uma tentativa de resolver o challenge do Cloudflare."""
+    conn = sqlite3.connect(config.DB_PATH)
+    conn.execute(
+        "INSERT INTO cf_challenges (solve_seconds, attempts, success, clearance_expires_at) VALUES (?, ?, ?, ?)",
+        (solve_seconds, attempts, int(success), clearance_expires_at),
+    )
+    conn.commit()
+    conn.close()
+
+
+def get_last_cf_clearance() -> tuple[str, float | None] | None:
+    """Retorna (solved_at, clearance_expires_at) do último challenge resolvido."""
+    conn = sqlite3.connect(config.DB_PATH)
+    cursor = conn.execute(
+        "SELECT solved_at, clearance_expires_at FROM cf_challenges WHERE success = 1 ORDER BY id DESC LIMIT 1"
+    )
+    row = cursor.fetchone()
+    conn.close()
+    return (row[0], row[1]) if row else None
+
+
+def get_cf_stats(days: int = 7) -> dict:
+    """Retorna total, taxa de sucesso e tempo médio de resolução dos challenges dos últimos N dias."""
+    conn = sqlite3.connect(config.DB_PATH)
+    cursor = conn.execute(
+        """SELECT COUNT(*), COALESCE(SUM(success), 0), AVG(CASE WHEN success = 1 THEN solve_seconds END)
+           FROM cf_challenges WHERE solved_at >= datetime('now', ?)""",
+        (f"-{days} days",),
+    )
+    total, solved, avg_seconds = cursor.fetchone()
+    conn.close()
+    return {
+        "total": total,
+        "success_rate": (solved / total) if total else 0.0,
+        "avg_solve_seconds": avg_seconds or 0.0,
+    }
+
+
+def cleanup_old_cf_challenges(days: int = 30):
+    """Remove histórico de challenges com mais de N dias."""
+    conn = sqlite3.connect(config.DB_PATH)
+    cursor = conn.execute(
+        "DELETE FROM cf_challenges WHERE solved_at < datetime('now', ?)",
+        (f"-{days} days",),
+    )
+    deleted = cursor.rowcount
+    conn.commit()
+    conn.close()
+    if deleted > 0:
+        logger.info(f"Limpeza: {deleted} registros de challenge removidos")
+
+
+def get_short_link(short_url: str, ttl_hours: int = 72) -> str | None:
+    """Retorna a URL resolvida do short link, se resolvida há menos de N horas."""
+    conn = sqlite3.connect(config.DB_PATH)
+    cursor = conn.execute(
+        "SELECT resolved_url FROM short_links WHERE short_url = ? AND resolved_at >= datetime('now', ?)",
+        (short_url, f"-{ttl_hours} hours"),
+    )
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+def save_short_link(short_url: str, resolved_url: str):
+    """Salva (ou atualiza) a resolução de um short link."""
+    conn = sqlite3.connect(config.DB_PATH)
+    conn.execute(
+        "INSERT OR REPLACE INTO short_links (short_url, resolved_url, resolved_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
+        (short_url, resolved_url),
+    )
+    conn.commit()
+    conn.close()
+
+
+def cleanup_old_short_links(ttl_hours: int = 72):
+    """Remove short links resolvidos há mais de N horas (já não seriam usados)."""
+    conn = sqlite3.connect(config.DB_PATH)
+    cursor = conn.execute(
+        "DELETE FROM short_links WHERE resolved_at < datetime('now', ?)",
+        (f"-{ttl_hours} hours",),
+    )
+    deleted = cursor.rowcount
+    conn.commit()
+    conn.close()
+    if deleted > 0:
+        logger.info(f"Limpeza: {deleted} short links expirados removidos")
+
+
+def enqueue_outbox(mlb_id: str, product_json: str, message: str, recipients: list[tuple[str, str]]) -> int:
+    """Grava a mensagem no outbox com uma entrega pendente por (canal, chat_id). Retorna o id."""
+    conn = sqlite3.connect(config.DB_PATH)
+    with conn:
+        cursor = conn.execute(
+            "INSERT INTO outbox (mlb_id, product_json, message) VALUES (?, ?, ?)",
+            (mlb_id, product_json, message),
+        )
+        outbox_id = cursor.lastrowid
+        conn.executemany(
+            "INSERT OR IGNORE INTO deliveries (outbox_id, channel, chat_id) VALUES (?, ?, ?)",
+            [(outbox_id, channel, chat_id) for channel, chat_id in recipients],
+        )
+    conn.close()
+    return outbox_id
+
+
+def get_due_deliveries(limit: int = 200) -> list[dict]:
+    """Entregas pendentes cujo próximo horário de tentativa já chegou (mais antigas primeiro)."""
+    conn = sqlite3.connect(config.DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.execute(
+        """
+        SELECT d.id, d.outbox_id, d.channel, d.chat_id, d.attempts, d.job_id, o.message, o.product_json
+        FROM deliveries d JOIN outbox o ON o.id = d.outbox_id
+        WHERE d.status = 'pending' AND d.next_attempt_at <= datetime('now')
+        ORDER BY d.outbox_id, d.id
+        LIMIT ?
+        """,
+        (limit,),
+    )
+    rows = [dict(r) for r in cursor.fetchall()]
+    conn.close()
+    return rows
+
+
+def mark_delivery_sent(delivery_id: int):
+    conn = sqlite3.connect(config.DB_PATH)
+    conn.execute(
+        "UPDATE deliveries SET status = 'sent', attempts = attempts + 1, last_error = NULL, "
+        "updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+        (delivery_id,),
+    )
+    conn.commit()
+    conn.close()
+
+
+def mark_delivery_failed(delivery_id: int, error: str, retry_in_seconds: float | None):
+    """Registra a falha. Com retry_in_seconds, volta para a fila; com None, falha definitiva."""
+    conn = sqlite3.connect(config.DB_PATH)
+    if retry_in_seconds is None:
+        conn.execute(
+            "UPDATE deliveries SET status = 'failed', attempts = attempts + 1, last_error = ?, job_id = NULL, "
+            "updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (error, delivery_id),
+        )
+    else:
+        conn.execute(
+            "UPDATE deliveries SET attempts = attempts + 1, last_error = ?, job_id = NULL, "
+            "next_attempt_at = datetime('now', ?), updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (error, f"+{int(retry_in_seconds)} seconds", delivery_id),
+        )
+    conn.commit()
+    conn.close()
+
+
+def mark_delivery_waiting(delivery_id: int, job_id: str, check_in_seconds: float):
+    """Envio ainda na fila do bridge: continua pendente, guardando o job para ser acompanhado (não conta tentativa)."""
+    conn = sqlite3.connect(config.DB_PATH)
+    conn.execute(
+        "UPDATE deliveries SET job_id = ?, next_attempt_at = datetime('now', ?), "
+        "updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+        (job_id, f"+{int(check_in_seconds)} seconds", delivery_id),
+    )
+    conn.commit()
+    conn.close()
+
+
+def mark_outbox_product_saved(outbox_id: int) -> bool:
+    """Marca o produto do outbox como salvo. True só na primeira vez (quem ganhou salva o produto)."""
+    conn = sqlite3.connect(config.DB_PATH)
+    cursor = conn.execute(
+        "UPDATE outbox SET product_saved = 1 WHERE id = ? AND product_saved = 0",
+        (outbox_id,),
+    )
+    updated = cursor.rowcount > 0
+    conn.commit()
+    conn.close()
+    return updated
+
+
+def get_delivery_stats() -> dict:
+    """Contagem de entregas por status (pending/sent/failed)."""
+    conn = sqlite3.connect(config.DB_PATH)
+    cursor = conn.execute("SELECT status, COUNT(*) FROM deliveries GROUP BY status")
+    stats = {status: count for status, count in cursor.fetchall()}
+    conn.close()
+    return stats
+
+
+def cleanup_old_outbox(days: int = 7):
+    """Remove mensagens do outbox (e suas entregas) sem nada pendente e mais antigas que N dias."""
+    conn = sqlite3.connect(config.DB_PATH)
+    with conn:
+        old_ids = "SELECT id FROM outbox WHERE created_at < datetime('now', ?) AND id NOT IN " \
+                  "(SELECT outbox_id FROM deliveries WHERE status = 'pending')"
+        conn.execute(f"DELETE FROM deliveries WHERE outbox_id IN ({old_ids})", (f"-{days} days",))
+        cursor = conn.execute(f"DELETE FROM outbox WHERE id IN ({old_ids})", (f"-{days} days",))
+        deleted = cursor.rowcount
+    conn.close()
+    if deleted > 0:
+        logger.info(f"Limpeza: {deleted} mensagens antigas removidas do outbox")
+
+
+def get_cached_message(mlb_id: str, price: str, original_price: str, coupon: str, ttl_hours: int = 24) -> str | None:
+    """Mensagem já gerada para o produto com esses preços/cupom, se gerada há menos de N horas."""
+    key = (mlb_id, price or "", original_price or "", coupon or "")
+    conn = sqlite3.connect(config.DB_PATH)
+    cursor = conn.execute(
+        "SELECT message FROM message_cache WHERE mlb_id = ? AND price = ? AND original_price = ? AND coupon = ? "
+        "AND created_at >= datetime('now', ?)",
+        (*key, f"-{ttl_hours} hours"),
+    )
+    row = cursor.fetchone()
+    if row:
+        conn.execute(
+            "UPDATE message_cache SET last_used_at = CURRENT_TIMESTAMP "
+            "WHERE mlb_id = ? AND price = ? AND original_price = ? AND coupon = ?",
+            key,
+        )
+        conn.commit()
+    conn.close()
+    return row[0] if row else None
+
+
+def save_cached_message(
+    mlb_id: str, price: str, original_price: str, coupon: str, message: str,
+    ttl_hours: int = 24, max_entries: int = 2000,
+):
+    """Salva a mensagem gerada e aplica a evicção (expiradas + menos usadas além de max_entries)."""
+    conn = sqlite3.connect(config.DB_PATH)
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO message_cache (mlb_id, price, original_price, coupon, message) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (mlb_id, price or "", original_price or "", coupon or "", message),
+        )
+        conn.execute("DELETE FROM message_cache WHERE created_at < datetime('now', ?)", (f"-{ttl_hours} hours",))
+        conn.execute(
+            "DELETE FROM message_cache WHERE rowid NOT IN "
+            "(SELECT rowid FROM message_cache ORDER BY last_used_at DESC, rowid DESC LIMIT ?)",
+            (max_entries,),
+        )
+    conn.close()
@@ -7,29 +7,49 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 import config
 from database import db
-from scraper.browser import get_browser, stop_virtual_display
-from scraper.pelando_scraper import scrape_pelando
+from scraper.browser import stop_virtual_display
+from scraper import http_client
+from scraper.browser_pool import BrowserPool
+from scraper.pelando_scraper import get_deals, select_deals
+from scraper.pelando_feed import PelandoFeed
 from scraper.stores import STORE_HANDLERS
-from ai.message_generator import generate_message, extract_title
-from messaging import telegram_sender, whatsapp_sender
+from scraper.tab_pool import get_tab_pool
+from ai import message_generator
+from messaging import delivery, telegram_sender, whatsapp_sender
+from pipeline import DealPipeline
 
 logger = logging.getLogger("MAIN")
 
 browser = None
+pool: BrowserPool | None = None
+pipeline: DealPipeline | None = None
 scheduler = None
+feed: PelandoFeed | None = None
 _shutting_down = False
 _logged_in_stores: set[str] = set()
 
 
 async def ensure_store_logins():
-    """Verifica login em todas as lojas usando o perfil persistente do Chrome."""
+    """Verifica login em todas as lojas usando o perfil persistente do Chrome.
+
+    As verificações rodam em paralelo e usam os cookies de sessão (sem
+    navegar); a página da loja só é aberta quando os cookies são ambíguos.
+    Se algum login interativo acontecer, as instâncias secundárias do pool
+    são re-clonadas do perfil principal pra herdar a sessão.
+    """
     global _logged_in_stores
     _logged_in_stores.clear()
+    interactive_login = False
+
+    handlers = list(STORE_HANDLERS.values())
+    results = await asyncio.gather(*(h.check_login(browser) for h in handlers), return_exceptions=True)
 
-    for store_name, handler in STORE_HANDLERS.items():
-        logger.info(f"Verificando login para {handler.display_name}...")
+    for handler, result in zip(handlers, results):
+        if isinstance(result, Exception):
+            logger.error(f"{handler.display_name}: erro ao verificar login: {result}")
+            result = False
 
-        if await handler.is_logged_in(browser):
+        if result:
             logger.info(f"{handler.display_name}: sessão ativa")
             _logged_in_stores.add(handler.name)
             continue
@@ -41,28 +61,53 @@ async def ensure_store_logins():
             )
             continue
 
+        # Login manual depende do terminal: um de cada vez
         logger.info(f"{handler.display_name}: sessão expirada, iniciando login manual...")
+        interactive_login = True
         if await handler.login(browser):
             _logged_in_stores.add(handler.name)
             logger.info(f"{handler.display_name}: login realizado")
         else:
             logger.error(f"{handler.display_name}: falha no login")
 
+    if interactive_login and pool and len(pool.instances) > 1:
+        logger.info("Propagando sessões do perfil principal para as instâncias secundárias...")
+        await pool.reclone_secondaries()
+
+
+async def prewarm_tabs():
+    """Abre uma aba quente por loja logada em cada instância do Chrome."""
+    handlers = [h for h in STORE_HANDLERS.values() if h.name in _logged_in_stores]
+    await asyncio.gather(
+        *(get_tab_pool(i.browser).prewarm(h) for i in pool.instances for h in handlers),
+        return_exceptions=True,
+    )
+
 
 async def _ensure_browser():
-    """Recria o browser se ele morreu."""
+    """Recria as instâncias do pool que morreram."""
     global browser
-    try:
-        _ = browser.tabs
-    except Exception:
-        logger.warning("Browser inativo, recriando...")
-        try:
-            browser.stop()
-        except Exception:
-            pass
-        browser = await get_browser()
+    restarted = await pool.ensure_healthy()
+    browser = pool.primary
+    lost = [h.display_name for h in STORE_HANDLERS.values() if h.session_lost]
+    if 0 in restarted:
+        # Perfil principal recriado: revalidar sessões (e re-clonar se precisar de login)
         await ensure_store_logins()
-        logger.info("Browser recriado com sucesso")
+    elif lost:
+        logger.warning(f"Sessão perdida durante o ciclo ({', '.join(lost)}), revalidando logins...")
+        await ensure_store_logins()
+    if restarted:
+        logger.info(f"Browser recriado com sucesso (instâncias {restarted})")
+
+
+async def _submit_deals(deals: list) -> int:
+    """Filtra os deals e coloca no pipeline (espera só se a fila de extração estiver cheia)."""
+    # Cookies frescos do Pelando (cf_clearance) pra resolver links da loja via HTTP
+    await http_client.import_browser_cookies(browser)
+    selected = select_deals(deals, _logged_in_stores)
+    accepted = await pipeline.submit(selected)
+    logger.info(f"{accepted} deals novos enviados ao pipeline ({len(deals)} recebidos)")
+    return accepted
 
 
 async def scrape_and_send():
@@ -73,101 +118,55 @@ async def scrape_and_send():
 
     try:
         await _ensure_browser()
-        tab = browser.main_tab
-        products = await scrape_pelando(tab, _logged_in_stores)
+        logger.info(f"Pipeline: {pipeline.stats()}")
+        if len(pool.instances) > 1:
+            logger.info(f"Pool: {pool.stats()}")
 
-        if not products:
-            logger.info("Nenhum produto novo encontrado neste ciclo")
+        deals = await get_deals(browser.main_tab)
+        if not deals:
+            logger.info("Nenhum deal encontrado")
             return
 
-        processed = 0
-        errors = 0
-
-        for product in products:
-            try:
-                # Gerar mensagem com IA - se falhar, pula o produto
-                try:
-                    used_titles = db.get_used_titles()
-                    message = generate_message(product, used_titles=used_titles)
-                    title = extract_title(message)
-                    if title:
-                        db.save_used_title(title)
-                    if product.coupon:
-                        message = f"{message}\n\n`Cupom de {product.coupon}`"
-                except Exception as e:
-                    errors += 1
-                    logger.error(f"ERRO ao gerar mensagem para {product.mlb_id} ({product.title[:50]}): {e} - produto será reprocessado no próximo ciclo")
-                    continue
-
-                # Validar link de afiliado por loja
-                if not product.affiliate_link:
-                    logger.warning(f"Link de afiliado vazio para {product.mlb_id} ({product.title[:50]}) - pulando produto")
-                    errors += 1
-                    continue
-                if product.store == "amazon" and "amzn.to" not in product.affiliate_link and "amazon.com.br" not in product.affiliate_link:
-                    logger.warning(f"Link Amazon inválido para {product.mlb_id}: {product.affiliate_link[:80]} - pulando produto")
-                    errors += 1
-                    continue
-                if product.store == "mercado_livre" and "/sec/" not in product.affiliate_link and "meli.la" not in product.affiliate_link:
-                    logger.warning(f"Link ML inválido para {product.mlb_id}: {product.affiliate_link[:80]} - pulando produto")
-                    errors += 1
-                    continue
-
-                # Determinar canais por loja
-                tg_ids = config.get_telegram_ids(product.store) if product.store else config.TELEGRAM_CHAT_IDS
-                wa_ids = config.get_whatsapp_ids(product.store) if product.store else config.WHATSAPP_GROUP_IDS
-
-                # Enviar para canais
-                telegram_ok = False
-                whatsapp_ok = False
-
-                try:
-                    telegram_sender.send_message(
-                        message=message,
-                        image_url=product.image_url,
-                        affiliate_link=product.affiliate_link,
-                        chat_ids=tg_ids,
-                    )
-                    telegram_ok = True
-                except Exception as e:
-                    logger.error(f"ERRO Telegram para {product.mlb_id} ({product.title[:50]}): {e}")
-
-                try:
-                    whatsapp_sender.send_message(
-                        message=message,
-                        image_url=product.image_url,
-                        affiliate_link=product.affiliate_link,
-                        group_ids=wa_ids,
-                    )
-                    whatsapp_ok = True
-                except Exception as e:
-                    logger.error(f"ERRO WhatsApp para {product.mlb_id} ({product.title[:50]}): {e}")
-
-                if telegram_ok or whatsapp_ok:
-                    db.save_product(product)
-                    processed += 1
-                    logger.info(f"Produto {product.mlb_id} ({product.title[:50]}) processado com sucesso (TG={telegram_ok} WA={whatsapp_ok})")
-                else:
-                    errors += 1
-                    logger.warning(
-                        f"Produto {product.mlb_id} ({product.title[:50]}) NÃO salvo - falha em todos os canais, será reprocessado no próximo ciclo"
-                    )
-
-            except Exception as e:
-                errors += 1
-                logger.error(f"ERRO inesperado ao processar produto {product.mlb_id}: {e}")
-
-        logger.info(
-            f"Ciclo concluído: {processed} produtos processados, {errors} erros"
-        )
+        # Extração, geração e envio seguem nos estágios do pipeline, sem segurar o ciclo
+        await _submit_deals(deals)
 
     except Exception as e:
         logger.error(f"ERRO no ciclo de scraping: {e}")
 
 
+def _retry_in_feed(deal):
+    """Deal descartado pelo pipeline: o feed reemite depois (o polling relê a listagem)."""
+    if feed:
+        feed.retry_later(deal)
+
+
+async def consume_feed():
+    """Modo feed: coloca os deals no pipeline assim que a aba do Pelando os empurra."""
+    global feed
+    while not _shutting_down:
+        try:
+            await _ensure_browser()
+            if feed is None or feed.browser is not browser or not feed.alive:
+                if feed:
+                    await feed.stop()
+                feed = PelandoFeed(browser)
+                await feed.start()
+
+            deals = await feed.next_batch()
+            if not deals:
+                continue  # sem tráfego: volta pra checar browser/feed
+            logger.info(f"Feed: {len(deals)} deals novos recebidos")
+            await _submit_deals(deals)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"ERRO no consumo do feed: {e}")
+            await asyncio.sleep(5)
+
+
 def shutdown_sync():
     """Shutdown síncrono para signal handlers."""
-    global browser, scheduler, _shutting_down
+    global browser, pool, scheduler, _shutting_down
     if _shutting_down:
         return
     _shutting_down = True
@@ -179,18 +178,16 @@ def shutdown_sync():
         except Exception:
             pass
 
-    if browser:
-        try:
-            browser.stop()
-            logger.info("Browser encerrado")
-        except Exception:
-            pass
+    if pool:
+        pool.stop_all()
+        browser = None
+        logger.info("Browser encerrado")
 
     stop_virtual_display()
 
 
 async def main():
-    global browser, scheduler
+    global browser, pool, pipeline, scheduler
 
     config.setup_logging()
     logger.info("KOP-ML iniciando...")
@@ -198,9 +195,12 @@ async def main():
     # Inicializar banco
     db.init_db()
 
-    # Inicializar browser e verificar logins
-    browser = await get_browser()
+    # Inicializar browsers e verificar logins (no perfil principal)
+    pool = BrowserPool(config.BROWSER_POOL_SIZE)
+    await pool.start()
+    browser = pool.primary
     await ensure_store_logins()
+    await prewarm_tabs()
 
     # Registrar signal handlers para graceful shutdown
     loop = asyncio.get_running_loop()
@@ -211,16 +211,27 @@ async def main():
     db.cleanup_old_products(days=7)
     db.cleanup_old_deals(days=1)
 
-    # Executar primeira vez imediatamente
-    await scrape_and_send()
+    pipeline = DealPipeline(pool)
+    pipeline.start()
+
+    # Worker do outbox (retoma também entregas pendentes de execuções anteriores)
+    delivery_task = asyncio.create_task(delivery.run_worker())  # noqa: F841 (mantém referência viva)
 
-    # Agendar execuções periódicas
     scheduler = AsyncIOScheduler()
-    scheduler.add_job(
-        scrape_and_send,
-        "interval",
-        seconds=config.SCRAPE_INTERVAL_SECONDS,
-    )
+    if config.PELANDO_FEED_MODE:
+        # Deals chegam pelo feed em streaming, sem polling
+        pipeline.on_drop = _retry_in_feed
+        feed_task = asyncio.create_task(consume_feed())  # noqa: F841 (mantém referência viva)
+    else:
+        # Executar primeira vez imediatamente
+        await scrape_and_send()
+
+        # Agendar execuções periódicas
+        scheduler.add_job(
+            scrape_and_send,
+            "interval",
+            seconds=config.SCRAPE_INTERVAL_SECONDS,
+        )
     scheduler.add_job(
         db.cleanup_old_products,
         "cron",
@@ -233,6 +244,24 @@ async def main():
         hour=3,
         kwargs={"days": 1},
     )
+    scheduler.add_job(
+        db.cleanup_old_cf_challenges,
+        "cron",
+        hour=3,
+        kwargs={"days": 30},
+    )
+    scheduler.add_job(
+        db.cleanup_old_short_links,
+        "cron",
+        hour=3,
+        kwargs={"ttl_hours": config.SHORT_LINK_CACHE_HOURS},
+    )
+    scheduler.add_job(
+        db.cleanup_old_outbox,
+        "cron",
+        hour=3,
+        kwargs={"days": 7},
+    )
     scheduler.add_job(
         db.cleanup_used_titles,
         "cron",
@@ -240,8 +269,9 @@ async def main():
         minute=0,
     )
 
+    modo = "feed em streaming" if config.PELANDO_FEED_MODE else f"scraping a cada {config.SCRAPE_INTERVAL_SECONDS}s"
     logger.info(
-        f"Scheduler iniciado - scraping a cada {config.SCRAPE_INTERVAL_SECONDS}s, limpeza diária às 03:00, reset títulos às 00:00"
+        f"Scheduler iniciado - {modo}, limpeza diária às 03:00, reset títulos às 00:00"
     )
 
     scheduler.start()
@@ -254,6 +284,11 @@ async def main():
         pass
     finally:
         shutdown_sync()
+        await pipeline.stop()
+        await message_generator.close()
+        await telegram_sender.close()
+        await whatsapp_sender.close()
+        await http_client.close_client()
 
 
 if __name__ == "__main__":
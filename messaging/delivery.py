@@ -0,0 +1,145 @@
+"""Outbox durável de mensagens com ledger de entrega por destinatário.
+
+O pipeline só enfileira: a mensagem gerada vai para a tabela outbox com
+uma linha em deliveries por (canal, chat). O worker lê as entregas
+pendentes, envia agrupado por mensagem e canal (a foto sobe uma vez por
+mensagem) e registra o resultado de cada destinatário. Falhas voltam para
+a fila com backoff exponencial até DELIVERY_MAX_ATTEMPTS; um restart do
+processo não perde nada que já estava no outbox. Envio que ainda está na
+fila do bridge do WhatsApp guarda o jobId e é acompanhado na próxima
+passada, sem reenviar (evita post duplicado). O produto é salvo no
+banco (anti-repost) na primeira entrega bem-sucedida.
+"""
+import asyncio
+import json
+import logging
+from dataclasses import asdict
+
+import config
+from database import db
+from messaging import telegram_sender, whatsapp_sender
+from messaging.whatsapp_sender import PendingJob
+from models.product import Product
+
+logger = logging.getLogger("DELIVERY")
+
+_CHANNELS = {
+    "telegram": telegram_sender.deliver,
+    "whatsapp": whatsapp_sender.deliver,
+}
+
+# Acorda o worker quando algo é enfileirado (sem esperar o próximo poll)
+_wake = asyncio.Event()
+# Entregas com envio em andamento (não são pegas de novo pela próxima varredura)
+_in_flight: set[int] = set()
+_group_tasks: set[asyncio.Task] = set()
+
+
+def _recipients(product: Product) -> list[tuple[str, str]]:
+    tg_ids = config.get_telegram_ids(product.store) if product.store else config.TELEGRAM_CHAT_IDS
+    wa_ids = config.get_whatsapp_ids(product.store) if product.store else config.WHATSAPP_GROUP_IDS
+    recipients = []
+    if config.TELEGRAM_BOT_TOKEN:
+        recipients += [("telegram", chat_id) for chat_id in tg_ids]
+    recipients += [("whatsapp", group_id) for group_id in wa_ids]
+    return recipients
+
+
+def enqueue(product: Product, message: str) -> int | None:
+    """Grava a mensagem no outbox para todos os destinatários da loja. Retorna o id (None sem destinatários)."""
+    recipients = _recipients(product)
+    if not recipients:
+        logger.warning(f"Nenhum destinatário configurado para {product.mlb_id} ({product.store or 'sem loja'})")
+        return None
+    outbox_id = db.enqueue_outbox(product.mlb_id, json.dumps(asdict(product)), message, recipients)
+    logger.info(f"Produto {product.mlb_id} enfileirado no outbox #{outbox_id} ({len(recipients)} destinatários)")
+    _wake.set()
+    return outbox_id
+
+
+def _backoff(attempts: int) -> float:
+    """Espera antes da próxima tentativa (attempts = tentativas já feitas, contando a atual)."""
+    delay = config.DELIVERY_BACKOFF_BASE_SECONDS * 2 ** max(0, attempts - 1)
+    return min(delay, config.DELIVERY_BACKOFF_MAX_SECONDS)
+
+
+async def _deliver_group(outbox_id: int, channel: str, rows: list[dict]):
+    product = Product(**json.loads(rows[0]["product_json"]))
+    chat_ids = [row["chat_id"] for row in rows]
+    try:
+        # Jobs do bridge de tentativas anteriores: acompanhados em vez de reenviados
+        job_ids = {row["chat_id"]: row["job_id"] for row in rows if row.get("job_id")}
+        kwargs = {"job_ids": job_ids} if job_ids else {}
+        try:
+            outcome = await _CHANNELS[channel](
+                rows[0]["message"], product.image_url, product.affiliate_link, chat_ids, **kwargs
+            )
+        except Exception as e:
+            outcome = {chat_id: str(e) for chat_id in chat_ids}
+
+        sent = 0
+        for row in rows:
+            error = outcome.get(row["chat_id"], "sem resultado do canal")
+            if error is None:
+                db.mark_delivery_sent(row["id"])
+                sent += 1
+                continue
+            if isinstance(error, PendingJob):
+                # Ainda na fila do bridge: confere de novo o mesmo job (bem antes do JOB_TTL do bridge)
+                logger.info(f"Outbox #{outbox_id}: {channel}/{row['chat_id']} ainda na fila do bridge (job {error.job_id})")
+                db.mark_delivery_waiting(row["id"], error.job_id, config.DELIVERY_BACKOFF_BASE_SECONDS)
+                continue
+            attempts = row["attempts"] + 1
+            if attempts >= config.DELIVERY_MAX_ATTEMPTS:
+                logger.error(f"Outbox #{outbox_id}: {channel}/{row['chat_id']} desistiu após {attempts} tentativas: {error}")
+                db.mark_delivery_failed(row["id"], error, None)
+            else:
+                retry_in = _backoff(attempts)
+                logger.warning(
+                    f"Outbox #{outbox_id}: {channel}/{row['chat_id']} falhou ({error}), "
+                    f"nova tentativa em {retry_in:.0f}s ({attempts}/{config.DELIVERY_MAX_ATTEMPTS})"
+                )
+                db.mark_delivery_failed(row["id"], error, retry_in)
+
+        if sent:
+            logger.info(f"Outbox #{outbox_id}: {channel} entregue em {sent}/{len(rows)} destinatários")
+            if db.mark_outbox_product_saved(outbox_id):
+                db.save_product(product)
+    finally:
+        _in_flight.difference_update(row["id"] for row in rows)
+
+
+def deliver_due():
+    """Dispara o envio das entregas vencidas, uma task por (mensagem, canal)."""
+    groups: dict[tuple[int, str], list[dict]] = {}
+    for row in db.get_due_deliveries():
+        if row["id"] in _in_flight:
+            continue
+        groups.setdefault((row["outbox_id"], row["channel"]), []).append(row)
+
+    for (outbox_id, channel), rows in groups.items():
+        if channel not in _CHANNELS:
+            for row in rows:
+                db.mark_delivery_failed(row["id"], f"canal desconhecido: {channel}", None)
+            continue
+        _in_flight.update(row["id"] for row in rows)
+        task = asyncio.create_task(_deliver_group(outbox_id, channel, rows))
+        _group_tasks.add(task)
+        task.add_done_callback(_group_tasks.discard)
+
+
+async def run_worker():
+    """Loop do worker: varre o outbox a cada DELIVERY_POLL_SECONDS ou quando algo é enfileirado."""
+    stats = db.get_delivery_stats()
+    if stats.get("pending"):
+        logger.info(f"Outbox: {stats['pending']} entregas pendentes de execuções anteriores")
+    while True:
+        try:
+            deliver_due()
+        except Exception as e:
+            logger.error(f"Erro ao varrer o outbox: {e}")
+        try:
+            await asyncio.wait_for(_wake.wait(), timeout=config.DELIVERY_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
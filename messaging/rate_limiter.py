@@ -0,0 +1,44 @@
+"""Token bucket assíncrono para respeitar limites de envio das plataformas."""
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Libera até `capacity` envios de uma vez e repõe `rate` tokens por segundo.
+
+    Quem chama `acquire` espera (sem bloquear o loop) até haver token. `pause`
+    zera o balde por N segundos — usado quando a plataforma responde com
+    flood wait (RetryAfter).
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        # Lock mantém a ordem de chegada entre quem está esperando
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        now = time.monotonic()
+        self._blocked_until = max(self._blocked_until, now + seconds)
+        self._tokens = 0
+        self._updated = now
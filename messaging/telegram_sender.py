@@ -1,56 +1,165 @@
-import logging
 import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import timedelta
 from telegram import Bot
+from telegram.error import BadRequest, RetryAfter
+from telegram.request import HTTPXRequest
 import config
+from messaging.rate_limiter import TokenBucket
 
 logger = logging.getLogger("TELEGRAM")
 
+# Bot único durante toda a execução (reaproveita o pool de conexões HTTP)
+_bot: Bot | None = None
+
+# Limite global do bot + um balde por chat (criado no primeiro envio)
+_global_bucket = TokenBucket(
+    rate=config.TELEGRAM_GLOBAL_RATE_PER_SECOND,
+    capacity=config.TELEGRAM_GLOBAL_RATE_PER_SECOND,
+)
+_chat_buckets: dict[str, TokenBucket] = {}
+
+# URL da imagem -> (monotonic do envio, file_id): a foto sobe pro Telegram uma vez só
+_FILE_ID_CACHE_SIZE = 500
+_file_ids: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+
+def _chat_bucket(chat_id: str) -> TokenBucket:
+    if chat_id not in _chat_buckets:
+        per_minute = config.TELEGRAM_CHAT_RATE_PER_MINUTE
+        # Rajada curta permitida, depois o ritmo do limite por minuto
+        _chat_buckets[chat_id] = TokenBucket(rate=per_minute / 60, capacity=min(per_minute, 3))
+    return _chat_buckets[chat_id]
+
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+async def get_bot() -> Bot:
+    global _bot
+    if _bot is None:
+        bot = Bot(
+            token=config.TELEGRAM_BOT_TOKEN,
+            request=HTTPXRequest(connection_pool_size=8, read_timeout=30, write_timeout=30),
+        )
+        await bot.initialize()
+        _bot = bot
+    return _bot
+
+
+def _cached_file_id(image_url: str) -> str:
+    entry = _file_ids.get(image_url)
+    if not entry:
+        return ""
+    cached_at, file_id = entry
+    if time.monotonic() - cached_at > config.TELEGRAM_FILE_ID_TTL_HOURS * 3600:
+        del _file_ids[image_url]
+        return ""
+    return file_id
 
-async def _send_to_chat(bot: Bot, chat_id: str, message: str, image_url: str, link: str):
+
+def _remember_file_id(image_url: str, file_id: str):
+    _file_ids[image_url] = (time.monotonic(), file_id)
+    _file_ids.move_to_end(image_url)
+    while len(_file_ids) > _FILE_ID_CACHE_SIZE:
+        _file_ids.popitem(last=False)
+
+
+async def _send_to_chat(
+    bot: Bot, chat_id: str, message: str, image_url: str, link: str, photo: str = ""
+) -> str:
+    """Envia para um chat. `photo` pode ser um file_id já enviado (senão usa a URL).
+
+    Retorna o file_id da foto enviada ("" se foi só texto).
+    """
     caption = f"{message}\n\n🔗 {link}" if link else message
-    if image_url:
-        await bot.send_photo(chat_id=chat_id, photo=image_url, caption=caption)
-    else:
-        await bot.send_message(chat_id=chat_id, text=caption)
-    logger.info(f"Enviado para grupo {chat_id} com sucesso")
+    photo = photo or image_url
+    bucket = _chat_bucket(chat_id)
+    max_attempts = config.TELEGRAM_MAX_RETRIES + 1
+    attempt = 0
+    while attempt < max_attempts:
+        attempt += 1
+        # Balde do chat antes do global: não segura token global esperando o chat
+        await bucket.acquire()
+        await _global_bucket.acquire()
+        try:
+            if photo:
+                sent = await bot.send_photo(chat_id=chat_id, photo=photo, caption=caption)
+                logger.info(f"Enviado para grupo {chat_id} com sucesso")
+                return sent.photo[-1].file_id if sent.photo else ""
+            await bot.send_message(chat_id=chat_id, text=caption)
+            logger.info(f"Enviado para grupo {chat_id} com sucesso")
+            return ""
+        except RetryAfter as e:
+            wait = _retry_after_seconds(e)
+            if attempt > config.TELEGRAM_MAX_RETRIES:
+                raise
+            # Flood wait vale pro chat inteiro: os próximos envios pra ele também esperam
+            bucket.pause(wait)
+            logger.warning(f"Flood wait de {wait:.0f}s no grupo {chat_id}, reagendando (tentativa {attempt})")
+        except BadRequest as e:
+            if photo == image_url:
+                raise
+            # file_id em cache recusado: volta pra URL
+            logger.warning(f"file_id recusado no grupo {chat_id} ({e}), reenviando pela URL da imagem")
+            _file_ids.pop(image_url, None)
+            photo = image_url
+            attempt -= 1  # reenvio pela URL não gasta tentativa (sempre acontece)
+    raise RuntimeError(f"envio para {chat_id} sem sucesso após {max_attempts} tentativas")
 
 
-async def _send_all(message: str, image_url: str, affiliate_link: str, chat_ids: list[str] | None = None):
-    if not config.TELEGRAM_BOT_TOKEN:
-        logger.warning("TELEGRAM_BOT_TOKEN não configurado, pulando envio")
-        raise RuntimeError("TELEGRAM_BOT_TOKEN não configurado")
+async def deliver(message: str, image_url: str, affiliate_link: str, chat_ids: list[str]) -> dict[str, str | None]:
+    """Envia o produto para os chats e retorna o resultado de cada um (None = enviado, senão o erro).
 
-    target_ids = chat_ids or config.TELEGRAM_CHAT_IDS
-    if not target_ids:
-        logger.warning("Nenhum chat ID configurado, pulando envio")
-        raise RuntimeError("Nenhum chat ID configurado")
+    A foto é enviada pela URL uma única vez (ou nenhuma, se o file_id da
+    URL estiver em cache); os demais chats recebem o file_id retornado.
+    """
+    bot = await get_bot()
+    logger.info(f"Enviando para {len(chat_ids)} grupos...")
 
-    bot = Bot(token=config.TELEGRAM_BOT_TOKEN)
-    logger.info(f"Enviando para {len(target_ids)} grupos...")
+    outcome: dict[str, str | None] = {}
+    pending = list(chat_ids)
+    photo = _cached_file_id(image_url) if image_url else ""
 
-    errors = []
-    for chat_id in target_ids:
+    # Sem file_id: sobe a foto no primeiro chat que aceitar
+    while image_url and not photo and pending:
+        chat_id = pending.pop(0)
         try:
-            await _send_to_chat(bot, chat_id, message, image_url, affiliate_link)
+            photo = await _send_to_chat(bot, chat_id, message, image_url, affiliate_link)
+            outcome[chat_id] = None
         except Exception as e:
             logger.error(f"ERRO ao enviar para grupo {chat_id}: {e}")
-            errors.append(str(e))
+            outcome[chat_id] = str(e)
+            continue
+        if photo:
+            _remember_file_id(image_url, photo)
+        else:
+            break
 
-    if len(errors) == len(target_ids):
-        raise RuntimeError(f"Falha em todos os grupos Telegram: {'; '.join(errors)}")
+    results = await asyncio.gather(
+        *(_send_to_chat(bot, chat_id, message, image_url, affiliate_link, photo) for chat_id in pending),
+        return_exceptions=True,
+    )
+    for chat_id, result in zip(pending, results):
+        if isinstance(result, Exception):
+            logger.error(f"ERRO ao enviar para grupo {chat_id}: {result}")
+            outcome[chat_id] = str(result)
+        else:
+            outcome[chat_id] = None
+    return outcome
 
 
-def send_message(message: str, image_url: str = "", affiliate_link: str = "", chat_ids: list[str] | None = None):
-    try:
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor() as pool:
-                pool.submit(asyncio.run, _send_all(message, image_url, affiliate_link, chat_ids)).result()
-        else:
-            loop.run_until_complete(_send_all(message, image_url, affiliate_link, chat_ids))
-    except RuntimeError as e:
-        if "no current event loop" in str(e).lower() or "no running event loop" in str(e).lower():
-            asyncio.run(_send_all(message, image_url, affiliate_link, chat_ids))
-        else:
-            raise
+async def close():
+    global _bot
+    if _bot is not None:
+        try:
+            await _bot.shutdown()
+        except Exception as e:
+            logger.debug(f"Erro ao encerrar bot: {e}")
+    _bot = None
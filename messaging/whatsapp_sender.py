@@ -1,60 +1,253 @@
+import asyncio
 import logging
-import requests
+import time
+from dataclasses import dataclass
+import httpx
 import config
 
 logger = logging.getLogger("WHATSAPP")
 
+# Cliente único pro bridge (conexões keep-alive reaproveitadas entre mensagens)
+_client: httpx.AsyncClient | None = None
+# Último status do bridge: (monotonic de quando foi consultado, conectado?)
+_status_cache: tuple[float, bool] | None = None
+
+
+@dataclass(frozen=True)
+class PendingJob:
+    """Resultado de deliver() para grupo cujo envio segue na fila do bridge (job ainda não terminou)."""
+    job_id: str
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=config.WHATSAPP_BRIDGE_URL,
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            limits=httpx.Limits(max_connections=5, max_keepalive_connections=5),
+        )
+    return _client
+
+
+async def _is_bridge_connected() -> bool:
+    """Status do bridge, reaproveitado por WHATSAPP_STATUS_TTL_SECONDS."""
+    global _status_cache
+    now = time.monotonic()
+    if _status_cache and now - _status_cache[0] < config.WHATSAPP_STATUS_TTL_SECONDS:
+        return _status_cache[1]
 
-def _is_bridge_connected() -> bool:
     try:
-        resp = requests.get(f"{config.WHATSAPP_BRIDGE_URL}/status", timeout=5)
-        data = resp.json()
-        connected = data.get("connected", False)
+        resp = await _get_client().get("/status", timeout=5)
+        connected = resp.json().get("connected", False)
         logger.info(f"Bridge status: {'connected' if connected else 'disconnected'}")
-        return connected
     except Exception as e:
         logger.error(f"Não foi possível conectar ao WhatsApp bridge: {e}")
-        return False
+        connected = False
+    _status_cache = (now, connected)
+    return connected
 
 
-def send_message(message: str, image_url: str = "", affiliate_link: str = "", group_ids: list[str] | None = None):
-    target_ids = group_ids or config.WHATSAPP_GROUP_IDS
-    if not target_ids:
-        logger.warning("Nenhum group ID configurado, pulando envio")
-        raise RuntimeError("Nenhum group ID configurado")
+def _invalidate_status():
+    global _status_cache
+    _status_cache = None
 
-    if not _is_bridge_connected():
-        logger.warning("WhatsApp bridge desconectado, pulando envio")
-        raise RuntimeError("WhatsApp bridge desconectado")
 
-    full_message = f"{message}\n\n🔗 {affiliate_link}" if affiliate_link else message
-
-    logger.info(f"Enviando para {len(target_ids)} grupos...")
-
-    errors = []
+async def _send_one_by_one(client: httpx.AsyncClient, target_ids: list[str], payload: dict) -> dict[str, str | None]:
+    """Envio grupo a grupo via /send (bridge antigo, sem /send-batch)."""
+    outcome: dict[str, str | None] = {}
     for group_id in target_ids:
         try:
-            payload = {
-                "chatId": group_id,
-                "message": full_message,
-            }
-            if image_url:
-                payload["imageUrl"] = image_url
-
-            resp = requests.post(
-                f"{config.WHATSAPP_BRIDGE_URL}/send",
-                json=payload,
-                timeout=30,
-            )
+            resp = await client.post("/send", json={**payload, "chatId": group_id})
             if resp.status_code == 200:
                 logger.info(f"Enviado com sucesso para {group_id}")
+                outcome[group_id] = None
             else:
+                if resp.status_code == 503:
+                    _invalidate_status()  # bridge caiu desde a última consulta
                 error_msg = f"HTTP {resp.status_code} - {resp.text}"
                 logger.error(f"ERRO ao enviar para {group_id}: {error_msg}")
-                errors.append(error_msg)
+                outcome[group_id] = error_msg
+        except httpx.TransportError as e:
+            _invalidate_status()
+            logger.error(f"ERRO ao enviar para {group_id}: {e}")
+            outcome[group_id] = str(e)
         except Exception as e:
             logger.error(f"ERRO ao enviar para {group_id}: {e}")
-            errors.append(str(e))
+            outcome[group_id] = str(e)
+    return outcome
+
+
+async def _send_batch(client: httpx.AsyncClient, target_ids: list[str], payload: dict) -> dict[str, str | None]:
+    """Envio síncrono via /send-batch (bridge sem fila de jobs). Retorna o resultado por grupo."""
+    # Uma chamada só: o bridge baixa a imagem uma vez e envia pra todos os grupos
+    try:
+        resp = await client.post(
+            "/send-batch",
+            json={**payload, "chatIds": target_ids},
+            timeout=httpx.Timeout(30.0 * len(target_ids), connect=5.0),  # envios em sequência no bridge
+        )
+    except httpx.TransportError as e:
+        _invalidate_status()
+        return {g: str(e) for g in target_ids}
+
+    if resp.status_code == 404:
+        logger.debug("Bridge sem /send-batch, enviando grupo a grupo")
+        return await _send_one_by_one(client, target_ids, payload)
+    if resp.status_code == 503:
+        _invalidate_status()
+
+    try:
+        results = resp.json().get("results") or []
+    except ValueError:
+        results = []
+    if not results:
+        return {g: f"HTTP {resp.status_code} - {resp.text}" for g in target_ids}
+
+    outcome: dict[str, str | None] = {}
+    for result in results:
+        if result.get("success"):
+            logger.info(f"Enviado com sucesso para {result.get('chatId')}")
+            outcome[result.get("chatId")] = None
+        else:
+            logger.error(f"ERRO ao enviar para {result.get('chatId')}: {result.get('error')}")
+            outcome[result.get("chatId")] = str(result.get("error"))
+    return outcome
+
+
+async def get_job(job_id: str) -> dict | None:
+    """Estado de um job no bridge (status + resultado por grupo), ou None se não existe mais."""
+    resp = await _get_client().get(f"/jobs/{job_id}", timeout=5)
+    if resp.status_code == 404:
+        return None
+    resp.raise_for_status()
+    return resp.json()
+
+
+async def wait_for_job(job_id: str, timeout: float | None = None) -> dict | None:
+    """Consulta o job até terminar (done/failed) ou o prazo acabar.
+
+    Retorna o último estado visto (no prazo estourado ainda queued/running),
+    ou None se o job não existe mais no bridge.
+    """
+    timeout = timeout or config.WHATSAPP_JOB_TIMEOUT_SECONDS
+    deadline = time.monotonic() + timeout
+    job = {"jobId": job_id, "status": "unknown", "results": []}
+    while True:
+        try:
+            job = await get_job(job_id)
+        except httpx.HTTPError as e:
+            logger.debug(f"Erro ao consultar job {job_id}: {e}")
+            job = {"jobId": job_id, "status": "unknown", "results": []}
+        if job is None or job.get("status") in ("done", "failed"):
+            return job
+        if time.monotonic() >= deadline:
+            return job
+        await asyncio.sleep(config.WHATSAPP_JOB_POLL_SECONDS)
+
+
+def _build_payload(message: str, image_url: str, affiliate_link: str) -> dict:
+    full_message = f"{message}\n\n🔗 {affiliate_link}" if affiliate_link else message
+    payload = {"message": full_message}
+    if image_url:
+        payload["imageUrl"] = image_url
+    return payload
+
+
+async def _submit_job(client: httpx.AsyncClient, target_ids: list[str], payload: dict) -> str | None:
+    """Enfileira no bridge (POST /jobs). Retorna o jobId, ou None se o bridge não tem fila."""
+    try:
+        resp = await client.post("/jobs", json={**payload, "chatIds": target_ids}, timeout=10)
+    except httpx.TransportError as e:
+        _invalidate_status()
+        raise RuntimeError(f"Falha ao enfileirar no WhatsApp bridge: {e}") from e
+
+    if resp.status_code == 202:
+        job_id = resp.json()["jobId"]
+        logger.info(f"Envio para {len(target_ids)} grupos enfileirado no bridge (job {job_id})")
+        return job_id
+    if resp.status_code == 404:
+        return None
+    if resp.status_code == 503:
+        _invalidate_status()
+    raise RuntimeError(f"Falha ao enfileirar no WhatsApp bridge: HTTP {resp.status_code} - {resp.text}")
+
+
+def _job_outcome(job: dict, group_ids: list[str]) -> dict[str, "str | PendingJob | None"]:
+    """Resultado por grupo de um job: None = enviado, PendingJob = ainda na fila, str = falhou."""
+    statuses = {r.get("chatId"): r for r in job.get("results", [])}
+    outcome: dict[str, str | PendingJob | None] = {}
+    for group_id in group_ids:
+        result = statuses.get(group_id) or {}
+        status = result.get("status")
+        if status == "sent":
+            outcome[group_id] = None
+        elif status == "failed":
+            outcome[group_id] = result.get("error") or "falha no bridge"
+        elif job.get("status") in ("done", "failed"):
+            # Job terminou sem registro do grupo: não vai mais ser enviado
+            outcome[group_id] = f"job {job['jobId']} terminou sem resultado para o grupo"
+        else:
+            outcome[group_id] = PendingJob(job["jobId"])
+    return outcome
+
+
+async def deliver(
+    message: str, image_url: str, affiliate_link: str, group_ids: list[str], job_ids: dict[str, str] | None = None
+) -> dict[str, "str | PendingJob | None"]:
+    """Envia e espera o resultado de cada grupo (None = enviado, PendingJob = ainda na fila, str = erro).
+
+    `job_ids` traz o job de uma tentativa anterior por grupo: esse job é
+    acompanhado de novo em vez de reenviar. Só vai num job novo o grupo
+    cujo job falhou para ele ou não existe mais no bridge.
+    """
+    outcome: dict[str, str | PendingJob | None] = {}
+    to_send = [g for g in group_ids if not (job_ids or {}).get(g)]
+
+    by_job: dict[str, list[str]] = {}
+    for group_id, job_id in (job_ids or {}).items():
+        if group_id in group_ids and job_id:
+            by_job.setdefault(job_id, []).append(group_id)
+    for job_id, job_groups in by_job.items():
+        job = await wait_for_job(job_id)
+        if job is None:
+            logger.warning(f"Job {job_id} não existe mais no bridge, reenviando para {len(job_groups)} grupos")
+            to_send += job_groups
+            continue
+        for group_id, result in _job_outcome(job, job_groups).items():
+            if isinstance(result, str):
+                logger.warning(f"Job {job_id} falhou para {group_id} ({result}), reenviando")
+                to_send.append(group_id)
+            else:
+                outcome[group_id] = result
+
+    if to_send:
+        outcome.update(await _send_new(message, image_url, affiliate_link, to_send))
+    return outcome
+
+
+async def _send_new(message: str, image_url: str, affiliate_link: str, group_ids: list[str]) -> dict[str, "str | PendingJob | None"]:
+    if not await _is_bridge_connected():
+        return {g: "WhatsApp bridge desconectado" for g in group_ids}
+
+    client = _get_client()
+    payload = _build_payload(message, image_url, affiliate_link)
+    try:
+        job_id = await _submit_job(client, group_ids, payload)
+    except RuntimeError as e:
+        return {g: str(e) for g in group_ids}
+    if job_id is None:
+        logger.info(f"Enviando para {len(group_ids)} grupos...")
+        return await _send_batch(client, group_ids, payload)
+
+    job = await wait_for_job(job_id)
+    if job is None:
+        return {g: f"job {job_id} sumiu do bridge antes de terminar" for g in group_ids}
+    return _job_outcome(job, group_ids)
+
 
-    if len(errors) == len(target_ids):
-        raise RuntimeError(f"Falha em todos os grupos WhatsApp: {'; '.join(errors)}")
+async def close():
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
@@ -10,3 +10,4 @@ class PelandoDeal:
     store_name: str
     deal_url: str
     store_link_url: str = ""
+    is_coupon: bool = False  # botão da loja é de cupom (deal ignorado)
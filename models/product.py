@@ -18,4 +18,5 @@ class Product:
     temperature: str = ""
     source: str = ""
     store: str = ""
+    deal_url: str = ""  # Deal do Pelando de origem (marcado como processado ao enfileirar)
     created_at: str = field(default_factory=lambda: datetime.now().isoformat())
@@ -0,0 +1,310 @@
+"""Pipeline de deals em estágios: extract -> generate -> deliver.
+
+A listagem (polling ou feed) só coloca deals na fila do primeiro estágio e
+volta; cada estágio tem seus workers (limite de concorrência próprio) e
+uma fila limitada na entrada. Fila cheia = backpressure: quem está antes
+espera no put, então o browser não corre na frente de um Groq lento (nem
+o contrário). Assim a extração de um deal, a geração do anterior e o
+enfileiramento no outbox de outro rodam ao mesmo tempo.
+
+- extract: resolve o link da loja e extrai o produto (HTTP ou aba do
+  pool), respeitando também o limite por loja (handler.concurrency);
+- generate: gera as mensagens com IA em lotes (falha = deal volta no
+  próximo ciclo);
+- deliver: valida o link de afiliado, grava no outbox e marca o deal.
+
+Um deal fica "em voo" do submit até sair do último estágio (ou ser
+descartado), e não é aceito de novo nesse intervalo.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+import config
+from ai.message_generator import extract_title, generate_messages
+from database import db
+from messaging import delivery
+from models.pelando_deal import PelandoDeal
+from models.product import Product
+from scraper.browser_pool import BrowserPool
+from scraper.pelando_scraper import process_deal
+from scraper.stores import STORE_HANDLERS
+
+logger = logging.getLogger("PIPELINE")
+
+
+@dataclass
+class DealJob:
+    deal: PelandoDeal
+    handler: object
+    product: Product | None = None
+    message: str = ""
+    submitted_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class StageStats:
+    received: int = 0
+    passed: int = 0  # seguiu para o próximo estágio (ou terminou o pipeline)
+    dropped: int = 0  # estágio decidiu descartar (sem produto, link inválido...)
+    errors: int = 0
+    busy_seconds: float = 0.0
+    wait_seconds: float = 0.0  # tempo parado na fila de entrada
+    max_queue: int = 0
+
+
+class Stage:
+    def __init__(self, name: str, handler, concurrency: int, queue_size: int):
+        self.name = name
+        self.handler = handler  # async (job) -> bool: True segue, False descarta
+        self.concurrency = max(1, concurrency)
+        self.queue: asyncio.Queue[tuple[float, DealJob]] = asyncio.Queue(maxsize=queue_size)
+        self.stats = StageStats()
+        self.next: "Stage | None" = None
+        self.on_exit = None  # chamado quando o job sai do pipeline (descartado ou concluído)
+        self._workers: list[asyncio.Task] = []
+
+    async def put(self, job: DealJob):
+        await self.queue.put((time.monotonic(), job))
+        self.stats.max_queue = max(self.stats.max_queue, self.queue.qsize())
+
+    def start(self):
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"{self.name}-{i}") for i in range(self.concurrency)
+        ]
+
+    async def _worker(self):
+        while True:
+            queued_at, job = await self.queue.get()
+            started = time.monotonic()
+            self.stats.received += 1
+            self.stats.wait_seconds += started - queued_at
+            keep = False
+            try:
+                keep = await self.handler(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats.errors += 1
+                logger.error(f"[{self.name}] ERRO em {job.deal.title[:40]}: {e}")
+            finally:
+                self.stats.busy_seconds += time.monotonic() - started
+                self.queue.task_done()
+
+            if not keep:
+                self.stats.dropped += 1
+                self.on_exit(job)
+            elif self.next:
+                self.stats.passed += 1
+                await self.next.put(job)  # bloqueia se o próximo estágio estiver cheio
+            else:
+                self.stats.passed += 1
+                self.on_exit(job, done=True)
+
+    def snapshot(self) -> dict:
+        s = self.stats
+        return {
+            "queue": self.queue.qsize(),
+            "max_queue": s.max_queue,
+            "in": s.received,
+            "out": s.passed,
+            "dropped": s.dropped,
+            "errors": s.errors,
+            "avg_s": round(s.busy_seconds / s.received, 2) if s.received else 0,
+            "avg_wait_s": round(s.wait_seconds / s.received, 2) if s.received else 0,
+        }
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+class BatchStage(Stage):
+    """Estágio que entrega ao handler lotes de até `batch_size` jobs.
+
+    O worker pega o primeiro job da fila e espera até `linger` segundos
+    pelos próximos (ou até o lote encher). O handler recebe a lista e
+    retorna um bool por job.
+    """
+
+    def __init__(self, name: str, handler, concurrency: int, queue_size: int, batch_size: int, linger: float):
+        super().__init__(name, handler, concurrency, queue_size)
+        self.batch_size = max(1, batch_size)
+        self.linger = linger
+
+    async def _collect(self) -> list[tuple[float, DealJob]]:
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _worker(self):
+        while True:
+            batch = await self._collect()
+            started = time.monotonic()
+            jobs = [job for _, job in batch]
+            self.stats.received += len(jobs)
+            self.stats.wait_seconds += sum(started - queued_at for queued_at, _ in batch)
+            keeps = [False] * len(jobs)
+            try:
+                keeps = await self.handler(jobs)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats.errors += len(jobs)
+                logger.error(f"[{self.name}] ERRO no lote de {len(jobs)} deals: {e}")
+            finally:
+                # Tempo por job (o lote inteiro conta uma vez para cada job)
+                self.stats.busy_seconds += (time.monotonic() - started) * len(jobs)
+                for _ in jobs:
+                    self.queue.task_done()
+
+            for job, keep in zip(jobs, keeps):
+                if not keep:
+                    self.stats.dropped += 1
+                    self.on_exit(job)
+                elif self.next:
+                    self.stats.passed += 1
+                    await self.next.put(job)
+                else:
+                    self.stats.passed += 1
+                    self.on_exit(job, done=True)
+
+
+def _valid_affiliate_link(product: Product) -> bool:
+    if not product.affiliate_link:
+        logger.warning(f"Link de afiliado vazio para {product.mlb_id} ({product.title[:50]}) - pulando produto")
+        return False
+    if product.store == "amazon" and "amzn.to" not in product.affiliate_link and "amazon.com.br" not in product.affiliate_link:
+        logger.warning(f"Link Amazon inválido para {product.mlb_id}: {product.affiliate_link[:80]} - pulando produto")
+        return False
+    if product.store == "mercado_livre" and "/sec/" not in product.affiliate_link and "meli.la" not in product.affiliate_link:
+        logger.warning(f"Link ML inválido para {product.mlb_id}: {product.affiliate_link[:80]} - pulando produto")
+        return False
+    return True
+
+
+class DealPipeline:
+    def __init__(self, pool: BrowserPool):
+        self.pool = pool
+        self._in_flight: set[str] = set()
+        self._store_semaphores: dict[str, asyncio.Semaphore] = {}
+        self._completed = 0
+        self._total_latency = 0.0
+        # Chamado com cada deal descartado (no modo feed, agenda a nova tentativa)
+        self.on_drop: Callable[[PelandoDeal], None] | None = None
+
+        extract_workers = config.PIPELINE_EXTRACT_CONCURRENCY or sum(h.concurrency for h in STORE_HANDLERS.values())
+        self.stages = [
+            Stage("extract", self._extract, extract_workers, config.PIPELINE_QUEUE_SIZE),
+            BatchStage(
+                "generate", self._generate, config.PIPELINE_GENERATE_CONCURRENCY, config.PIPELINE_QUEUE_SIZE,
+                batch_size=config.GROQ_BATCH_SIZE, linger=config.GROQ_BATCH_LINGER_SECONDS,
+            ),
+            # Só grava no sqlite: um worker basta e mantém a ordem de enfileiramento
+            Stage("deliver", self._deliver, 1, config.PIPELINE_QUEUE_SIZE),
+        ]
+        for stage, nxt in zip(self.stages, self.stages[1:]):
+            stage.next = nxt
+        for stage in self.stages:
+            stage.on_exit = self._exit
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+        logger.info(
+            "Pipeline iniciado: " + ", ".join(f"{s.name}={s.concurrency} workers" for s in self.stages)
+        )
+
+    async def stop(self):
+        for stage in self.stages:
+            await stage.stop()
+
+    async def submit(self, deals: list[tuple[PelandoDeal, object]]) -> int:
+        """Coloca deals (já com handler, ver select_deals) no pipeline. Retorna quantos entraram."""
+        accepted = 0
+        for deal, handler in deals:
+            if deal.deal_url in self._in_flight:
+                logger.debug(f"Deal já em andamento no pipeline: {deal.title[:40]}")
+                continue
+            self._in_flight.add(deal.deal_url)
+            await self.stages[0].put(DealJob(deal, handler))
+            accepted += 1
+        return accepted
+
+    def _exit(self, job: DealJob, done: bool = False):
+        self._in_flight.discard(job.deal.deal_url)
+        if done:
+            self._completed += 1
+            self._total_latency += time.monotonic() - job.submitted_at
+        elif self.on_drop:
+            self.on_drop(job.deal)
+
+    def _store_semaphore(self, handler) -> asyncio.Semaphore:
+        if handler.name not in self._store_semaphores:
+            self._store_semaphores[handler.name] = asyncio.Semaphore(handler.concurrency)
+        return self._store_semaphores[handler.name]
+
+    async def _extract(self, job: DealJob) -> bool:
+        tab = self.pool.primary.main_tab
+        product = await process_deal(tab, job.handler, job.deal, self._store_semaphore(job.handler), self.pool)
+        if not product:
+            logger.warning(f"Falha ao processar deal: {job.deal.title[:40]}")
+            return False
+        product.deal_url = job.deal.deal_url
+        job.product = product
+        logger.info(f"Produto processado: {product.mlb_id}")
+        return True
+
+    async def _generate(self, jobs: list[DealJob]) -> list[bool]:
+        # Um lote = uma chamada à IA (com GROQ_BATCH_SIZE=1, uma por produto)
+        used_titles = db.get_used_titles()
+        messages = await generate_messages([job.product for job in jobs], used_titles=used_titles)
+
+        keeps = []
+        for job, message in zip(jobs, messages):
+            product = job.product
+            if isinstance(message, Exception):
+                logger.error(
+                    f"ERRO ao gerar mensagem para {product.mlb_id} ({product.title[:50]}): {message} - produto será reprocessado no próximo ciclo"
+                )
+                keeps.append(False)
+                continue
+            title = extract_title(message)
+            if title:
+                db.save_used_title(title)
+            if product.coupon:
+                message = f"{message}\n\n`Cupom de {product.coupon}`"
+            job.message = message
+            keeps.append(True)
+        return keeps
+
+    async def _deliver(self, job: DealJob) -> bool:
+        product = job.product
+        # Link inválido não melhora reprocessando: marca o deal mesmo assim
+        if not _valid_affiliate_link(product):
+            db.mark_deal_processed(product.deal_url)
+            return False
+        # Envio (e retentativas por destinatário) fica com o worker do outbox
+        outbox_id = delivery.enqueue(product, job.message)
+        db.mark_deal_processed(product.deal_url)
+        return outbox_id is not None
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._in_flight),
+            "completed": self._completed,
+            "avg_deal_to_outbox_s": round(self._total_latency / self._completed, 1) if self._completed else 0,
+            **{s.name: s.snapshot() for s in self.stages},
+        }
@@ -6,6 +6,7 @@ import subprocess
 import nodriver as uc
 from pyvirtualdisplay import Display
 import config
+from scraper.request_filter import enable_request_filter
 
 logger = logging.getLogger("BROWSER")
 
@@ -38,11 +39,11 @@ def _resolve_chrome_binary() -> str | None:
     return None
 
 
-def _kill_zombie_chromes():
+def _kill_zombie_chromes(profile_dir: str = CHROME_PROFILE_DIR):
     """Mata processos Chrome órfãos que podem estar travando o user_data_dir."""
     try:
         result = subprocess.run(
-            ["pgrep", "-f", f"--user-data-dir={CHROME_PROFILE_DIR}"],
+            ["pgrep", "-f", f"--user-data-dir={profile_dir}( |$)"],
             capture_output=True, text=True
         )
         pids = result.stdout.strip().split("\n")
@@ -57,12 +58,12 @@ def _kill_zombie_chromes():
         logger.debug(f"Erro ao verificar chromes órfãos: {e}")
 
 
-def _clean_lock_files():
+def _clean_lock_files(profile_dir: str = CHROME_PROFILE_DIR):
     """Remove lock files do perfil Chrome que impedem nova instância."""
     lock_patterns = [
-        os.path.join(CHROME_PROFILE_DIR, "SingletonLock"),
-        os.path.join(CHROME_PROFILE_DIR, "SingletonSocket"),
-        os.path.join(CHROME_PROFILE_DIR, "SingletonCookie"),
+        os.path.join(profile_dir, "SingletonLock"),
+        os.path.join(profile_dir, "SingletonSocket"),
+        os.path.join(profile_dir, "SingletonCookie"),
     ]
     for pattern in lock_patterns:
         for lock_file in glob.glob(pattern):
@@ -73,6 +74,39 @@ def _clean_lock_files():
                 pass
 
 
+def get_process_tree_rss_mb(pid: int) -> float:
+    """Soma o RSS (MB) do processo e de todos os descendentes via /proc.
+
+    O Chrome espalha a memória entre browser, GPU, zygote e renderers —
+    medir só o PID principal esconde quase todo o crescimento.
+    """
+    children: dict[int, list[int]] = {}
+    for stat_path in glob.glob("/proc/[0-9]*/stat"):
+        try:
+            with open(stat_path) as fh:
+                stat = fh.read()
+            # Campo 2 (comm) pode ter espaços/parênteses: o resto começa após o último ")"
+            fields = stat[stat.rindex(")") + 2:].split()
+            children.setdefault(int(fields[1]), []).append(int(stat.split(" ", 1)[0]))
+        except (OSError, ValueError, IndexError):
+            continue
+
+    total_kb = 0
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            with open(f"/proc/{current}/status") as fh:
+                for line in fh:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        break
+        except (OSError, ValueError):
+            continue
+        stack.extend(children.get(current, []))
+    return total_kb / 1024
+
+
 def start_virtual_display():
     """Inicia Xvfb quando HEADLESS=true (nodriver precisa de display real)."""
     global _display
@@ -91,29 +125,37 @@ def stop_virtual_display():
         logger.info("PyVirtualDisplay parado")
 
 
-async def get_browser() -> uc.Browser:
+async def get_browser(profile_dir: str = CHROME_PROFILE_DIR) -> uc.Browser:
     """Cria e retorna o browser nodriver com perfil persistente."""
     start_virtual_display()
-    logger.info("Iniciando nodriver browser...")
+    logger.info(f"Iniciando nodriver browser (perfil {os.path.basename(profile_dir)})...")
 
-    os.makedirs(CHROME_PROFILE_DIR, exist_ok=True)
+    os.makedirs(profile_dir, exist_ok=True)
 
     # Limpar processos e locks de instâncias anteriores crashadas
-    _kill_zombie_chromes()
-    _clean_lock_files()
+    _kill_zombie_chromes(profile_dir)
+    _clean_lock_files(profile_dir)
 
     browser_args = [
         "--disable-dev-shm-usage",
         "--window-size=1920,1080",
+        # Deals rodam em paralelo em abas de fundo: sem isso o Chrome
+        # estrangula timers/renderização das abas que não estão em foco
+        "--disable-background-timer-throttling",
+        "--disable-backgrounding-occluded-windows",
+        "--disable-renderer-backgrounding",
     ]
 
     browser = await uc.start(
         headless=False,
         sandbox=False,
-        user_data_dir=CHROME_PROFILE_DIR,
+        user_data_dir=profile_dir,
         browser_args=browser_args,
         browser_executable_path=_resolve_chrome_binary(),
     )
 
+    # Aba principal faz a listagem do Pelando: não precisa baixar imagens/trackers
+    await enable_request_filter(browser.main_tab)
+
     logger.info("nodriver browser criado com sucesso")
     return browser
@@ -0,0 +1,270 @@
+"""Pool de K instâncias do Chrome, cada uma com seu próprio perfil.
+
+A instância 0 usa o perfil principal (CHROME_PROFILE_DIR): é nela que
+rodam listagem, feed e login. As demais usam cópias desse perfil
+(chrome_profile_1, chrome_profile_2, ...) — as sessões logadas vão junto
+nos cookies. Deals são despachados para a instância menos ocupada e cada
+instância tem saúde própria: se morrer, só ela é recriada.
+
+Watchdog: antes de cada lease a instância é comparada com os limites de
+memória (RSS da árvore de processos), abas abertas e páginas servidas
+(BROWSER_MAX_*). Passou de algum, ela entra em "draining": não recebe
+deals novos e é reciclada assim que os deals em andamento terminam.
+A instância 0 é exceção: listagem e feed rodam nela fora dos leases, então
+ela só é reciclada em ensure_healthy (entre ciclos) e, em draining, segue
+atendendo deals até lá.
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import shutil
+import time
+from dataclasses import dataclass, field
+
+import nodriver
+
+import config
+from scraper.browser import CHROME_PROFILE_DIR, get_browser, get_process_tree_rss_mb
+
+logger = logging.getLogger("BROWSER_POOL")
+
+# Caches não precisam ser clonados (e são a maior parte do perfil)
+_CLONE_IGNORE = shutil.ignore_patterns(
+    "Singleton*", "Cache", "Code Cache", "GPUCache", "DawnCache",
+    "GrShaderCache", "ShaderCache", "CacheStorage", "ScriptCache", "*.tmp",
+)
+
+# Ler /proc inteiro a cada lease é desnecessário: RSS é reamostrado nesse intervalo
+RSS_SAMPLE_SECONDS = 10
+
+
+@dataclass
+class BrowserInstance:
+    index: int
+    profile_dir: str
+    browser: nodriver.Browser | None = None
+    active_deals: int = 0
+    deals_served: int = 0
+    errors: int = 0
+    restarts: int = 0
+    started_at: float = 0.0
+    last_error: str = ""
+    pages_served: int = 0  # deals atendidos desde o último start
+    rss_mb: float = 0.0
+    rss_sampled_at: float = 0.0
+    draining: bool = False
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    @property
+    def name(self) -> str:
+        return f"chrome#{self.index}"
+
+    async def is_alive(self) -> bool:
+        if self.browser is None or self.browser.stopped:
+            return False
+        try:
+            await asyncio.wait_for(self.browser.update_targets(), timeout=10)
+            return True
+        except Exception:
+            return False
+
+    def sample_rss(self) -> float:
+        now = time.monotonic()
+        pid = getattr(self.browser, "_process_pid", None)
+        if pid and now - self.rss_sampled_at >= RSS_SAMPLE_SECONDS:
+            self.rss_mb = get_process_tree_rss_mb(pid)
+            self.rss_sampled_at = now
+        return self.rss_mb
+
+    def recycle_reason(self) -> str | None:
+        """Motivo para reciclar a instância (limite ultrapassado), ou None."""
+        if self.browser is None:
+            return None
+        if config.BROWSER_MAX_PAGES and self.pages_served >= config.BROWSER_MAX_PAGES:
+            return f"{self.pages_served} páginas servidas (limite {config.BROWSER_MAX_PAGES})"
+        tabs = len(self.browser.tabs)
+        if config.BROWSER_MAX_TABS and tabs >= config.BROWSER_MAX_TABS:
+            return f"{tabs} abas abertas (limite {config.BROWSER_MAX_TABS})"
+        rss = self.sample_rss()
+        if config.BROWSER_MAX_RSS_MB and rss >= config.BROWSER_MAX_RSS_MB:
+            return f"RSS {rss:.0f}MB (limite {config.BROWSER_MAX_RSS_MB}MB)"
+        return None
+
+
+def _clone_profile(src: str, dst: str):
+    """Copia o perfil principal (sem caches/locks) para uma instância secundária."""
+    if os.path.exists(dst):
+        shutil.rmtree(dst, ignore_errors=True)
+    shutil.copytree(src, dst, ignore=_CLONE_IGNORE, symlinks=True)
+    logger.info(f"Perfil clonado: {os.path.basename(dst)}")
+
+
+class BrowserPool:
+    def __init__(self, size: int = config.BROWSER_POOL_SIZE):
+        self.instances = [
+            BrowserInstance(i, CHROME_PROFILE_DIR if i == 0 else f"{CHROME_PROFILE_DIR}_{i}")
+            for i in range(max(1, size))
+        ]
+
+    @property
+    def primary(self) -> nodriver.Browser:
+        """Browser da instância 0 (perfil principal: listagem, feed, login)."""
+        return self.instances[0].browser
+
+    async def start(self):
+        os.makedirs(CHROME_PROFILE_DIR, exist_ok=True)
+        # Clonar antes de subir o principal: com o Chrome rodando o banco de cookies pode estar no meio de uma escrita
+        for instance in self.instances[1:]:
+            _clone_profile(CHROME_PROFILE_DIR, instance.profile_dir)
+        for instance in self.instances:
+            await self._start_instance(instance)
+        logger.info(f"Pool iniciado com {len(self.instances)} instância(s) do Chrome")
+
+    async def _start_instance(self, instance: BrowserInstance):
+        instance.browser = await get_browser(instance.profile_dir)
+        instance.started_at = time.monotonic()
+        # Leases já reservados nesta instância vão ser servidos pelo browser novo
+        instance.pages_served = instance.active_deals
+        instance.rss_mb = 0.0
+        instance.rss_sampled_at = 0.0
+        instance.draining = False
+
+    async def _relaunch(self, instance: BrowserInstance, reclone: bool = False):
+        with contextlib.suppress(Exception):
+            instance.browser.stop()
+        instance.browser = None
+        if reclone and instance.index > 0:
+            await asyncio.to_thread(_clone_profile, CHROME_PROFILE_DIR, instance.profile_dir)
+        await self._start_instance(instance)
+        instance.restarts += 1
+        logger.info(f"{instance.name}: browser recriado ({instance.restarts} restarts)")
+
+    async def restart(self, instance: BrowserInstance, reclone: bool = False):
+        """Recria uma instância (opcionalmente re-clonando o perfil principal)."""
+        async with instance.lock:
+            logger.warning(f"{instance.name}: recriando browser...")
+            await self._relaunch(instance, reclone)
+
+    async def _recycle(self, instance: BrowserInstance, reserved: int = 0):
+        """Recicla uma instância em draining que já não tem deals em andamento.
+
+        `reserved`: deals do próprio chamador já contados em active_deals.
+        """
+        async with instance.lock:
+            if not instance.draining or instance.active_deals > reserved:
+                return  # outro lease já reciclou (ou chegou deal novo)
+            logger.info(f"{instance.name}: reciclando browser (watchdog)")
+            await self._relaunch(instance)
+
+    def _check_limits(self, instance: BrowserInstance):
+        if instance.draining:
+            return
+        reason = instance.recycle_reason()
+        if reason:
+            instance.draining = True
+            logger.warning(
+                f"{instance.name}: {reason} — sem deals novos, reciclando após "
+                f"{instance.active_deals} deal(s) em andamento"
+            )
+
+    async def reclone_secondaries(self):
+        """Propaga logins feitos no perfil principal para as instâncias secundárias."""
+        for instance in self.instances[1:]:
+            await self.restart(instance, reclone=True)
+
+    async def ensure_healthy(self) -> list[int]:
+        """Recria instâncias mortas e recicla as que passaram dos limites. Retorna os índices recriados.
+
+        Chamar entre ciclos (sem listagem/feed usando a instância 0).
+        """
+        restarted = []
+        for instance in self.instances:
+            if instance.lock.locked():
+                continue
+            if not await instance.is_alive():
+                await self.restart(instance)
+                restarted.append(instance.index)
+                continue
+            self._check_limits(instance)
+            if instance.draining and not instance.active_deals:
+                await self._recycle(instance)
+                restarted.append(instance.index)
+        return restarted
+
+    async def _acquire(self) -> BrowserInstance:
+        """Escolhe e reserva a instância (active_deals/pages_served já incrementados)."""
+        while True:
+            instance = min(
+                self.instances,
+                key=lambda i: (i.draining, i.lock.locked(), i.active_deals, i.index),
+            )
+            # Reserva antes de qualquer await: workers que chegam juntos veem a
+            # carga atualizada e se espalham pelas instâncias
+            instance.active_deals += 1
+            instance.pages_served += 1
+            try:
+                ready = await self._prepare(instance)
+            except BaseException:
+                instance.active_deals -= 1
+                raise
+            if ready:
+                return instance
+            instance.active_deals -= 1
+            # Todas em draining: espera algum deal terminar
+            await asyncio.sleep(0.5)
+
+    async def _prepare(self, instance: BrowserInstance) -> bool:
+        """Deixa a instância reservada pronta para o deal. False = em draining com deals de outros."""
+        async with instance.lock:
+            pass  # aguarda restart em andamento
+        if not await instance.is_alive():
+            await self.restart(instance)
+            return True
+
+        self._check_limits(instance)
+        if not instance.draining:
+            return True
+        if instance.index == 0:
+            # Reciclar aqui mataria listagem/feed em andamento: fica pro ensure_healthy
+            return True
+        if instance.active_deals == 1:  # só a reserva deste lease
+            await self._recycle(instance, reserved=1)
+            return True
+        return False
+
+    @contextlib.asynccontextmanager
+    async def lease(self):
+        """Empresta a instância saudável menos ocupada para processar um deal."""
+        instance = await self._acquire()
+        try:
+            yield instance
+            instance.deals_served += 1
+        except Exception as e:
+            instance.errors += 1
+            instance.last_error = str(e)
+            raise
+        finally:
+            instance.active_deals -= 1
+
+    def stats(self) -> list[dict]:
+        return [
+            {
+                "instance": i.name,
+                "active": i.active_deals,
+                "served": i.deals_served,
+                "errors": i.errors,
+                "restarts": i.restarts,
+                "rss_mb": round(i.rss_mb),
+                "draining": i.draining,
+                "uptime_s": int(time.monotonic() - i.started_at) if i.started_at else 0,
+            }
+            for i in self.instances
+        ]
+
+    def stop_all(self):
+        for instance in self.instances:
+            if instance.browser:
+                with contextlib.suppress(Exception):
+                    instance.browser.stop()
+                instance.browser = None
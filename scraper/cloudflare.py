@@ -0,0 +1,212 @@
+"""Clearance do Cloudflare no Pelando.
+
+Lembra quando o `cf_clearance` foi obtido e até quando vale: enquanto o
+cookie é válido a rotina de challenge nem roda, só esperamos os cards.
+Cards e botão do challenge são detectados por MutationObserver
+(readiness.wait_for_condition), sem sleeps fixos. Cada resolução grava
+tempo e resultado em `cf_challenges` pra acompanhar taxa de sucesso e
+quanto o clearance dura.
+"""
+import json
+import logging
+import time
+
+import nodriver
+from nodriver import cdp
+
+import config
+from database import db
+from scraper import readiness
+
+logger = logging.getLogger("CLOUDFLARE")
+
+# Margem pra não confiar num clearance que vai expirar no meio do ciclo
+CLEARANCE_MARGIN_SECONDS = 60
+
+# Retorna JSON quando há cards (challenge resolvido) ou botão do challenge
+# visível; "" enquanto nenhum dos dois existe (mantém o observer esperando).
+_DETECT_JS = """
+(() => {
+    const cards = document.querySelectorAll("div[data-show-author]");
+    if (cards.length > 0) return JSON.stringify({ cards: cards.length });
+
+    // Procura botão/link do CF por texto (case-insensitive) em
+    // qualquer elemento clicável visível.
+    const candidates = Array.from(document.querySelectorAll(
+        "button, a, input[type='button'], input[type='submit'], [role='button']"
+    ));
+    const needle = "verify you are human";
+    for (const el of candidates) {
+        const text = (el.textContent || el.value || "").trim().toLowerCase();
+        if (!text.includes(needle)) continue;
+        const r = el.getBoundingClientRect();
+        if (r.width <= 0 || r.height <= 0) continue;
+        return JSON.stringify({
+            btn: true,
+            tag: el.tagName,
+            x: r.left, y: r.top, w: r.width, h: r.height,
+        });
+    }
+    return "";
+})()
+"""
+
+# Interstitial do CF sem botão (ainda verificando sozinho): título/scripts do challenge
+_INTERSTITIAL_JS = """
+(() => /just a moment|um momento/i.test(document.title)
+    || !!document.querySelector("#challenge-form, #challenge-running, script[src*='/cdn-cgi/challenge-platform/']"))()
+"""
+
+
+async def get_clearance_expiry(tab: nodriver.Tab) -> float | None:
+    """Retorna o expires (epoch) do cookie cf_clearance do Pelando, ou None se não existe."""
+    try:
+        cookies = await tab.send(cdp.network.get_cookies(urls=[config.PELANDO_URL]))
+    except Exception as e:
+        logger.debug(f"Falha ao ler cookies: {e}")
+        return None
+    for c in cookies:
+        if c.name == "cf_clearance":
+            # expires == -1 é cookie de sessão: vale enquanto o browser viver
+            return c.expires if c.expires and c.expires > 0 else float("inf")
+    return None
+
+
+async def has_valid_clearance(tab: nodriver.Tab) -> bool:
+    expiry = await get_clearance_expiry(tab)
+    return expiry is not None and expiry > time.time() + CLEARANCE_MARGIN_SECONDS
+
+
+async def _detect(tab: nodriver.Tab, timeout: float) -> dict:
+    raw = await readiness.wait_for_condition(tab, _DETECT_JS, timeout=timeout)
+    try:
+        return json.loads(raw) if raw else {}
+    except ValueError:
+        return {}
+
+
+async def _on_interstitial(tab: nodriver.Tab) -> bool:
+    try:
+        return bool(await tab.evaluate(_INTERSTITIAL_JS))
+    except Exception as e:
+        logger.debug(f"Falha ao checar interstitial do CF: {e}")
+        return False
+
+
+def _log_stats():
+    stats = db.get_cf_stats()
+    if stats["total"]:
+        logger.info(
+            f"Challenges (7d): {stats['total']} | sucesso {stats['success_rate']:.0%} | "
+            f"tempo médio {stats['avg_solve_seconds']:.1f}s"
+        )
+
+
+def _log_clearance_lifetime():
+    """Loga quanto tempo o último clearance durou (pra calibrar quando ele expira)."""
+    last = db.get_last_cf_clearance()
+    if not last:
+        return
+    solved_at, expires_at = last
+    expires_info = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(expires_at)) if expires_at and expires_at != float("inf") else "sessão"
+    logger.info(f"Clearance anterior obtido em {solved_at} UTC (expiração do cookie: {expires_info})")
+
+
+async def bypass_challenge(tab: nodriver.Tab, max_attempts: int = 25, timeout: float = 60) -> bool:
+    """Bypass do challenge do Cloudflare no Pelando.
+
+    A página serve um interstitial simples com botão "Verify you are human"
+    (não é o Turnstile widget). Localizamos o botão via DOM (sem iframe,
+    sem shadow DOM) e clicamos nas coordenadas via CDP mouse_click — usar
+    user gesture real ajuda a passar a verificação de automação do CF.
+
+    Critério de sucesso: presença dos cards reais (`div[data-show-author]`).
+    Só grava em `cf_challenges` se um challenge (botão ou interstitial)
+    apareceu de fato: cards de cara não contam como resolução.
+    """
+    started = time.monotonic()
+    deadline = started + timeout
+    attempt = 0
+    # Checa antes do primeiro detect: o interstitial pode passar sozinho enquanto esperamos os cards
+    challenged = await _on_interstitial(tab)
+
+    while attempt < max_attempts:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        attempt += 1
+
+        info = await _detect(tab, timeout=min(remaining, 10))
+
+        if info.get("cards"):
+            solve_seconds = time.monotonic() - started
+            if not challenged:
+                logger.info(f"Sem challenge — {info['cards']} cards detectados ({solve_seconds:.1f}s)")
+                return True
+            expiry = await get_clearance_expiry(tab)
+            db.record_cf_challenge(solve_seconds, attempt, True, expiry)
+            logger.info(
+                f"Challenge resolvido — {info['cards']} cards detectados "
+                f"(tentativa {attempt}, {solve_seconds:.1f}s)"
+            )
+            _log_stats()
+            return True
+
+        if info.get("btn"):
+            challenged = True
+            click_x = info["x"] + info["w"] / 2
+            click_y = info["y"] + info["h"] / 2
+            logger.info(
+                f"Challenge tentativa {attempt}/{max_attempts}: clicando botão "
+                f"{info['tag']} em ({click_x:.0f},{click_y:.0f})"
+            )
+            try:
+                # Mouse move antes do click pra parecer gesto humano
+                await tab.mouse_move(click_x, click_y)
+                await tab.sleep(0.3)
+                await tab.mouse_click(click_x, click_y)
+            except Exception as e:
+                logger.warning(f"mouse_click falhou: {e}")
+            # Dá tempo do CF trocar a página antes de detectar o mesmo botão de novo
+            await readiness.wait_for_load(tab, timeout=5)
+        else:
+            challenged = challenged or await _on_interstitial(tab)
+            await tab  # atualizar URL/título pro log
+            logger.info(f"Tentativa {attempt}: aguardando — url='{(tab.url or '?')[:120]}'")
+
+    solve_seconds = time.monotonic() - started
+    if challenged:
+        db.record_cf_challenge(solve_seconds, attempt, False)
+        logger.error(f"Challenge não bypassado após {solve_seconds:.0f}s ({attempt} tentativas)")
+        _log_stats()
+    else:
+        logger.error(f"Cards não apareceram em {solve_seconds:.0f}s e nenhum challenge foi detectado")
+
+    # Debug: dump HTML da página CF pra análise offline (só na falha)
+    try:
+        html = await tab.get_content()
+        with open("/tmp/pelando_cf_page.html", "w") as fh:
+            fh.write(html)
+        logger.info(f"HTML CF dumpado: /tmp/pelando_cf_page.html ({len(html)} bytes)")
+    except Exception as e:
+        logger.warning(f"Falha ao dumpar HTML CF: {e}")
+    return False
+
+
+async def ensure_clearance(tab: nodriver.Tab) -> bool:
+    """Garante que a aba (já navegada pro Pelando) passou do Cloudflare.
+
+    Com clearance válido, só espera os cards aparecerem; a rotina de
+    challenge roda apenas se o CF desafiar mesmo assim ou sem clearance.
+    """
+    if await has_valid_clearance(tab):
+        info = await _detect(tab, timeout=15)
+        if info.get("cards"):
+            logger.info(f"Clearance válido, challenge pulado ({info['cards']} cards)")
+            return True
+        logger.warning("Clearance válido mas o Cloudflare desafiou mesmo assim (revogado?)")
+        _log_clearance_lifetime()
+    else:
+        _log_clearance_lifetime()
+
+    return await bypass_challenge(tab)
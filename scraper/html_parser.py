@@ -0,0 +1,128 @@
+"""Árvore DOM mínima sobre o html.parser da stdlib.
+
+Suficiente pra extrair campos de HTML baixado via HTTP (cards do Pelando,
+páginas de produto) com a mesma lógica dos seletores usados no browser,
+sem depender de bs4/lxml.
+"""
+from html.parser import HTMLParser
+from typing import Callable, Iterator
+
+_VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+}
+
+
+class Node:
+    __slots__ = ("tag", "attrs", "children", "parent")
+
+    def __init__(self, tag: str, attrs: dict[str, str], parent: "Node | None" = None):
+        self.tag = tag
+        self.attrs = attrs
+        self.children: list["Node | str"] = []
+        self.parent = parent
+
+    def get(self, name: str, default: str = "") -> str:
+        return self.attrs.get(name) or default
+
+    @property
+    def classes(self) -> str:
+        return self.attrs.get("class") or ""
+
+    def iter(self) -> Iterator["Node"]:
+        """Percorre os descendentes (pré-ordem, sem incluir o próprio nó)."""
+        stack = list(reversed([c for c in self.children if isinstance(c, Node)]))
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed([c for c in node.children if isinstance(c, Node)]))
+
+    def find_all(self, predicate: Callable[["Node"], bool]) -> list["Node"]:
+        return [n for n in self.iter() if predicate(n)]
+
+    def find(self, predicate: Callable[["Node"], bool]) -> "Node | None":
+        return next((n for n in self.iter() if predicate(n)), None)
+
+    def text(self) -> str:
+        """Texto dos descendentes com espaços normalizados (como textContent.trim())."""
+        parts = []
+        stack: list["Node | str"] = [self]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                parts.append(item)
+            else:
+                stack.extend(reversed(item.children))
+        return " ".join("".join(parts).split())
+
+    def raw_text(self) -> str:
+        """Conteúdo textual bruto dos filhos diretos (ex: JSON dentro de <script>)."""
+        return "".join(c for c in self.children if isinstance(c, str))
+
+
+def match(
+    tag: str | None = None,
+    class_contains: str | None = None,
+    id_: str | None = None,
+    class_name: str | None = None,
+    **attrs: str | bool,
+) -> Callable[[Node], bool]:
+    """Cria predicado estilo seletor CSS simples.
+
+    `class_contains` equivale a `[class*=...]`; `class_name` exige a classe
+    inteira (como `.classe`). `attrs` usa o nome do atributo com `_` no lugar de `-`; valor True exige
+    só a presença do atributo. Ex: match("meta", itemprop="price").
+    """
+    wanted = {k.replace("_", "-"): v for k, v in attrs.items()}
+
+    def _predicate(node: Node) -> bool:
+        if tag and node.tag != tag:
+            return False
+        if class_contains and class_contains not in node.classes:
+            return False
+        if class_name and class_name not in node.classes.split():
+            return False
+        if id_ and node.attrs.get("id") != id_:
+            return False
+        for name, value in wanted.items():
+            if name not in node.attrs:
+                return False
+            if value is not True and node.attrs.get(name) != value:
+                return False
+        return True
+
+    return _predicate
+
+
+class _TreeBuilder(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Node("#document", {})
+        self._stack = [self.root]
+
+    def handle_starttag(self, tag, attrs):
+        node = Node(tag, {k: (v or "") for k, v in attrs}, self._stack[-1])
+        self._stack[-1].children.append(node)
+        if tag not in _VOID_TAGS:
+            self._stack.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        node = Node(tag, {k: (v or "") for k, v in attrs}, self._stack[-1])
+        self._stack[-1].children.append(node)
+
+    def handle_endtag(self, tag):
+        # Fecha até a tag correspondente (tolera HTML mal formado)
+        for i in range(len(self._stack) - 1, 0, -1):
+            if self._stack[i].tag == tag:
+                del self._stack[i:]
+                return
+
+    def handle_data(self, data):
+        self._stack[-1].children.append(data)
+
+
+def parse(html: str) -> Node:
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder.root
@@ -0,0 +1,71 @@
+import logging
+
+import httpx
+import nodriver
+from nodriver import cdp
+
+logger = logging.getLogger("HTTP")
+
+DEFAULT_USER_AGENT = (
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/131.0.0.0 Safari/537.36"
+)
+
+_client: httpx.AsyncClient | None = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Retorna o cliente HTTP compartilhado (pool de conexões keep-alive).
+
+    Redirects NÃO são seguidos automaticamente: quem resolve links precisa
+    inspecionar cada salto.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            headers={
+                "User-Agent": DEFAULT_USER_AGENT,
+                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+                "Accept-Language": "pt-BR,pt;q=0.9,en;q=0.8",
+            },
+            timeout=httpx.Timeout(15.0, connect=5.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            follow_redirects=False,
+        )
+    return _client
+
+
+async def import_browser_cookies(browser: nodriver.Browser):
+    """Copia cookies e User-Agent do Chrome para o cliente HTTP.
+
+    O cf_clearance do Cloudflare é amarrado ao User-Agent, então os dois
+    precisam andar juntos pra requisição não ser desafiada de novo.
+    """
+    client = get_client()
+    try:
+        cookies = await browser.cookies.get_all()
+        for c in cookies:
+            client.cookies.set(c.name, c.value, domain=c.domain, path=c.path or "/")
+        _, _, _, user_agent, _ = await browser.send(cdp.browser.get_version())
+        if user_agent:
+            client.headers["User-Agent"] = user_agent.replace("HeadlessChrome", "Chrome")
+        logger.debug(f"{len(cookies)} cookies importados do browser")
+    except Exception as e:
+        logger.warning(f"Falha ao importar cookies do browser: {e}")
+
+
+def is_challenge(resp: httpx.Response) -> bool:
+    """Detecta resposta de challenge do Cloudflare."""
+    if resp.status_code not in (403, 429, 503):
+        return False
+    if resp.headers.get("cf-mitigated") == "challenge":
+        return True
+    body = resp.text[:5000].lower()
+    return "just a moment" in body or "cf-chl" in body or "challenge-platform" in body
+
+
+async def close_client():
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
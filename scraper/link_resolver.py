@@ -0,0 +1,237 @@
+"""Resolve o link da loja de um deal do Pelando via HTTP.
+
+Em vez de renderizar a página do deal, clicar em `.store-link-button` e
+esperar a aba popup seguir os redirects, lemos o href do botão (ou o link
+da loja no JSON de hidratação da página) e seguimos a cadeia de redirects
+com o cliente HTTP compartilhado, usando os cookies do Pelando exportados
+do browser.
+
+Short links das lojas (mercadolivre.com/sec/..., meli.la, amzn.to) que
+aparecem na cadeia são gravados em `short_links` com a URL final: quando o
+mesmo short link reaparece em outro deal, o salto é resolvido pelo cache.
+"""
+import asyncio
+import html as html_lib
+import json
+import logging
+import re
+from typing import Callable
+from urllib.parse import urljoin
+
+import httpx
+
+import config
+from database import db
+from models.pelando_deal import PelandoDeal
+from scraper import http_client
+
+logger = logging.getLogger("LINK_RESOLVER")
+
+MAX_REDIRECTS = 10
+
+# Encurtadores cujo destino não muda: a resolução vai pro cache
+_SHORT_LINK_RE = re.compile(r"^https?://(?:www\.)?(?:mercadolivre\.com/sec/|meli\.la/|amzn\.to/|a\.co/)", re.I)
+
+_cloudscraper = None
+
+# <a ... class="... store-link-button ..." ... href="..."> (atributos em qualquer ordem)
+_STORE_BUTTON_RE = re.compile(r"<a\b[^>]*class=[\"'][^\"']*store-link-button[^\"']*[\"'][^>]*>(.*?)</a>", re.I | re.S)
+_HREF_RE = re.compile(r"href=[\"']([^\"']+)[\"']", re.I)
+_TAG_RE = re.compile(r"<[^>]+>")
+_NEXT_DATA_RE = re.compile(r'<script[^>]+id="__NEXT_DATA__"[^>]*>(.*?)</script>', re.S)
+# Campos da oferta no __NEXT_DATA__ que guardam o link da loja
+_STORE_LINK_KEYS = {"sourceUrl", "storeUrl", "storeLink", "offerUrl"}
+
+_META_REFRESH_RE = re.compile(
+    r'<meta[^>]+http-equiv=["\']refresh["\'][^>]+content=["\'][^"\']*url=([^"\'>\s]+)', re.I
+)
+_JS_LOCATION_RE = re.compile(
+    r'(?:window\.)?location(?:\.href)?\s*=\s*["\'](https?://[^"\']+)["\']'
+    r'|location\.replace\s*\(\s*["\'](https?://[^"\']+)["\']'
+)
+
+
+def _find_store_button(page_html: str) -> tuple[str, str]:
+    """Retorna (href, texto) do botão `.store-link-button`, ou ("", "")."""
+    match = _STORE_BUTTON_RE.search(page_html)
+    if not match:
+        return "", ""
+    opening_tag = match.group(0)[: match.group(0).find(">") + 1]
+    href_match = _HREF_RE.search(opening_tag)
+    text = html_lib.unescape(_TAG_RE.sub(" ", match.group(1))).strip()
+    href = html_lib.unescape(href_match.group(1)) if href_match else ""
+    return href, text
+
+
+def _find_link_in_next_data(page_html: str, is_store_url: Callable[[str], bool]) -> str:
+    """Procura o link da loja do deal no JSON de hidratação (__NEXT_DATA__).
+
+    Só vale URL da loja nos campos de link da oferta (_STORE_LINK_KEYS): o
+    JSON também traz ofertas relacionadas, banners e links de loja soltos.
+    Se aparecer mais de um link diferente não dá pra saber qual é o do deal,
+    então retorna "" e o chamador cai no clique do botão pelo browser.
+    """
+    match = _NEXT_DATA_RE.search(page_html)
+    if not match:
+        return ""
+    try:
+        data = json.loads(match.group(1))
+    except ValueError:
+        return ""
+
+    links = set()
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key in _STORE_LINK_KEYS and isinstance(value, str) and value.startswith("http") and is_store_url(value):
+                    links.add(value)
+                elif isinstance(value, (dict, list)):
+                    stack.append(value)
+        elif isinstance(node, list):
+            stack.extend(node)
+    if len(links) == 1:
+        return links.pop()
+    if links:
+        logger.info(f"{len(links)} links de loja diferentes no __NEXT_DATA__, usando browser")
+    return ""
+
+
+def _extract_html_redirect(page_html: str) -> str:
+    """Extrai redirect client-side (meta refresh / location) de uma resposta 200."""
+    match = _META_REFRESH_RE.search(page_html)
+    if match:
+        return html_lib.unescape(match.group(1))
+    match = _JS_LOCATION_RE.search(page_html)
+    if match:
+        return match.group(1) or match.group(2)
+    return ""
+
+
+def is_short_link(url: str) -> bool:
+    return bool(_SHORT_LINK_RE.match(url or ""))
+
+
+async def follow_redirects(url: str, is_final: Callable[[str], bool]) -> str:
+    """Segue a cadeia de redirects até `is_final(url)`. Retorna "" se não chegar."""
+    client = http_client.get_client()
+    current_url = url
+    short_links = []
+    for step in range(MAX_REDIRECTS):
+        if is_final(current_url):
+            break
+
+        if is_short_link(current_url):
+            cached = db.get_short_link(current_url, config.SHORT_LINK_CACHE_HOURS)
+            if cached:
+                logger.info(f"Short link em cache: {current_url[:60]} -> {cached[:80]}")
+                current_url = cached
+                continue
+            short_links.append(current_url)
+
+        resp = await client.get(current_url)
+        if http_client.is_challenge(resp):
+            logger.info(f"Challenge no salto {step} ({current_url[:80]}), abortando resolução HTTP")
+            return ""
+
+        if resp.is_redirect:
+            location = resp.headers.get("Location", "")
+            if not location:
+                return ""
+            current_url = urljoin(current_url, location)
+            continue
+
+        if resp.status_code == 200:
+            next_url = _extract_html_redirect(resp.text)
+            if next_url:
+                current_url = urljoin(current_url, next_url)
+                continue
+        break
+
+    if not is_final(current_url):
+        return ""
+    for short_url in short_links:
+        db.save_short_link(short_url, current_url)
+    return current_url
+
+
+def _resolve_with_cloudscraper(url: str) -> str:
+    """Segue os redirects com cloudscraper (bloqueante: rodar via asyncio.to_thread)."""
+    global _cloudscraper
+    if _cloudscraper is None:
+        import cloudscraper
+        _cloudscraper = cloudscraper.create_scraper()
+    resp = _cloudscraper.get(url, allow_redirects=True, timeout=15)
+    return resp.url
+
+
+async def resolve_short_link(url: str, is_final: Callable[[str], bool]) -> str:
+    """Resolve um short link da loja (cache → HTTP assíncrono → cloudscraper).
+
+    Retorna a URL final (is_final) ou "" se nenhuma estratégia chegar lá.
+    """
+    try:
+        resolved = await follow_redirects(url, is_final)
+        if resolved:
+            logger.info(f"Short link resolvido via HTTP: {resolved[:150]}")
+            return resolved
+    except httpx.HTTPError as e:
+        logger.warning(f"Erro HTTP ao resolver short link: {e}")
+
+    # CF/anti-bot no meio da cadeia: cloudscraper resolve o JS challenge
+    try:
+        resolved = await asyncio.to_thread(_resolve_with_cloudscraper, url)
+    except ImportError:
+        logger.debug("cloudscraper não instalado, pulando")
+        return ""
+    except Exception as e:
+        logger.warning(f"Erro cloudscraper: {e}")
+        return ""
+
+    if not is_final(resolved):
+        return ""
+    logger.info(f"Short link resolvido (cloudscraper): {resolved[:150]}")
+    db.save_short_link(url, resolved)
+    return resolved
+
+
+async def resolve_store_link(deal: PelandoDeal, is_store_url: Callable[[str], bool]) -> str | None:
+    """Resolve a URL final na loja para um deal do Pelando.
+
+    Returns:
+        URL final na loja; "" se não der pra resolver via HTTP (o chamador cai
+        no fluxo do browser); None se o deal é só um cupom (deve ser ignorado).
+    """
+    if deal.is_coupon:
+        return None
+    if deal.store_link_url and is_store_url(deal.store_link_url):
+        return deal.store_link_url
+
+    try:
+        client = http_client.get_client()
+        resp = await client.get(deal.deal_url)
+        if http_client.is_challenge(resp) or resp.status_code != 200:
+            logger.info(f"Página do deal indisponível via HTTP (HTTP {resp.status_code}), usando browser")
+            return ""
+
+        href, button_text = _find_store_button(resp.text)
+        if "cupom" in button_text.lower():
+            logger.info(f"Deal é cupom (botão: '{button_text.lower()}'), ignorando")
+            deal.is_coupon = True
+            return None
+
+        link = urljoin(deal.deal_url, href) if href else _find_link_in_next_data(resp.text, is_store_url)
+        if not link:
+            logger.info("Link da loja não encontrado no HTML do deal, usando browser")
+            return ""
+
+        final_url = await follow_redirects(link, is_store_url)
+        if final_url:
+            deal.store_link_url = final_url
+            logger.info(f"Link da loja resolvido via HTTP: {final_url[:100]}")
+        return final_url
+
+    except httpx.HTTPError as e:
+        logger.warning(f"Erro HTTP ao resolver link da loja: {e}")
+        return ""
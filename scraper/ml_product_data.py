@@ -0,0 +1,186 @@
+"""Dados do produto do Mercado Livre a partir dos dados estruturados da página.
+
+Uma passada só sobre o HTML (renderizado ou baixado via HTTP, sem browser):
+1. estado pré-carregado (__PRELOADED_STATE__) — título, preço, preço
+   original, nota e "+N vendidos" do componente do cabeçalho/preço;
+2. JSON-LD (schema.org Product) — nome, imagem, preço e nota;
+3. meta tags itemprop/og — preço e imagem.
+Cada campo vem da primeira fonte que o tiver, exceto o preço atual, em que
+a meta itemprop (mais confiável) vence o JSON-LD, que vence o estado. O
+cupom só existe no HTML da linha de cupom, então é lido de lá.
+"""
+import json
+import logging
+import re
+
+from scraper.html_parser import Node, match, parse
+
+logger = logging.getLogger("ML_PRODUCT_DATA")
+
+_PRELOADED_ASSIGN_RE = re.compile(r"__PRELOADED_STATE__\s*=\s*")
+_COUPON_RE = re.compile(r"Aplicar\s+(R\$\s*[\d.,]+|[\d.,]+%)\s*OFF")
+
+
+def _format_price(value) -> str:
+    """1299.9 -> 'R$ 1299,90' (mesmo formato do preço extraído da página)."""
+    try:
+        return "R$ " + f"{float(value):.2f}".replace(".", ",")
+    except (TypeError, ValueError):
+        return ""
+
+
+def _find_dict(data, predicate) -> dict | None:
+    """Primeiro dict (busca em profundidade) que satisfaz o predicado."""
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if predicate(node):
+                return node
+            stack.extend(reversed(list(node.values())))
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
+    return None
+
+
+def _preloaded_state(root: Node, page_html: str) -> dict | None:
+    script = root.find(match("script", id_="__PRELOADED_STATE__"))
+    if script:
+        try:
+            return json.loads(script.raw_text())
+        except ValueError:
+            pass
+
+    # Formato antigo: window.__PRELOADED_STATE__ = {...};
+    m = _PRELOADED_ASSIGN_RE.search(page_html)
+    if m:
+        try:
+            state, _ = json.JSONDecoder().raw_decode(page_html, m.end())
+            return state
+        except ValueError:
+            pass
+    return None
+
+
+def _from_preloaded_state(state: dict) -> dict:
+    data = {}
+    header = _find_dict(state, lambda d: d.get("id") == "header" and isinstance(d.get("title"), str))
+    if header:
+        data["title"] = header["title"].strip()
+        subtitle = header.get("subtitle") or ""
+        if isinstance(subtitle, str) and "vendido" in subtitle.lower():
+            data["sales_info"] = subtitle.strip()
+        reviews = header.get("reviews")
+        if isinstance(reviews, dict) and reviews.get("rating"):
+            data["rating"] = str(reviews["rating"])
+
+    # Só o componente principal de preço: o estado também tem parcelas, frete e carrosséis
+    component = _find_dict(state, lambda d: d.get("id") == "price" and isinstance(d.get("price"), dict))
+    price = component["price"] if component else None
+    if price and isinstance(price.get("value"), (int, float)):
+        data["price"] = _format_price(price["value"])
+        if price.get("original_value"):
+            data["original_price"] = _format_price(price["original_value"])
+    return data
+
+
+def _json_ld_product(root: Node) -> dict | None:
+    for script in root.find_all(match("script", type="application/ld+json")):
+        try:
+            ld = json.loads(script.raw_text())
+        except ValueError:
+            continue
+        product = _find_dict(ld, lambda d: d.get("@type") == "Product")
+        if product:
+            return product
+    return None
+
+
+def _from_json_ld(product: dict) -> dict:
+    data = {}
+    if isinstance(product.get("name"), str):
+        data["title"] = product["name"].strip()
+
+    image = product.get("image")
+    if isinstance(image, list):
+        image = image[0] if image else ""
+    if isinstance(image, dict):
+        image = image.get("url", "")
+    if isinstance(image, str) and image:
+        data["image_url"] = image
+
+    offers = product.get("offers")
+    if isinstance(offers, list):
+        offers = offers[0] if offers else None
+    if isinstance(offers, dict) and offers.get("price") is not None:
+        data["price"] = _format_price(offers["price"])
+
+    rating = product.get("aggregateRating")
+    if isinstance(rating, dict) and rating.get("ratingValue"):
+        data["rating"] = str(rating["ratingValue"])
+    return data
+
+
+def _from_meta_tags(root: Node) -> dict:
+    data = {}
+    price_meta = root.find(match("meta", itemprop="price"))
+    if price_meta and price_meta.get("content"):
+        data["price"] = _format_price(price_meta.get("content"))
+
+    image_meta = root.find(match("meta", property="og:image"))
+    if image_meta and image_meta.get("content"):
+        data["image_url"] = image_meta.get("content")
+
+    title_el = root.find(match("h1", class_name="ui-pdp-title"))
+    if title_el and title_el.text():
+        data["title"] = title_el.text()
+    return data
+
+
+def _coupon(root: Node) -> str:
+    label = root.find(match(id_="coupon-awareness-row-label"))
+    if not label:
+        return ""
+    m = _COUPON_RE.search(label.text())
+    return f"{m.group(1).strip()} OFF" if m else ""
+
+
+def parse_product(page_html: str) -> dict:
+    """Extrai title, price, original_price, image_url, rating, sales_info e coupon.
+
+    Campos não encontrados vêm como "". Sem título, o chamador deve tratar
+    a extração como falha.
+    """
+    root = parse(page_html)
+    sources = []
+
+    state = _preloaded_state(root, page_html)
+    if state:
+        sources.append(_from_preloaded_state(state))
+    ld_product = _json_ld_product(root)
+    if ld_product:
+        sources.append(_from_json_ld(ld_product))
+    sources.append(_from_meta_tags(root))
+
+    data = {}
+    for source in sources:
+        for key, value in source.items():
+            data.setdefault(key, value)
+    # Preço: meta itemprop (mais confiável) > JSON-LD > estado pré-carregado
+    for source in reversed(sources):
+        if source.get("price"):
+            data["price"] = source["price"]
+            break
+
+    fields = ("title", "price", "original_price", "image_url", "rating", "sales_info")
+    result = {f: data.get(f, "") for f in fields}
+    result["coupon"] = _coupon(root)
+
+    # Descartar se igual ao preço atual
+    if result["original_price"] == result["price"]:
+        result["original_price"] = ""
+    if "?" in result["image_url"]:
+        result["image_url"] = result["image_url"].split("?")[0]
+
+    logger.debug(f"Dados estruturados: {len(sources)} fonte(s), título={'sim' if result['title'] else 'não'}")
+    return result
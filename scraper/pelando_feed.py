@@ -0,0 +1,187 @@
+"""Feed do Pelando em streaming: uma aba fixa em /recentes empurra cards novos.
+
+Um MutationObserver injetado (Page.addScriptToEvaluateOnNewDocument, então
+sobrevive a reloads e ao challenge do CF) chama a binding CDP
+`__kopDealFeed` com cada card novo. O handler de Runtime.bindingCalled
+converte os cards em PelandoDeal e coloca numa asyncio.Queue, que o
+consumidor em main drena. Se o feed ficar parado por
+PELANDO_FEED_RELOAD_SECONDS a aba é recarregada. Deal que o pipeline
+descarta sem marcar processado volta pra fila depois de
+SCRAPE_INTERVAL_SECONDS (mesma cadência do modo polling).
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+
+import nodriver
+from nodriver import cdp
+
+import config
+from models.pelando_deal import PelandoDeal
+from scraper.pelando_scraper import CARD_EXTRACT_JS, build_deals, open_listing
+from scraper.request_filter import enable_request_filter
+
+logger = logging.getLogger("PELANDO_FEED")
+
+BINDING_NAME = "__kopDealFeed"
+
+# Quantas URLs já emitidas lembrar (evita reenfileirar o mesmo card após reload)
+_SEEN_LIMIT = 500
+
+# Varre cards ainda não enviados a cada mutação (debounce de 300ms). Um card
+# só é marcado como enviado quando já tem título e URL (o React pode inserir
+# o nó antes de preencher o conteúdo).
+_OBSERVER_JS = """
+(() => {
+    if (window.__kopFeedInstalled) return;
+    window.__kopFeedInstalled = true;
+    const extract = %(extract)s;
+    let timer = null;
+    const flush = () => {
+        timer = null;
+        if (typeof window.%(binding)s !== "function") return;
+        const fresh = [];
+        for (const card of document.querySelectorAll("div[data-show-author]:not([data-kop-sent])")) {
+            const data = extract(card);
+            if (!data.title || !data.deal_url) continue;
+            card.setAttribute("data-kop-sent", "1");
+            fresh.push(data);
+        }
+        if (fresh.length) window.%(binding)s(JSON.stringify(fresh));
+    };
+    const schedule = () => { if (!timer) timer = setTimeout(flush, 300); };
+    new MutationObserver(schedule).observe(document, { childList: true, subtree: true });
+    schedule();
+})();
+""" % {"extract": CARD_EXTRACT_JS, "binding": BINDING_NAME}
+
+
+class PelandoFeed:
+    def __init__(self, browser: nodriver.Browser):
+        self.browser = browser
+        self.tab: nodriver.Tab | None = None
+        self.queue: asyncio.Queue[PelandoDeal] = asyncio.Queue()
+        self._seen: OrderedDict[str, None] = OrderedDict()
+        # deal_url -> (monotonic de quando reemitir, deal) dos deals descartados pelo pipeline
+        self._retry: dict[str, tuple[float, PelandoDeal]] = {}
+        self._last_card_at = time.monotonic()
+        self._watchdog_task: asyncio.Task | None = None
+
+    async def start(self) -> bool:
+        """Abre a aba do feed, instala observer + binding e navega pro Pelando."""
+        self.tab = await self.browser.get("about:blank", new_tab=True)
+        await enable_request_filter(self.tab)
+
+        self.tab.add_handler(cdp.runtime.BindingCalled, self._on_binding)
+        await self.tab.send(cdp.runtime.enable())
+        await self.tab.send(cdp.runtime.add_binding(name=BINDING_NAME))
+        await self.tab.send(cdp.page.enable())
+        await self.tab.send(cdp.page.add_script_to_evaluate_on_new_document(source=_OBSERVER_JS))
+
+        ok = await open_listing(self.tab)
+        if ok:
+            # Garantia caso o documento tenha sido criado antes do script registrado
+            await self.tab.evaluate(_OBSERVER_JS)
+        self._last_card_at = time.monotonic()
+        self._watchdog_task = asyncio.create_task(self._watchdog())
+        logger.info("Feed do Pelando iniciado" if ok else "Feed do Pelando iniciado sem cards (será recarregado)")
+        return ok
+
+    async def stop(self):
+        if self._watchdog_task:
+            self._watchdog_task.cancel()
+            self._watchdog_task = None
+        if self.tab:
+            try:
+                await self.tab.close()
+            except Exception:
+                pass
+            self.tab = None
+
+    @property
+    def alive(self) -> bool:
+        return self.tab is not None and self._watchdog_task is not None and not self._watchdog_task.done()
+
+    def retry_later(self, deal: PelandoDeal):
+        """Reemite um deal descartado pelo pipeline no próximo "ciclo".
+
+        Enquanto o deal estiver na janela de _seen (ainda perto do topo do
+        feed) ele é tentado de novo, como o polling faria relendo a listagem.
+        """
+        if deal.is_coupon:
+            return  # cupom não vira produto em nenhuma tentativa
+        if deal.deal_url in self._seen:
+            self._retry[deal.deal_url] = (time.monotonic() + config.SCRAPE_INTERVAL_SECONDS, deal)
+
+    def _flush_retries(self):
+        now = time.monotonic()
+        for url, (due, deal) in list(self._retry.items()):
+            if due > now:
+                continue
+            del self._retry[url]
+            if url in self._seen:
+                self.queue.put_nowait(deal)
+
+    def _on_binding(self, event: cdp.runtime.BindingCalled, *_):
+        if event.name != BINDING_NAME:
+            return
+        try:
+            cards = json.loads(event.payload)
+        except ValueError:
+            return
+
+        self._last_card_at = time.monotonic()
+        fresh = [c for c in cards if c.get("deal_url") not in self._seen]
+        for c in fresh:
+            self._seen[c.get("deal_url")] = None
+        while len(self._seen) > _SEEN_LIMIT:
+            self._seen.popitem(last=False)
+
+        for deal in build_deals(fresh, limit=None):
+            self.queue.put_nowait(deal)
+
+    async def _watchdog(self):
+        """Recarrega a aba se o feed ficou parado (página pode ter parado de atualizar)."""
+        while True:
+            await asyncio.sleep(15)
+            if self.browser.stopped:
+                logger.warning("Browser do feed parou, encerrando feed")
+                return
+            self._flush_retries()
+            idle = time.monotonic() - self._last_card_at
+            if idle < config.PELANDO_FEED_RELOAD_SECONDS:
+                continue
+            logger.info(f"Feed sem cards novos há {idle:.0f}s, recarregando...")
+            try:
+                await open_listing(self.tab)
+            except Exception as e:
+                # Aba/browser provavelmente morreu: feed morto (alive=False), consumidor recria
+                logger.error(f"Erro ao recarregar feed: {e} - encerrando feed")
+                return
+            self._last_card_at = time.monotonic()
+
+    async def next_batch(
+        self, linger: float = 2.0, max_size: int | None = None, timeout: float = 30.0
+    ) -> list[PelandoDeal]:
+        """Aguarda o próximo deal e agrupa os que chegarem em seguida (até `linger` segundos).
+
+        Sem deal em `timeout` segundos retorna lista vazia, pro consumidor
+        conferir a saúde do browser/feed mesmo sem tráfego.
+        """
+        max_size = max_size or config.STORE_CONCURRENCY * 2
+        try:
+            batch = [await asyncio.wait_for(self.queue.get(), timeout)]
+        except asyncio.TimeoutError:
+            return []
+        deadline = time.monotonic() + linger
+        while len(batch) < max_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
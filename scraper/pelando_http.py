@@ -0,0 +1,139 @@
+"""Listagem do Pelando sem browser.
+
+Baixa /recentes via HTTP com os cookies de clearance exportados do Chrome e
+extrai os cards em Python — do HTML renderizado no servidor ou, se não
+houver cards nele, do JSON de hidratação (__NEXT_DATA__) — gerando os mesmos
+dicts do CARD_EXTRACT_JS.
+Levanta ListingUnavailable quando o Cloudflare desafia (ou a resposta não
+tem cards), pro chamador cair no caminho do browser.
+"""
+import json
+import logging
+from urllib.parse import urljoin
+
+import httpx
+
+import config
+from scraper import http_client
+from scraper.html_parser import Node, match, parse
+
+logger = logging.getLogger("PELANDO_HTTP")
+
+
+class ListingUnavailable(Exception):
+    """Listagem via HTTP indisponível (challenge do CF, erro HTTP ou página sem cards)."""
+
+
+def _card_from_html(card: Node) -> dict:
+    """Equivalente Python do CARD_EXTRACT_JS (mesmos seletores)."""
+    title_h3 = card.find(match("h3", class_contains="title"))
+    title_el = title_h3.find(match("a")) if title_h3 else None
+    price_el = card.find(match("span", class_contains="deal-card-stamp"))
+    img_el = card.find(match("img", class_contains="deal-card-image"))
+    temp_div = card.find(match("div", class_contains="deal-card-temperature"))
+    temp_el = temp_div.find(match("span")) if temp_div else None
+
+    store_name = ""
+    for link in card.find_all(lambda n: n.tag == "a" and "/cupons-de-descontos/" in n.get("href")):
+        if link.text():
+            store_name = link.text()
+            break
+
+    is_expired = (title_el is not None and title_el.get("data-inactive") == "true") or (
+        card.find(lambda n: "inactive-label" in n.classes) is not None
+    )
+    href = title_el.get("href") if title_el else ""
+    return {
+        "title": title_el.text() if title_el else "",
+        "deal_url": urljoin(config.PELANDO_URL, href) if href else "",
+        "price": price_el.text() if price_el else "",
+        "image_url": img_el.get("src") if img_el else "",
+        "temperature": temp_el.text() if temp_el else "",
+        "store_name": store_name,
+        "is_expired": is_expired,
+    }
+
+
+def _deal_from_json(node: dict) -> dict | None:
+    """Converte um objeto de deal do JSON de hidratação, se tiver os campos mínimos."""
+    title = node.get("title")
+    store = node.get("store")
+    if not isinstance(title, str) or not isinstance(store, dict) or "temperature" not in node:
+        return None
+
+    deal_url = node.get("url") or node.get("dealUrl") or ""
+    if not deal_url and node.get("id"):
+        deal_url = f"/d/{node['id']}"
+    if not deal_url:
+        return None
+
+    image = node.get("image")
+    image_url = image.get("url", "") if isinstance(image, dict) else (image or "")
+    price = node.get("price")
+    if isinstance(price, (int, float)):
+        price = f"{price:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+    status = str(node.get("status") or "").lower()
+    return {
+        "title": title.strip(),
+        "deal_url": urljoin(config.PELANDO_URL, deal_url),
+        "price": str(price or ""),
+        "image_url": image_url,
+        "temperature": str(node.get("temperature") or ""),
+        "store_name": store.get("name", ""),
+        "is_expired": status in ("expired", "finished", "inactive"),
+    }
+
+
+def _deals_from_next_data(root: Node) -> list[dict]:
+    script = root.find(match("script", id_="__NEXT_DATA__"))
+    if not script:
+        return []
+    try:
+        data = json.loads(script.raw_text())
+    except ValueError:
+        return []
+
+    deals = []
+    seen = set()
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            deal = _deal_from_json(node)
+            if deal and deal["deal_url"] not in seen:
+                seen.add(deal["deal_url"])
+                deals.append(deal)
+            stack.extend(reversed(list(node.values())))
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
+    return deals
+
+
+def parse_listing(page_html: str) -> list[dict]:
+    """Extrai os cards da página /recentes (JSON de hidratação ou HTML)."""
+    root = parse(page_html)
+    cards = root.find_all(match("div", data_show_author=True))
+    if cards:
+        return [_card_from_html(c) for c in cards]
+    return _deals_from_next_data(root)
+
+
+async def fetch_listing() -> list[dict]:
+    """Baixa /recentes e retorna os cards. Levanta ListingUnavailable se o CF desafiar."""
+    client = http_client.get_client()
+    try:
+        resp = await client.get(config.PELANDO_URL)
+    except httpx.HTTPError as e:
+        raise ListingUnavailable(f"falha HTTP: {e}") from e
+
+    if http_client.is_challenge(resp):
+        raise ListingUnavailable(f"challenge do Cloudflare (HTTP {resp.status_code})")
+    if resp.status_code != 200:
+        raise ListingUnavailable(f"HTTP {resp.status_code} inesperado")
+
+    cards = parse_listing(resp.text)
+    if not cards:
+        # Página veio sem cards (ex: interstitial servido com 200)
+        raise ListingUnavailable("nenhum card na resposta")
+    return cards
@@ -1,13 +1,19 @@
 import asyncio
 import json
 import logging
+from typing import TYPE_CHECKING
 
 import nodriver
 
 from models.pelando_deal import PelandoDeal
+from scraper import cloudflare, http_client, pelando_http
 from scraper.stores import get_handler, get_supported_stores
+from scraper.tab_pool import get_tab_pool
 import config
 
+if TYPE_CHECKING:
+    from scraper.browser_pool import BrowserPool
+
 logger = logging.getLogger("PELANDO")
 
 # Quantidade máxima de deals a processar por ciclo
@@ -21,175 +27,40 @@ def _is_coupon_only(title: str) -> bool:
     return title_lower.startswith("cupom")
 
 
-async def _bypass_cloudflare_challenge(
-    tab: nodriver.Tab, max_retries: int = 25, interval: float = 2.5
-) -> bool:
-    """Bypass do challenge do Cloudflare no Pelando.
-
-    A página serve um interstitial simples com botão "Verify you are human"
-    (não é o Turnstile widget). Localizamos o botão via DOM (sem iframe,
-    sem shadow DOM) e clicamos nas coordenadas via CDP mouse_click — usar
-    user gesture real ajuda a passar a verificação de automação do CF.
-
-    Critério de sucesso: presença dos cards reais (`div[data-show-author]`).
-    """
-    for attempt in range(1, max_retries + 1):
-        await tab.sleep(interval)
-
-        # Debug one-shot: dump HTML da página CF pra análise offline
-        if attempt == 1:
-            try:
-                html = await tab.get_content()
-                with open("/tmp/pelando_cf_page.html", "w") as fh:
-                    fh.write(html)
-                logger.info(f"HTML CF dumpado: /tmp/pelando_cf_page.html ({len(html)} bytes)")
-            except Exception as e:
-                logger.warning(f"Falha ao dumpar HTML CF: {e}")
-
-        raw = await tab.evaluate(
-            """
-            JSON.stringify((() => {
-                const cards = document.querySelectorAll("div[data-show-author]");
-                if (cards.length > 0) return { cards: cards.length };
-
-                // Procura botão/link do CF por texto (case-insensitive) em
-                // qualquer elemento clicável visível.
-                const candidates = Array.from(document.querySelectorAll(
-                    "button, a, input[type='button'], input[type='submit'], [role='button']"
-                ));
-                const needle = "verify you are human";
-                for (const el of candidates) {
-                    const text = (el.textContent || el.value || "").trim().toLowerCase();
-                    if (!text.includes(needle)) continue;
-                    const r = el.getBoundingClientRect();
-                    if (r.width <= 0 || r.height <= 0) continue;
-                    return {
-                        btn: true,
-                        tag: el.tagName,
-                        x: r.left, y: r.top, w: r.width, h: r.height,
-                    };
-                }
-
-                return {
-                    nothing: true,
-                    title: document.title,
-                    url: location.href.slice(0, 120),
-                    btn_count: candidates.length,
-                };
-            })())
-            """
-        )
-        try:
-            info = json.loads(raw) if isinstance(raw, str) else {}
-        except (TypeError, ValueError):
-            info = {}
-
-        if info.get("cards"):
-            logger.info(
-                f"Challenge resolvido — {info['cards']} cards detectados "
-                f"(tentativa {attempt})"
-            )
-            return True
-
-        if info.get("btn"):
-            click_x = info["x"] + info["w"] / 2
-            click_y = info["y"] + info["h"] / 2
-            logger.info(
-                f"Challenge tentativa {attempt}/{max_retries}: clicando botão "
-                f"{info['tag']} em ({click_x:.0f},{click_y:.0f})"
-            )
-            try:
-                # Mouse move antes do click pra parecer gesto humano
-                await tab.mouse_move(click_x, click_y)
-                await tab.sleep(0.3)
-                await tab.mouse_click(click_x, click_y)
-            except Exception as e:
-                logger.warning(f"mouse_click falhou: {e}")
-        else:
-            if attempt <= 5 or attempt % 5 == 0:
-                logger.info(
-                    f"Tentativa {attempt}: aguardando — title='{info.get('title', '?')}' "
-                    f"url='{info.get('url', '?')}' botões={info.get('btn_count', '?')}"
-                )
-
-    logger.error(f"Challenge não bypassado após {max_retries} tentativas")
-    return False
-
-
-async def get_deals(tab: nodriver.Tab, store_filter: str | None = None) -> list[PelandoDeal]:
-    """
-    Extrai deals do Pelando na aba "Recentes".
-
-    Args:
-        tab: Tab do nodriver
-        store_filter: Nome da loja para filtrar (ex: "Mercado Livre").
-                      Se None, retorna apenas lojas suportadas.
-
-    Returns:
-        Lista de PelandoDeal (máximo MAX_DEALS_TO_PROCESS)
-    """
-    logger.info("Navegando para Pelando (Recentes)...")
-
-    await tab.get(config.PELANDO_URL)
-
-    # Bypass do challenge do CF — procura botão "Verify you are human" e clica
-    bypassed = await _bypass_cloudflare_challenge(tab)
-    if not bypassed:
-        await tab.save_screenshot("/tmp/pelando_cf_failed.png")
-        logger.error("Cloudflare challenge não bypassado. Screenshot: /tmp/pelando_cf_failed.png")
-        return []
-
-    # Aguardar cards carregarem
-    card = await tab.select("div[data-show-author]", timeout=45)
-    if not card:
-        await tab.save_screenshot("/tmp/pelando_timeout.png")
-        logger.error("Timeout ao carregar cards do Pelando. Screenshot: /tmp/pelando_timeout.png")
-        return []
-
-    # Extrair dados dos cards via JavaScript (mais rápido e robusto que select_all)
-    # JSON.stringify pra contornar bug do nodriver com objetos/arrays em evaluate
-    deals_raw = await tab.evaluate("""
-        JSON.stringify((() => {
-            const cards = Array.from(document.querySelectorAll("div[data-show-author]"));
-            return cards.map(card => {
-                const titleEl = card.querySelector("h3[class*='title'] a");
-                const priceEl = card.querySelector("span[class*='deal-card-stamp']");
-                const imgEl = card.querySelector("img[class*='deal-card-image']");
-                const tempEl = card.querySelector("div[class*='deal-card-temperature'] span");
-                const storeLinks = Array.from(card.querySelectorAll("a[href*='/cupons-de-descontos/']"));
-                const storeName = storeLinks.find(l => l.textContent.trim())?.textContent.trim() || "";
-                const isExpired = titleEl?.getAttribute("data-inactive") === "true"
-                    || !!card.querySelector("[class*='inactive-label']");
-                return {
-                    title: titleEl?.textContent.trim() || "",
-                    deal_url: titleEl?.href || "",
-                    price: priceEl?.textContent.replace(/\\n/g, " ").trim() || "",
-                    image_url: imgEl?.src || "",
-                    temperature: tempEl?.textContent.trim() || "",
-                    store_name: storeName,
-                    is_expired: isExpired,
-                };
-            });
-        })())
-    """)
-    try:
-        deals_data = json.loads(deals_raw) if isinstance(deals_raw, str) else []
-    except (TypeError, ValueError):
-        deals_data = []
-
-    if not deals_data:
-        logger.warning("Nenhum card extraído via JS")
-        return []
-
+# Função JS que extrai os campos de um card (`div[data-show-author]`).
+# Compartilhada pela listagem em lote e pelo feed em streaming (pelando_feed).
+CARD_EXTRACT_JS = """
+(card) => {
+    const titleEl = card.querySelector("h3[class*='title'] a");
+    const priceEl = card.querySelector("span[class*='deal-card-stamp']");
+    const imgEl = card.querySelector("img[class*='deal-card-image']");
+    const tempEl = card.querySelector("div[class*='deal-card-temperature'] span");
+    const storeLinks = Array.from(card.querySelectorAll("a[href*='/cupons-de-descontos/']"));
+    const storeName = storeLinks.find(l => l.textContent.trim())?.textContent.trim() || "";
+    const isExpired = titleEl?.getAttribute("data-inactive") === "true"
+        || !!card.querySelector("[class*='inactive-label']");
+    return {
+        title: titleEl?.textContent.trim() || "",
+        deal_url: titleEl?.href || "",
+        price: priceEl?.textContent.replace(/\\n/g, " ").trim() || "",
+        image_url: imgEl?.src || "",
+        temperature: tempEl?.textContent.trim() || "",
+        store_name: storeName,
+        is_expired: isExpired,
+    };
+}
+"""
+
+
+def build_deals(deals_data: list[dict], store_filter: str | None = None, limit: int | None = MAX_DEALS_TO_PROCESS) -> list[PelandoDeal]:
+    """Converte os cards extraídos em PelandoDeal, filtrando expirados, cupons e lojas não suportadas."""
     deals = []
     supported_stores = get_supported_stores()
     processed_urls = set()
 
-    logger.info(f"Total de cards extraídos: {len(deals_data)}")
-
     for d in deals_data:
-        if len(deals) >= MAX_DEALS_TO_PROCESS:
-            logger.info(f"Limite de {MAX_DEALS_TO_PROCESS} deals atingido")
+        if limit is not None and len(deals) >= limit:
+            logger.info(f"Limite de {limit} deals atingido")
             break
 
         if d.get("is_expired") or not d.get("title") or not d.get("deal_url"):
@@ -229,78 +100,162 @@ async def get_deals(tab: nodriver.Tab, store_filter: str | None = None) -> list[
         )
         deals.append(deal)
 
-    if deals:
-        logger.info(f"Encontrados {len(deals)} deals de lojas suportadas")
-    else:
-        logger.warning("Nenhum deal de lojas suportadas encontrado")
-
     return deals
 
 
-async def scrape_pelando(tab: nodriver.Tab, logged_in_stores: set[str] | None = None) -> list:
+async def open_listing(tab: nodriver.Tab) -> bool:
+    """Navega a aba para o Pelando (Recentes), passa pelo Cloudflare e espera os cards."""
+    logger.info("Navegando para Pelando (Recentes)...")
+
+    await tab.get(config.PELANDO_URL)
+
+    # Bypass do challenge do CF — pulado enquanto o cf_clearance for válido
+    bypassed = await cloudflare.ensure_clearance(tab)
+    if not bypassed:
+        await tab.save_screenshot("/tmp/pelando_cf_failed.png")
+        logger.error("Cloudflare challenge não bypassado. Screenshot: /tmp/pelando_cf_failed.png")
+        return False
+
+    # Aguardar cards carregarem
+    card = await tab.select("div[data-show-author]", timeout=45)
+    if not card:
+        await tab.save_screenshot("/tmp/pelando_timeout.png")
+        logger.error("Timeout ao carregar cards do Pelando. Screenshot: /tmp/pelando_timeout.png")
+        return False
+    return True
+
+
+async def _get_cards_http(tab: nodriver.Tab) -> list[dict] | None:
+    """Listagem sem browser (cookies de clearance do Chrome). None = cair pro browser."""
+    await http_client.import_browser_cookies(tab.browser)
+    try:
+        cards = await pelando_http.fetch_listing()
+        logger.info(f"Listagem via HTTP: {len(cards)} cards")
+        return cards
+    except pelando_http.ListingUnavailable as e:
+        logger.info(f"Listagem via HTTP indisponível ({e}), usando browser")
+        return None
+
+
+async def _get_cards_browser(tab: nodriver.Tab) -> list[dict]:
+    """Listagem pelo Chrome: navega, passa pelo CF e extrai os cards via JS."""
+    if not await open_listing(tab):
+        return []
+
+    # Extrair dados dos cards via JavaScript (mais rápido e robusto que select_all)
+    # JSON.stringify pra contornar bug do nodriver com objetos/arrays em evaluate
+    deals_raw = await tab.evaluate(f"""
+        JSON.stringify(Array.from(document.querySelectorAll("div[data-show-author]")).map({CARD_EXTRACT_JS}))
+    """)
+    try:
+        return json.loads(deals_raw) if isinstance(deals_raw, str) else []
+    except (TypeError, ValueError):
+        return []
+
+
+async def get_deals(tab: nodriver.Tab, store_filter: str | None = None) -> list[PelandoDeal]:
     """
-    Scrape principal do Pelando.
-    Extrai deals e processa usando o handler de cada loja.
+    Extrai deals do Pelando na aba "Recentes".
+    Com PELANDO_LISTING_BACKEND=http tenta primeiro sem browser e cai pro
+    Chrome automaticamente se o Cloudflare desafiar.
 
     Args:
         tab: Tab do nodriver
-        logged_in_stores: Set de store names com sessão ativa.
-                          Se None, processa todas as lojas.
+        store_filter: Nome da loja para filtrar (ex: "Mercado Livre").
+                      Se None, retorna apenas lojas suportadas.
 
     Returns:
-        Lista de Products processados
+        Lista de PelandoDeal (máximo MAX_DEALS_TO_PROCESS)
     """
-    from database import db
+    deals_data = None
+    if config.PELANDO_LISTING_BACKEND == "http":
+        deals_data = await _get_cards_http(tab)
+    if deals_data is None:
+        deals_data = await _get_cards_browser(tab)
 
-    logger.info("=" * 60)
-    logger.info("Iniciando scrape do Pelando")
-    logger.info("=" * 60)
+    if not deals_data:
+        logger.warning("Nenhum card extraído")
+        return []
 
-    deals = await get_deals(tab)
+    logger.info(f"Total de cards extraídos: {len(deals_data)}")
 
-    if not deals:
-        logger.info("Nenhum deal encontrado")
-        return []
+    deals = build_deals(deals_data, store_filter)
 
-    products = []
-    errors = 0
-    skipped = 0
+    if deals:
+        logger.info(f"Encontrados {len(deals)} deals de lojas suportadas")
+    else:
+        logger.warning("Nenhum deal de lojas suportadas encontrado")
+
+    return deals
 
+
+def select_deals(deals: list[PelandoDeal], logged_in_stores: set[str] | None = None) -> list[tuple[PelandoDeal, object]]:
+    """Filtra os deals que ainda precisam ser processados e associa o handler da loja.
+
+    Pula deals já processados, lojas sem handler e lojas sem sessão ativa
+    (se `logged_in_stores` for None, todas as lojas valem).
+    """
+    from database import db
+
+    selected = []
+    skipped = 0
     for deal in deals:
-        try:
-            # Verificar se deal já foi processado (ANTES de chamar handler)
-            if db.is_deal_processed(deal.deal_url):
-                logger.debug(f"Deal já processado: {deal.title[:40]}...")
-                skipped += 1
-                continue
+        # Verificar se deal já foi processado (ANTES de chamar handler)
+        if db.is_deal_processed(deal.deal_url):
+            logger.debug(f"Deal já processado: {deal.title[:40]}...")
+            skipped += 1
+            continue
 
-            handler = get_handler(deal.store_name)
-            if not handler:
-                logger.warning(f"Sem handler para loja: {deal.store_name}")
-                continue
+        handler = get_handler(deal.store_name)
+        if not handler:
+            logger.warning(f"Sem handler para loja: {deal.store_name}")
+            continue
 
-            # Pular lojas sem sessão ativa
-            if logged_in_stores is not None and handler.name not in logged_in_stores:
-                logger.debug(f"Loja {handler.display_name} sem sessão ativa, pulando deal: {deal.title[:40]}")
-                continue
+        # Pular lojas sem sessão ativa
+        if logged_in_stores is not None and handler.name not in logged_in_stores:
+            logger.debug(f"Loja {handler.display_name} sem sessão ativa, pulando deal: {deal.title[:40]}")
+            continue
 
-            logger.info(f"Processando deal via {handler.display_name}: {deal.title[:40]}...")
+        selected.append((deal, handler))
 
-            product = await handler.process_deal(tab, deal)
+    if skipped:
+        logger.info(f"{skipped} deals já processados pulados")
+    return selected
 
-            if product:
-                products.append(product)
-                db.mark_deal_processed(deal.deal_url)
-                logger.info(f"Produto processado: {product.mlb_id}")
-            else:
-                errors += 1
-                logger.warning(f"Falha ao processar deal: {deal.title[:40]}")
 
-        except Exception as e:
-            errors += 1
-            logger.error(f"Erro ao processar deal: {e}")
+async def process_deal(
+    tab: nodriver.Tab, handler, deal: PelandoDeal, semaphore: asyncio.Semaphore, pool: "BrowserPool | None" = None
+):
+    """Processa um deal numa aba própria, respeitando o limite de concorrência da loja.
 
-    logger.info(
-        f"Scrape concluído: {len(products)} novos, {skipped} pulados, {errors} erros"
-    )
-    return products
+    Lojas com caminho HTTP (handler.process_deal_http) nem usam aba. Com
+    pool, a aba é aberta na instância do Chrome menos ocupada; se o
+    browser morrer no meio do deal, ele é reenfileirado uma vez numa
+    instância saudável (o pool recria a que caiu).
+    """
+    async with semaphore:
+        product = await handler.process_deal_http(deal)
+        if product or deal.is_coupon:
+            return product
+
+        if pool is None:
+            return await _run_deal(tab.browser, handler, deal)
+
+        for attempt in (1, 2):
+            async with pool.lease() as instance:
+                logger.debug(f"Deal despachado para {instance.name}")
+                try:
+                    result = await _run_deal(instance.browser, handler, deal)
+                except Exception:
+                    if attempt == 2 or await instance.is_alive():
+                        raise
+                    result = None
+                if result is not None or attempt == 2 or await instance.is_alive():
+                    return result
+            logger.warning(f"{instance.name} caiu durante o deal, reprocessando em outra instância: {deal.title[:40]}")
+
+
+async def _run_deal(browser: nodriver.Browser, handler, deal: PelandoDeal):
+    logger.info(f"Processando deal via {handler.display_name}: {deal.title[:40]}...")
+    async with get_tab_pool(browser).lease(handler) as deal_tab:
+        return await handler.process_deal(deal_tab, deal)
@@ -0,0 +1,215 @@
+"""Espera orientada a eventos (CDP/DOM) no lugar de tab.sleep() fixos.
+
+Cada função retorna assim que a condição é satisfeita ou quando o deadline
+estoura — nunca levanta TimeoutError, o chamador decide o que fazer com o
+resultado (mesmo contrato do `tab.select(..., timeout=...)` do nodriver).
+"""
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable
+
+import nodriver
+from nodriver import cdp
+
+logger = logging.getLogger("READINESS")
+
+# Flags gravadas na própria conexão (Tab não é hashable) pra não reenviar enable
+_DISCOVERY_FLAG = "_kop_discover_targets"
+_PAGE_EVENTS_FLAG = "_kop_page_events"
+
+# Aguarda uma expressão JS ficar truthy re-avaliando a cada mutação do DOM e
+# num intervalo curto (propriedades como textarea.value ou variáveis em window
+# mudam sem disparar o MutationObserver). Resolve com o valor (string) ou ""
+# no timeout, depois de uma última checagem.
+_WAIT_CONDITION_JS = """
+new Promise((resolve) => {
+    const check = () => { try { return (%(expr)s); } catch (e) { return null; } };
+    const first = check();
+    if (first) { resolve(String(first)); return; }
+    let done = false;
+    const finish = (value) => {
+        if (done) return;
+        done = true;
+        observer.disconnect();
+        clearTimeout(timer);
+        clearInterval(poll);
+        resolve(value);
+    };
+    const recheck = () => {
+        const value = check();
+        if (value) finish(String(value));
+    };
+    const observer = new MutationObserver(recheck);
+    observer.observe(document.documentElement || document, {
+        childList: true, subtree: true, attributes: true, characterData: true,
+    });
+    const poll = setInterval(recheck, 150);
+    const timer = setTimeout(() => {
+        const value = check();
+        finish(value ? String(value) : "");
+    }, %(timeout_ms)d);
+})
+"""
+
+
+async def _enable_target_discovery(browser: nodriver.Browser):
+    if browser.__dict__.get(_DISCOVERY_FLAG):
+        return
+    await browser.send(cdp.target.set_discover_targets(discover=True))
+    browser.__dict__[_DISCOVERY_FLAG] = True
+
+
+async def _enable_page_events(tab: nodriver.Tab):
+    if tab.__dict__.get(_PAGE_EVENTS_FLAG):
+        return
+    await tab.send(cdp.page.enable())
+    await tab.send(cdp.page.set_lifecycle_events_enabled(enabled=True))
+    tab.__dict__[_PAGE_EVENTS_FLAG] = True
+
+
+async def _wait_event(
+    connection,
+    event_types: list[type],
+    predicate: Callable[[object], bool],
+    timeout: float,
+    trigger: Callable[[], Awaitable] | None = None,
+):
+    """Registra handler para os eventos, dispara `trigger` e aguarda o primeiro que satisfaça `predicate`."""
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def _handler(event, *_):
+        if future.done():
+            return
+        try:
+            if predicate(event):
+                future.set_result(event)
+        except Exception as e:
+            logger.debug(f"Erro no predicado de {type(event).__name__}: {e}")
+
+    for event_type in event_types:
+        connection.add_handler(event_type, _handler)
+    try:
+        if trigger:
+            await trigger()
+        return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        return None
+    finally:
+        for event_type in event_types:
+            connection.remove_handler(event_type, _handler)
+
+
+async def wait_for_popup(
+    opener: nodriver.Tab, trigger: Callable[[], Awaitable], timeout: float = 10
+) -> nodriver.Tab | None:
+    """Executa `trigger` (ex: click) e retorna a aba aberta por `opener` (Target.targetCreated).
+
+    Filtra pelo opener_id, então é seguro com vários deals abrindo abas ao mesmo tempo.
+    """
+    browser = opener.browser
+    opener_id = opener.target.target_id
+    await _enable_target_discovery(browser)
+
+    event = await _wait_event(
+        browser,
+        [cdp.target.TargetCreated],
+        lambda ev: ev.target_info.type_ == "page" and ev.target_info.opener_id == opener_id,
+        timeout,
+        trigger=trigger,
+    )
+    if event is None:
+        return None
+
+    target_id = event.target_info.target_id
+    await browser.update_targets()
+    for t in browser.tabs:
+        if t.target.target_id == target_id:
+            return t
+    return None
+
+
+async def wait_for_url(tab: nodriver.Tab, predicate: Callable[[str], bool], timeout: float = 15) -> str:
+    """Aguarda a URL da aba satisfazer `predicate` (Target.targetInfoChanged).
+
+    Cobre redirects HTTP, meta refresh e `location = ...`, sem precisar estar
+    anexado à aba. Retorna a URL atual (satisfazendo ou não o predicado).
+    """
+    browser = tab.browser
+    target_id = tab.target.target_id
+    await _enable_target_discovery(browser)
+
+    await tab  # atualizar estado antes de decidir se precisa esperar
+    if predicate(tab.url or ""):
+        return tab.url
+
+    event = await _wait_event(
+        browser,
+        [cdp.target.TargetInfoChanged],
+        lambda ev: ev.target_info.target_id == target_id and predicate(ev.target_info.url or ""),
+        timeout,
+    )
+    if event is not None:
+        tab.target = event.target_info
+        return tab.url
+
+    await tab
+    return tab.url or ""
+
+
+async def wait_for_load(tab: nodriver.Tab, timeout: float = 15, network_idle: bool = False) -> bool:
+    """Aguarda o evento de lifecycle `load` (ou `networkIdle`) do frame principal."""
+    await _enable_page_events(tab)
+    wanted = "networkIdle" if network_idle else "load"
+
+    if not network_idle:
+        state = await tab.evaluate("document.readyState")
+        if state == "complete":
+            return True
+
+    main_frame_id = None
+    try:
+        frame_tree = await tab.send(cdp.page.get_frame_tree())
+        main_frame_id = frame_tree.frame.id_
+    except Exception as e:
+        logger.debug(f"Falha ao obter frame principal: {e}")
+
+    event = await _wait_event(
+        tab,
+        [cdp.page.LifecycleEvent],
+        lambda ev: ev.name == wanted and (main_frame_id is None or ev.frame_id == main_frame_id),
+        timeout,
+    )
+    return event is not None
+
+
+async def wait_for_condition(tab: nodriver.Tab, expression: str, timeout: float = 10) -> str:
+    """Aguarda uma expressão JS ficar truthy, re-avaliando a cada mutação do DOM.
+
+    Retorna o valor (como string) ou "" no timeout. Se a página navegar no meio
+    (contexto destruído), reavalia no documento novo até o deadline.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return ""
+        script = _WAIT_CONDITION_JS % {"expr": expression, "timeout_ms": int(remaining * 1000)}
+        try:
+            result = await tab.evaluate(script, await_promise=True, return_by_value=True)
+        except Exception as e:
+            logger.debug(f"wait_for_condition interrompido ({e}), reavaliando...")
+            await asyncio.sleep(0.2)
+            continue
+        if isinstance(result, str):
+            return result
+        # ExceptionDetails: contexto destruído por navegação
+        await asyncio.sleep(0.2)
+
+
+async def wait_for_selector(tab: nodriver.Tab, selector: str, timeout: float = 10) -> bool:
+    """Aguarda um seletor CSS aparecer no DOM (MutationObserver, sem polling)."""
+    expression = f"document.querySelector({json.dumps(selector)}) ? 'found' : ''"
+    return bool(await wait_for_condition(tab, expression, timeout))
@@ -0,0 +1,130 @@
+"""Filtro de requisições via CDP Fetch: bloqueia imagens, fontes, mídia e trackers.
+
+O scraper só lê texto e URLs de imagem do DOM, então baixar os recursos em
+si é desperdício de banda/CPU. Só os tipos bloqueados e os hosts de tracker
+são interceptados (RequestPattern), o resto da página nem passa pelo Python.
+
+Nunca bloqueia: hosts em ALWAYS_ALLOW_HOSTS (challenge do Cloudflare, login
+e barra de afiliados das lojas) nem os de REQUEST_FILTER_ALLOW_HOSTS.
+"""
+import logging
+from urllib.parse import urlparse
+
+import nodriver
+from nodriver import cdp
+
+import config
+
+logger = logging.getLogger("REQUEST_FILTER")
+
+# Hosts que login/afiliados/challenge dependem — nunca bloquear, qualquer tipo
+ALWAYS_ALLOW_HOSTS = (
+    "challenges.cloudflare.com",
+    "associados.amazon.com.br",
+    "affiliate-program.amazon.com",
+    "auth.mercadolivre.com.br",
+    "auth.mercadolibre.com",
+)
+
+# Trackers/ads/analytics bloqueados em qualquer tipo de recurso
+TRACKER_HOSTS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "googlesyndication.com",
+    "googleadservices.com",
+    "doubleclick.net",
+    "facebook.net",
+    "connect.facebook.com",
+    "hotjar.com",
+    "clarity.ms",
+    "analytics.tiktok.com",
+    "criteo.com",
+    "criteo.net",
+    "taboola.com",
+    "outbrain.com",
+    "amazon-adsystem.com",
+    "scorecardresearch.com",
+    "nr-data.net",
+    "sentry.io",
+)
+
+_FLAG = "_kop_request_filter"
+
+# BLOCK_RESOURCE_TYPES resolvido para os valores do CDP (calculado uma vez)
+_block_types: tuple[cdp.network.ResourceType, ...] | None = None
+
+
+def _host_matches(host: str, patterns) -> bool:
+    return any(host == p or host.endswith("." + p) for p in patterns)
+
+
+def _deny_hosts() -> tuple[str, ...]:
+    return TRACKER_HOSTS + tuple(config.REQUEST_FILTER_DENY_HOSTS)
+
+
+def _allow_hosts() -> tuple[str, ...]:
+    return ALWAYS_ALLOW_HOSTS + tuple(config.REQUEST_FILTER_ALLOW_HOSTS)
+
+
+def _resource_types() -> tuple[cdp.network.ResourceType, ...]:
+    """BLOCK_RESOURCE_TYPES sem diferenciar maiúsculas ("image" -> Image); tipos desconhecidos são ignorados."""
+    global _block_types
+    if _block_types is None:
+        known = {rt.value.lower(): rt for rt in cdp.network.ResourceType}
+        types = []
+        for name in config.BLOCK_RESOURCE_TYPES:
+            rt = known.get(name.lower())
+            if rt is None:
+                logger.warning(f"Tipo de recurso desconhecido em BLOCK_RESOURCE_TYPES: {name!r} (ignorado)")
+                continue
+            types.append(rt)
+        _block_types = tuple(types)
+    return _block_types
+
+
+def should_block(url: str, resource_type: str) -> bool:
+    """Decide se a requisição deve ser bloqueada (regras por host têm prioridade sobre tipo)."""
+    host = (urlparse(url).hostname or "").lower()
+    if not host or url.startswith("data:"):
+        return False
+    if _host_matches(host, _allow_hosts()):
+        return False
+    if _host_matches(host, _deny_hosts()):
+        return True
+    return resource_type in {rt.value for rt in _resource_types()}
+
+
+async def enable_request_filter(tab: nodriver.Tab):
+    """Liga o filtro na aba (idempotente). No-op se BLOCK_RESOURCES=false."""
+    if not config.BLOCK_RESOURCES or tab.__dict__.get(_FLAG):
+        return
+
+    patterns = [
+        cdp.fetch.RequestPattern(
+            resource_type=rt,
+            request_stage=cdp.fetch.RequestStage.REQUEST,
+        )
+        for rt in _resource_types()
+    ]
+    patterns += [
+        cdp.fetch.RequestPattern(url_pattern=f"*://*{host}/*", request_stage=cdp.fetch.RequestStage.REQUEST)
+        for host in _deny_hosts()
+    ]
+
+    async def _on_paused(event: cdp.fetch.RequestPaused, *_):
+        try:
+            if should_block(event.request.url, event.resource_type.value):
+                await tab.send(cdp.fetch.fail_request(event.request_id, cdp.network.ErrorReason.BLOCKED_BY_CLIENT))
+            else:
+                await tab.send(cdp.fetch.continue_request(event.request_id))
+        except Exception as e:
+            # Aba fechada/navegou no meio: a requisição já não existe
+            logger.debug(f"Falha ao responder requisição interceptada: {e}")
+
+    try:
+        tab.add_handler(cdp.fetch.RequestPaused, _on_paused)
+        await tab.send(cdp.fetch.enable(patterns=patterns))
+        tab.__dict__[_FLAG] = True
+    except Exception as e:
+        tab.remove_handler(cdp.fetch.RequestPaused, _on_paused)
+        logger.warning(f"Falha ao habilitar filtro de requisições: {e}")
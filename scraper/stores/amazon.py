@@ -3,8 +3,12 @@ import json
 import logging
 import re
 
+import httpx
 import nodriver
 
+import config
+from scraper import http_client, link_resolver, readiness
+from scraper.html_parser import match, parse
 from scraper.stores.base_store import BaseStore
 from models.pelando_deal import PelandoDeal
 from models.product import Product
@@ -12,65 +16,48 @@ from config import AMAZON_AFFILIATE_TAG
 
 logger = logging.getLogger("AMAZON_STORE")
 
+# Marcadores da página de captcha / bloqueio de robô da Amazon
+_CAPTCHA_MARKERS = ("/errors/validatecaptcha", "captchacharacters", "api-services-support@amazon.com")
+
 
 class AmazonStore(BaseStore):
     name = "amazon"
     display_name = "Amazon"
     domain_url = "https://www.amazon.com.br"
     login_url = "https://associados.amazon.com.br"
+    store_hosts = ("amazon.com.br", "amazon.com")
+    # Token de autenticação do amazon.com.br (só existe logado)
+    session_cookie_names = ("at-acbbr", "sess-at-acbbr")
 
     async def process_deal(self, tab: nodriver.Tab, deal: PelandoDeal) -> Product | None:
         """
         Processa um deal do Pelando que é da Amazon.
-        1. Navega para a página do deal no Pelando
-        2. Clica no botão para ir à Amazon
+        1. Resolve o link da loja via HTTP (ou abre o deal no Pelando)
+        2. Navega direto pra Amazon (ou clica no botão e pega a popup)
         3. Gera link de afiliado via ASIN + tag
         4. Extrai dados do produto
         5. Retorna Product
         """
+        amazon_tab = None
         try:
             logger.info(f"Processando deal Amazon: {deal.title[:50]}...")
 
-            # 1. Navegar para página do deal no Pelando
-            await tab.get(deal.deal_url)
-            await tab.sleep(2)
-
-            # 2. Clicar no botão para ir à Amazon
-            store_btn = await tab.select(".store-link-button", timeout=10)
-            if not store_btn:
-                logger.error("Botão store-link-button não encontrado")
+            # 1-2. Chegar na página da loja (HTTP + navegação direta, ou clique no Pelando)
+            amazon_tab = await self._open_store_tab(tab, deal)
+            if not amazon_tab:
                 return None
 
-            btn_text = (store_btn.text or "").strip().lower()
-            if "cupom" in btn_text:
-                logger.info(f"Deal é cupom (botão: '{btn_text}'), ignorando")
-                return None
-
-            await store_btn.click()
-            logger.info("Clicou no botão para ir à Amazon")
-
-            # Aguardar nova aba abrir
-            await tab.sleep(3)
-
-            # Pegar a nova aba (última aberta)
-            browser = tab.browser
-            if len(browser.tabs) < 2:
-                logger.error("Nova aba não abriu após clicar no botão")
-                return None
-
-            amazon_tab = browser.tabs[-1]
-            await amazon_tab  # atualizar estado interno
-            current_url = amazon_tab.url
+            # Aguardar redirect do Pelando chegar na Amazon
+            current_url = await readiness.wait_for_url(amazon_tab, lambda u: "amazon.com" in u, timeout=15)
             logger.info(f"URL atual: {current_url}")
 
             # Verificar se chegou na Amazon
             if "amazon.com" not in current_url:
                 logger.error(f"Não chegou na Amazon, URL: {current_url}")
-                await self._close_extra_tabs(tab)
                 return None
 
-            # 3. Aguardar página carregar
-            await amazon_tab.sleep(3)
+            # 3. Aguardar página do produto (título no DOM já basta pra extração)
+            await readiness.wait_for_selector(amazon_tab, "#productTitle", timeout=15)
 
             # 4. Gerar link de afiliado via ASIN + tag
             await amazon_tab  # atualizar URL após possíveis redirects
@@ -78,7 +65,6 @@ class AmazonStore(BaseStore):
 
             if not affiliate_link:
                 logger.warning("Não conseguiu gerar link de afiliado Amazon")
-                await self._close_extra_tabs(tab)
                 return None
 
             # 5. Extrair dados do produto
@@ -86,47 +72,65 @@ class AmazonStore(BaseStore):
 
             if not product_data:
                 logger.error("Falha ao extrair dados do produto Amazon")
-                await self._close_extra_tabs(tab)
                 return None
 
             # 6. Montar Product
-            product = Product(
-                mlb_id=product_data["product_id"],
-                title=product_data["title"],
-                price=product_data["price"],
-                image_url=product_data["image_url"],
-                affiliate_link=affiliate_link,
-                original_price=product_data.get("original_price", ""),
-                coupon=product_data.get("coupon", ""),
-                rating=product_data.get("rating", ""),
-                temperature=deal.temperature,
-                source="pelando",
-                store="amazon",
-            )
-
-            logger.info(
-                f"Produto Amazon processado: {product.mlb_id} | {product.title[:40]} | "
-                f"{product.price} | Link: {product.affiliate_link}"
-            )
-
-            # 7. Fechar aba extra
-            await self._close_extra_tabs(tab)
-
-            return product
+            return self._build_product(deal, product_data, affiliate_link)
 
         except Exception as e:
             logger.error(f"Erro ao processar deal Amazon: {e}")
-            await self._close_extra_tabs(tab)
             return None
+        finally:
+            # 7. Fechar a aba popup da Amazon (a aba do deal é do chamador)
+            if amazon_tab is not tab:
+                await self._close_tab(amazon_tab)
+
+    async def process_deal_http(self, deal: PelandoDeal) -> Product | None:
+        """
+        Processa o deal sem browser: o link de afiliado só depende do ASIN,
+        então basta resolver o link da loja e baixar /dp/{ASIN}.
+        Retorna None (chamador usa o browser) em captcha ou falha de parse.
+        """
+        if config.AMAZON_PRODUCT_BACKEND != "http":
+            return None
+
+        store_url = await link_resolver.resolve_store_link(deal, self.is_store_url)
+        asin = self._find_asin(store_url or "")
+        if not asin:
+            return None
+
+        logger.info(f"Processando deal Amazon via HTTP: {deal.title[:50]}...")
+        product_data = await self._fetch_product_data_http(asin)
+        if not product_data:
+            return None
+        return self._build_product(deal, product_data, self._generate_affiliate_link(store_url))
+
+    def _build_product(self, deal: PelandoDeal, product_data: dict, affiliate_link: str) -> Product:
+        product = Product(
+            mlb_id=product_data["product_id"],
+            title=product_data["title"],
+            price=product_data["price"],
+            image_url=product_data["image_url"],
+            affiliate_link=affiliate_link,
+            original_price=product_data.get("original_price", ""),
+            coupon=product_data.get("coupon", ""),
+            rating=product_data.get("rating", ""),
+            temperature=deal.temperature,
+            source="pelando",
+            store="amazon",
+        )
+
+        logger.info(
+            f"Produto Amazon processado: {product.mlb_id} | {product.title[:40]} | "
+            f"{product.price} | Link: {product.affiliate_link}"
+        )
+        return product
 
     async def is_logged_in(self, browser: nodriver.Browser) -> bool:
         """Verifica se está logado no Amazon Associates (SiteStripe visível)."""
         try:
             check_tab = await browser.get("https://www.amazon.com.br", new_tab=True)
-            await check_tab.sleep(3)
-
-            sitestripe = await check_tab.select("#amzn-ss-wrap", timeout=5)
-            logged_in = sitestripe is not None
+            logged_in = await readiness.wait_for_selector(check_tab, "#amzn-ss-wrap", timeout=8)
 
             if logged_in:
                 logger.info("Logado no Amazon Associates (SiteStripe visível)")
@@ -237,26 +241,102 @@ class AmazonStore(BaseStore):
             logger.error(f"Erro ao extrair dados do produto: {e}")
             return None
 
-    def _extract_asin(self, url: str) -> str:
-        """Extrai o ASIN da URL da Amazon."""
-        match = re.search(r"/dp/([A-Z0-9]{10})", url)
-        if match:
-            return match.group(1)
-        match = re.search(r"/gp/product/([A-Z0-9]{10})", url)
-        if match:
-            return match.group(1)
-        return f"AMZ{abs(hash(url)) % 10000000000}"
-
-    async def _close_extra_tabs(self, main_tab: nodriver.Tab):
-        """Fecha abas extras e volta para a principal."""
+    async def _fetch_product_data_http(self, asin: str) -> dict | None:
+        """Baixa /dp/{ASIN} com o cliente HTTP compartilhado e extrai os dados."""
+        url = f"{self.domain_url}/dp/{asin}"
         try:
-            browser = main_tab.browser
-            for t in browser.tabs[:]:
-                if t != main_tab:
-                    try:
-                        await t.close()
-                    except Exception:
-                        pass
-            await main_tab.bring_to_front()
+            resp = await http_client.get_client().get(url, follow_redirects=True)
+        except httpx.HTTPError as e:
+            logger.warning(f"Erro HTTP ao baixar produto Amazon {asin}: {e}, usando browser")
+            return None
+
+        lowered = resp.text.lower()
+        if resp.status_code == 503 or any(m in lowered for m in _CAPTCHA_MARKERS):
+            logger.warning(f"Amazon pediu captcha para {asin} (HTTP {resp.status_code}), usando browser")
+            return None
+        if resp.status_code != 200:
+            logger.warning(f"HTTP {resp.status_code} ao baixar produto Amazon {asin}, usando browser")
+            return None
+
+        try:
+            data = self._parse_product_html(resp.text)
         except Exception as e:
-            logger.warning(f"Erro ao fechar abas extras: {e}")
+            logger.warning(f"Erro ao ler HTML do produto Amazon {asin}: {e}, usando browser")
+            return None
+        if not data:
+            logger.warning(f"Título do produto {asin} não encontrado no HTML, usando browser")
+            return None
+        data["product_id"] = asin
+        return data
+
+    @staticmethod
+    def _parse_product_html(page_html: str) -> dict | None:
+        """Equivalente Python da extração JS de _extract_product_data (mesmos seletores)."""
+        root = parse(page_html)
+
+        title_el = root.find(match(id_="productTitle"))
+        title = title_el.text() if title_el else ""
+        if not title:
+            return None
+
+        # Preço
+        price = ""
+        whole_el = root.find(match("span", class_name="a-price-whole"))
+        whole = whole_el.text().replace(".", "").replace(",", "") if whole_el else ""
+        if whole:
+            fraction_el = root.find(match("span", class_name="a-price-fraction"))
+            fraction = (fraction_el.text() if fraction_el else "") or "00"
+            price = f"R$ {whole},{fraction}"
+        else:
+            price_el = root.find(match("span", class_name="a-price"))
+            offscreen = price_el.find(match("span", class_name="a-offscreen")) if price_el else None
+            if offscreen:
+                price = offscreen.text()
+
+        # Preço original (riscado)
+        original_price = ""
+        strike_el = root.find(match("span", class_name="a-price", data_a_strike=True))
+        strike_offscreen = strike_el.find(match("span", class_name="a-offscreen")) if strike_el else None
+        if strike_offscreen and "R$" in strike_offscreen.text():
+            original_price = strike_offscreen.text()
+
+        # Imagem (no HTML cru o src pode ser placeholder; data-old-hires é a versão grande)
+        image_url = ""
+        img_el = root.find(match("img", id_="landingImage"))
+        if img_el:
+            for attr in ("data-old-hires", "src"):
+                candidate = img_el.get(attr)
+                if candidate.startswith("http"):
+                    image_url = candidate
+                    break
+
+        # Rating
+        rating = ""
+        rating_el = root.find(match("span", class_name="a-icon-alt"))
+        if rating_el:
+            m = re.search(r"([\d,.]+)", rating_el.text())
+            if m:
+                rating = m.group(1)
+
+        # Cupom
+        coupon_el = root.find(match(id_="couponBadgeRegularVpc"))
+        coupon = coupon_el.text() if coupon_el else ""
+
+        return {
+            "title": title,
+            "price": price,
+            "original_price": original_price,
+            "image_url": image_url,
+            "rating": rating,
+            "coupon": coupon,
+        }
+
+    @staticmethod
+    def _find_asin(url: str) -> str:
+        """ASIN da URL da Amazon, ou "" se a URL não tem um."""
+        m = re.search(r"/(?:dp|gp/product)/([A-Z0-9]{10})", url)
+        return m.group(1) if m else ""
+
+    def _extract_asin(self, url: str) -> str:
+        """Extrai o ASIN da URL da Amazon."""
+        return self._find_asin(url) or f"AMZ{abs(hash(url)) % 10000000000}"
@@ -1,26 +1,66 @@
+import logging
+import time
 from abc import ABC, abstractmethod
 from typing import TYPE_CHECKING
+from urllib.parse import urlparse
+
+from nodriver import cdp
+
+import config
+from scraper import link_resolver, readiness
+from scraper.request_filter import enable_request_filter
 
 if TYPE_CHECKING:
     import nodriver
     from models.pelando_deal import PelandoDeal
     from models.product import Product
 
+logger = logging.getLogger("BASE_STORE")
+
+# Cookie que expira dentro dessa margem não conta como sessão válida
+SESSION_EXPIRY_MARGIN_SECONDS = 300
+# Mesmo com cookie longo, revalida a sessão pelo menos uma vez nesse intervalo
+LOGIN_CACHE_MAX_SECONDS = 6 * 3600
+
 
 class BaseStore(ABC):
     name: str
     display_name: str
     domain_url: str
     login_url: str
+    # Hosts que indicam que o redirect do Pelando chegou na loja
+    store_hosts: tuple[str, ...] = ()
+    # Cookies que só existem com a sessão logada (todos precisam estar presentes)
+    session_cookie_names: tuple[str, ...] = ()
+
+    def __init__(self):
+        # Sessão confirmada válida até esse epoch (0 = sem cache)
+        self._login_valid_until = 0.0
+        # Handler viu a sessão cair durante um deal: revalidar antes do próximo ciclo
+        self.session_lost = False
+
+    @property
+    def concurrency(self) -> int:
+        """Quantidade de deals desta loja processados em paralelo (um por aba)."""
+        return config.get_store_concurrency(self.name)
 
     @abstractmethod
     async def process_deal(self, tab: "nodriver.Tab", deal: "PelandoDeal") -> "Product | None":
         """
         Processa um deal do Pelando e retorna um Product com link de afiliado.
+        A tab recebida é exclusiva deste deal (pode rodar em paralelo com outros),
+        mas vem do pool de abas quentes: não deve ser fechada pelo handler.
         Retorna None se falhar.
         """
         pass
 
+    async def process_deal_http(self, deal: "PelandoDeal") -> "Product | None":
+        """
+        Caminho sem browser (opcional). Retorna o Product ou None para o
+        chamador cair em process_deal com uma aba.
+        """
+        return None
+
     @abstractmethod
     async def is_logged_in(self, browser: "nodriver.Browser") -> bool:
         """Verifica se está logado no programa de afiliados da loja."""
@@ -30,3 +70,115 @@ class BaseStore(ABC):
     async def login(self, browser: "nodriver.Browser") -> bool:
         """Realiza login no programa de afiliados. Retorna True se sucesso."""
         pass
+
+    async def session_cookie_state(self, browser: "nodriver.Browser") -> bool | None:
+        """Estado do login a partir dos cookies de sessão (sem navegar).
+
+        True: todos os cookies de sessão presentes e longe de expirar.
+        False: nenhum deles presente (deslogado com certeza).
+        None: ambíguo (só parte deles, expirando, ou falha ao ler) —
+        o chamador deve confirmar pela página.
+        """
+        if not self.session_cookie_names:
+            return None
+        try:
+            cookies = await browser.main_tab.send(cdp.network.get_cookies(urls=[self.domain_url]))
+        except Exception as e:
+            logger.debug(f"{self.display_name}: falha ao ler cookies: {e}")
+            return None
+
+        found = {c.name: c for c in cookies if c.name in self.session_cookie_names}
+        if not found:
+            return False
+        if len(found) < len(self.session_cookie_names):
+            return None
+
+        # expires <= 0 é cookie de sessão do browser: vale enquanto o perfil viver
+        expiries = [c.expires for c in found.values() if c.expires and c.expires > 0]
+        expires_at = min(expiries) if expiries else float("inf")
+        if expires_at < time.time() + SESSION_EXPIRY_MARGIN_SECONDS:
+            return None
+
+        self._login_valid_until = min(expires_at, time.time() + LOGIN_CACHE_MAX_SECONDS)
+        return True
+
+    async def check_login(self, browser: "nodriver.Browser") -> bool:
+        """Verifica o login usando cache e cookies; só abre a página se os cookies forem ambíguos."""
+        self.session_lost = False
+        if time.time() < self._login_valid_until:
+            logger.info(f"{self.display_name}: sessão em cache válida")
+            return True
+
+        state = await self.session_cookie_state(browser)
+        if state is not None:
+            logger.info(f"{self.display_name}: login {'ativo' if state else 'ausente'} pelos cookies de sessão")
+            return state
+
+        logger.info(f"{self.display_name}: cookies de sessão inconclusivos, verificando pela página...")
+        logged_in = await self.is_logged_in(browser)
+        if logged_in:
+            self._login_valid_until = time.time() + LOGIN_CACHE_MAX_SECONDS
+        return logged_in
+
+    def invalidate_login_cache(self):
+        """Descarta a sessão em cache (handler viu sinal de sessão perdida durante um deal)."""
+        self._login_valid_until = 0.0
+        self.session_lost = True
+
+    @property
+    def warm_url(self) -> str:
+        """URL leve na origem da loja onde as abas do pool ficam paradas entre deals."""
+        return self.domain_url.rstrip("/") + "/robots.txt"
+
+    def is_store_url(self, url: str) -> bool:
+        """True se a URL já está no domínio da loja (fim da cadeia de redirects)."""
+        host = (urlparse(url).hostname or "").lower()
+        return any(host == h or host.endswith("." + h) for h in self.store_hosts)
+
+    async def _open_store_tab(self, tab: "nodriver.Tab", deal: "PelandoDeal") -> "nodriver.Tab | None":
+        """Abre a página da loja para o deal.
+
+        Caminho rápido: resolve o link via HTTP e navega a própria aba do deal
+        direto para a URL final (sem renderizar o Pelando nem abrir popup).
+        Fallback: abre o deal no Pelando, clica em `.store-link-button` e
+        retorna a aba popup. Retorna None se o deal é cupom ou se falhar.
+        """
+        store_url = await link_resolver.resolve_store_link(deal, self.is_store_url)
+        if store_url is None:
+            return None
+        if store_url:
+            await tab.get(store_url)
+            return tab
+
+        await tab.get(deal.deal_url)
+        await readiness.wait_for_selector(tab, ".store-link-button", timeout=10)
+
+        store_btn = await tab.select(".store-link-button", timeout=2)
+        if not store_btn:
+            logger.error("Botão store-link-button não encontrado")
+            return None
+
+        btn_text = (store_btn.text or "").strip().lower()
+        if "cupom" in btn_text:
+            logger.info(f"Deal é cupom (botão: '{btn_text}'), ignorando")
+            deal.is_coupon = True
+            return None
+
+        # Clicar e pegar a aba aberta por este deal (Target.targetCreated)
+        store_tab = await readiness.wait_for_popup(tab, store_btn.click, timeout=10)
+        logger.info(f"Clicou no botão para ir à {self.display_name}")
+        if not store_tab:
+            logger.error("Nova aba não abriu após clicar no botão")
+            return None
+        # Popup já começou a carregar, mas o resto da navegação passa pelo filtro
+        await enable_request_filter(store_tab)
+        return store_tab
+
+    async def _close_tab(self, tab: "nodriver.Tab | None"):
+        """Fecha apenas a aba informada (não mexe nas abas de outros deals)."""
+        if tab is None:
+            return
+        try:
+            await tab.close()
+        except Exception as e:
+            logger.debug(f"Erro ao fechar aba: {e}")
@@ -2,10 +2,12 @@ import asyncio
 import json
 import logging
 import re
-import requests
 
 import nodriver
 
+import config
+from database import db
+from scraper import link_resolver, ml_product_data, readiness
 from scraper.stores.base_store import BaseStore
 from models.pelando_deal import PelandoDeal
 from models.product import Product
@@ -18,67 +20,57 @@ class MercadoLivreStore(BaseStore):
     display_name = "Mercado Livre"
     domain_url = "https://www.mercadolivre.com.br"
     login_url = "https://www.mercadolivre.com.br/navigation/login"
+    store_hosts = ("mercadolivre.com.br",)
+    # Sessão do ML (ssid) + id do usuário logado
+    session_cookie_names = ("ssid", "orguseridp")
 
     async def process_deal(self, tab: nodriver.Tab, deal: PelandoDeal) -> Product | None:
         """
         Processa um deal do Pelando que é do Mercado Livre.
-        1. Navega para a página do deal no Pelando
-        2. Clica no botão para ir ao ML
+        1. Resolve o link da loja via HTTP (ou abre o deal no Pelando)
+        2. Navega direto pro ML (ou clica no botão e pega a popup)
         3. Na página do produto, gera link de afiliado
         4. Extrai dados do produto
         5. Retorna Product
         """
+        ml_tab = None
         try:
             logger.info(f"Processando deal ML: {deal.title[:50]}...")
 
-            # 1. Navegar para página do deal no Pelando
-            await tab.get(deal.deal_url)
-            await tab.sleep(2)
-
-            # 2. Clicar no botão para ir ao ML
-            store_btn = await tab.select(".store-link-button", timeout=10)
-            if not store_btn:
-                logger.error("Botão store-link-button não encontrado")
-                return None
-
-            btn_text = (store_btn.text or "").strip().lower()
-            if "cupom" in btn_text:
-                logger.info(f"Deal é cupom (botão: '{btn_text}'), ignorando")
-                return None
-
-            await store_btn.click()
-            logger.info("Clicou no botão para ir ao ML")
-
-            # Aguardar nova aba
-            await tab.sleep(3)
-
-            # Pegar a nova aba
-            browser = tab.browser
-            if len(browser.tabs) < 2:
-                logger.error("Nova aba não abriu após clicar no botão")
+            # 1-2. Chegar na página da loja (HTTP + navegação direta, ou clique no Pelando)
+            ml_tab = await self._open_store_tab(tab, deal)
+            if not ml_tab:
                 return None
 
-            ml_tab = browser.tabs[-1]
-            await ml_tab  # atualizar estado
-            current_url = ml_tab.url
+            # Aguardar o redirect do Pelando chegar no ML (short link ou página final)
+            current_url = await readiness.wait_for_url(ml_tab, lambda u: "mercadolivre.com" in u, timeout=10)
             logger.info(f"URL atual: {current_url}")
 
             # Se for short link, aguardar redirect
             if "mercadolivre.com/sec/" in current_url:
                 short_link_url = current_url
-                logger.info("Short link detectado, aguardando browser resolver redirect...")
+                resolved = False
+
+                # Camada 0: Short link já resolvido antes (cache)
+                cached_url = db.get_short_link(short_link_url, config.SHORT_LINK_CACHE_HOURS)
+                if cached_url:
+                    logger.info(f"Short link em cache: {cached_url[:80]}")
+                    await ml_tab.get(cached_url)
+                    current_url = await readiness.wait_for_url(
+                        ml_tab, lambda u: "mercadolivre.com.br" in u, timeout=10
+                    )
+                    resolved = "mercadolivre.com.br" in current_url
 
                 # Camada 1: Aguardar browser resolver
-                resolved = False
-                for i in range(15):
-                    await ml_tab.sleep(2)
-                    await ml_tab
-                    current_url = ml_tab.url
-                    if "mercadolivre.com.br" in current_url:
-                        logger.info(f"Browser resolveu redirect ({(i+1)*2}s): {current_url[:80]}")
-                        resolved = True
-                        break
-                    logger.debug(f"Aguardando redirect... ({i+1}/15) URL: {current_url[:80]}")
+                if not resolved:
+                    logger.info("Short link detectado, aguardando browser resolver redirect...")
+                    current_url = await readiness.wait_for_url(
+                        ml_tab, lambda u: "mercadolivre.com.br" in u, timeout=30
+                    )
+                    resolved = "mercadolivre.com.br" in current_url
+                    if resolved:
+                        logger.info(f"Browser resolveu redirect: {current_url[:80]}")
+                        db.save_short_link(short_link_url, current_url)
 
                 # Camada 2: Extrair URL de redirect do page source
                 if not resolved:
@@ -88,21 +80,23 @@ class MercadoLivreStore(BaseStore):
                     if redirect_url:
                         logger.info(f"URL extraída da página: {redirect_url[:80]}")
                         await ml_tab.get(redirect_url)
-                        await ml_tab.sleep(2)
-                        await ml_tab
-                        current_url = ml_tab.url
+                        current_url = await readiness.wait_for_url(
+                            ml_tab, lambda u: "mercadolivre.com.br" in u, timeout=10
+                        )
                         resolved = "mercadolivre.com.br" in current_url
+                        if resolved:
+                            db.save_short_link(short_link_url, current_url)
 
-                # Camada 3: Resolver via HTTP (cloudscraper/requests)
+                # Camada 3: Resolver via HTTP (httpx assíncrono, cloudscraper numa thread)
                 if not resolved:
                     logger.warning("Tentando resolver short link via HTTP...")
-                    resolved_url = self._resolve_short_link(short_link_url)
-                    if resolved_url and "mercadolivre.com.br" in resolved_url:
+                    resolved_url = await link_resolver.resolve_short_link(short_link_url, self.is_store_url)
+                    if resolved_url:
                         logger.info(f"Resolvido via HTTP: {resolved_url[:200]}")
                         await ml_tab.get(resolved_url)
-                        await ml_tab.sleep(2)
-                        await ml_tab
-                        current_url = ml_tab.url
+                        current_url = await readiness.wait_for_url(
+                            ml_tab, lambda u: "mercadolivre.com.br" in u, timeout=10
+                        )
                         resolved = "mercadolivre.com.br" in current_url
 
                 if not resolved:
@@ -111,7 +105,6 @@ class MercadoLivreStore(BaseStore):
             # Se não estiver no ML, algo deu errado
             if "mercadolivre.com.br" not in current_url:
                 logger.error(f"Não chegou no ML, URL: {current_url}")
-                await self._close_extra_tabs(tab)
                 return None
 
             # 3.1 Se estiver na landing page (/social/pelando), clicar em "Ir para produto"
@@ -120,17 +113,13 @@ class MercadoLivreStore(BaseStore):
                 go_btn = await ml_tab.select("a.poly-component__link--action-link", timeout=10)
                 if go_btn:
                     await go_btn.click()
-                    await ml_tab.sleep(3)
-                    await ml_tab
-                    current_url = ml_tab.url
+                    current_url = await readiness.wait_for_url(ml_tab, lambda u: "/social/" not in u, timeout=15)
                     logger.info(f"Navegou para página do produto: {current_url}")
                 else:
                     logger.error("Botão 'Ir para produto' não encontrado na landing page")
-                    await self._close_extra_tabs(tab)
                     return None
 
             # 4. Gerar link de afiliado
-            await ml_tab.sleep(2)
             affiliate_link = await self._generate_affiliate_link(ml_tab)
 
             if not affiliate_link:
@@ -142,7 +131,6 @@ class MercadoLivreStore(BaseStore):
 
             if not product_data:
                 logger.error("Falha ao extrair dados do produto")
-                await self._close_extra_tabs(tab)
                 return None
 
             product = Product(
@@ -161,14 +149,14 @@ class MercadoLivreStore(BaseStore):
             )
 
             logger.info(f"Produto extraído: {product.title[:50]} - {product.price}")
-
-            await self._close_extra_tabs(tab)
             return product
 
         except Exception as e:
             logger.error(f"Erro ao processar deal ML: {e}")
-            await self._close_extra_tabs(tab)
             return None
+        finally:
+            if ml_tab is not tab:
+                await self._close_tab(ml_tab)
 
     async def _generate_affiliate_link(self, tab: nodriver.Tab) -> str:
         """Gera link de afiliado usando a barra de afiliados do ML."""
@@ -177,22 +165,21 @@ class MercadoLivreStore(BaseStore):
             generate_btn = await tab.select("button.generate_link_button", timeout=10)
             if not generate_btn:
                 logger.warning("Botão de gerar link não encontrado (usuário pode não estar logado como afiliado)")
+                # Sessão pode ter caído: o próximo ciclo revalida pelos cookies/página
+                self.invalidate_login_cache()
                 return ""
 
             await generate_btn.scroll_into_view()
-            await tab.sleep(0.5)
             await generate_btn.click()
             logger.info("Clicou em 'Gerar link'")
 
-            await tab.sleep(2)
-
-            # Tentar pegar link do textarea via JS
-            affiliate_link = await tab.evaluate("""
+            # Aguardar o link aparecer no textarea (MutationObserver)
+            affiliate_link = await readiness.wait_for_condition(tab, """
                 (() => {
                     const textarea = document.querySelector('textarea.andes-form-control__field');
                     return textarea ? (textarea.value || textarea.textContent || '') : '';
                 })()
-            """)
+            """, timeout=5)
 
             if affiliate_link:
                 logger.info(f"Link de afiliado obtido: {str(affiliate_link)[:60]}...")
@@ -211,8 +198,7 @@ class MercadoLivreStore(BaseStore):
                         };
                     """)
                     await copy_btn.click()
-                    await tab.sleep(1)
-                    affiliate_link = await tab.evaluate("window.__copiedText || ''")
+                    affiliate_link = await readiness.wait_for_condition(tab, "window.__copiedText || ''", timeout=3)
                     if affiliate_link:
                         logger.info(f"Link via clipboard: {str(affiliate_link)[:60]}...")
                         return affiliate_link
@@ -227,11 +213,53 @@ class MercadoLivreStore(BaseStore):
             return ""
 
     async def _extract_product_data(self, tab: nodriver.Tab, deal: PelandoDeal) -> dict | None:
-        """Extrai dados do produto da página do ML via JavaScript."""
+        """Extrai dados do produto da página do ML.
+
+        Lê os dados estruturados do HTML numa chamada só (ml_product_data);
+        os seletores via JavaScript só rodam se faltar título ou preço.
+        """
         try:
             await tab
             mlb_id = self._extract_mlb_id(tab.url)
 
+            data = ml_product_data.parse_product(await tab.get_content())
+            if not data["title"] or not data["price"]:
+                logger.info("Dados estruturados incompletos, extraindo via seletores...")
+                js_data = await self._extract_product_data_js(tab)
+                if js_data:
+                    data = {k: data.get(k) or v for k, v in js_data.items()}
+
+            if not data.get("title"):
+                title = deal.title  # Fallback para título do Pelando
+                if not title:
+                    logger.warning("Título do produto não encontrado")
+                    return None
+                data["title"] = title
+
+            # Melhorar URL da imagem (alta resolução)
+            image_url = data.get("image_url", "")
+            if "mlstatic.com" in image_url:
+                image_url = image_url.replace("/D_Q_NP_", "/D_NQ_NP_")
+                image_url = re.sub(r"-[RV](\.\w+)$", r"-O\1", image_url)
+
+            return {
+                "mlb_id": mlb_id,
+                "title": data["title"],
+                "price": data.get("price", "") or deal.price,
+                "original_price": data.get("original_price", ""),
+                "coupon": data.get("coupon", ""),
+                "image_url": image_url or deal.image_url,
+                "rating": data.get("rating", ""),
+                "sales_info": data.get("sales_info", ""),
+            }
+
+        except Exception as e:
+            logger.error(f"Erro ao extrair dados do produto: {e}")
+            return None
+
+    async def _extract_product_data_js(self, tab: nodriver.Tab) -> dict | None:
+        """Fallback: extrai dados do produto da página do ML via seletores JavaScript."""
+        try:
             data_raw = await tab.evaluate("""
                 JSON.stringify((() => {
                     // Título
@@ -318,34 +346,21 @@ class MercadoLivreStore(BaseStore):
                 data = json.loads(data_raw) if isinstance(data_raw, str) else None
             except (TypeError, ValueError):
                 data = None
-
-            if not data or not data.get("title"):
-                title = deal.title  # Fallback para título do Pelando
-                if not title:
-                    logger.warning("Título do produto não encontrado")
-                    return None
-                data = data or {}
-                data["title"] = title
-
-            # Melhorar URL da imagem (alta resolução)
-            image_url = data.get("imageUrl", "")
-            if "mlstatic.com" in image_url:
-                image_url = image_url.replace("/D_Q_NP_", "/D_NQ_NP_")
-                image_url = re.sub(r"-[RV](\.\w+)$", r"-O\1", image_url)
+            if not data:
+                return None
 
             return {
-                "mlb_id": mlb_id,
-                "title": data["title"],
-                "price": data.get("price", "") or deal.price,
+                "title": data.get("title", ""),
+                "price": data.get("price", ""),
                 "original_price": data.get("originalPrice", ""),
-                "coupon": data.get("coupon", ""),
-                "image_url": image_url or deal.image_url,
+                "image_url": data.get("imageUrl", ""),
                 "rating": data.get("rating", ""),
                 "sales_info": data.get("salesInfo", ""),
+                "coupon": data.get("coupon", ""),
             }
 
         except Exception as e:
-            logger.error(f"Erro ao extrair dados do produto: {e}")
+            logger.error(f"Erro ao extrair dados via seletores: {e}")
             return None
 
     def _extract_mlb_id(self, url: str) -> str:
@@ -395,81 +410,12 @@ class MercadoLivreStore(BaseStore):
             logger.warning(f"Erro ao extrair redirect da página: {e}")
         return ""
 
-    def _resolve_short_link(self, url: str) -> str:
-        """Resolve short link do ML seguindo redirects passo a passo."""
-        headers = {
-            "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-        }
-
-        # 1. Tentar com cloudscraper
-        try:
-            import cloudscraper
-            scraper = cloudscraper.create_scraper()
-            resp = scraper.get(url, allow_redirects=True, timeout=15)
-            resolved = resp.url
-            logger.info(f"Short link resolvido (cloudscraper): {resolved[:150]}")
-            if "mercadolivre.com.br" in resolved:
-                return resolved
-        except ImportError:
-            logger.debug("cloudscraper não instalado, pulando")
-        except Exception as e:
-            logger.warning(f"Erro cloudscraper: {e}")
-
-        # 2. Seguir redirects manualmente
-        try:
-            from urllib.parse import urlparse
-            session = requests.Session()
-            current_url = url
-            for step in range(10):
-                resp = session.get(current_url, allow_redirects=False, timeout=15, headers=headers)
-                location = resp.headers.get("Location", "")
-                logger.info(f"Redirect step {step}: HTTP {resp.status_code} -> {location[:150] if location else 'N/A'}")
-
-                if resp.status_code in (301, 302, 303, 307, 308) and location:
-                    if location.startswith("/"):
-                        parsed = urlparse(current_url)
-                        location = f"{parsed.scheme}://{parsed.netloc}{location}"
-                    current_url = location
-                    if "mercadolivre.com.br" in current_url:
-                        logger.info(f"Short link resolvido (manual step {step}): {current_url[:150]}")
-                        return current_url
-                else:
-                    break
-        except Exception as e:
-            logger.warning(f"Erro ao seguir redirects manualmente: {e}")
-
-        # 3. Fallback: requests com allow_redirects=True
-        for method in (requests.head, requests.get):
-            try:
-                resp = method(url, allow_redirects=True, timeout=15, headers=headers)
-                resolved = resp.url
-                logger.info(f"Short link resolvido ({method.__name__}): {resolved[:150]}")
-                if "mercadolivre.com.br" in resolved:
-                    return resolved
-            except Exception as e:
-                logger.warning(f"Erro {method.__name__} ao resolver short link: {e}")
-        return ""
-
-    async def _close_extra_tabs(self, main_tab: nodriver.Tab):
-        """Fecha abas extras e volta para a principal."""
-        try:
-            browser = main_tab.browser
-            for t in browser.tabs[:]:
-                if t != main_tab:
-                    try:
-                        await t.close()
-                    except Exception:
-                        pass
-            await main_tab.bring_to_front()
-        except Exception:
-            pass
-
     async def is_logged_in(self, browser: nodriver.Browser) -> bool:
         """Verifica se está logado no programa de afiliados do ML."""
         try:
             check_tab = await browser.get("https://www.mercadolivre.com.br/afiliados/hub", new_tab=True)
-            await check_tab.sleep(3)
+            # Hub redireciona pro login quando a sessão expirou; espera o load pra URL estabilizar
+            await readiness.wait_for_load(check_tab, timeout=10)
             await check_tab
             current_url = check_tab.url
             logged_in = "login" not in current_url and "afiliados" in current_url
@@ -0,0 +1,152 @@
+"""Pool de abas quentes por loja, reaproveitadas entre deals.
+
+Abrir uma aba nova por deal custa criação de target, renderer novo e página
+fria. Aqui cada browser mantém, por loja, até `handler.concurrency` abas
+paradas na origem da loja (`handler.warm_url`): o renderer do site, DNS,
+TLS e conexões já estão prontos quando o próximo deal chega. Cada aba é
+emprestada a um deal por vez e, ao voltar, é resetada (navega de novo para
+a warm_url) em background antes de ficar disponível.
+"""
+import asyncio
+import contextlib
+import logging
+from collections import deque
+from urllib.parse import urlparse
+
+import nodriver
+
+from scraper import readiness
+from scraper.request_filter import enable_request_filter
+
+logger = logging.getLogger("TAB_POOL")
+
+# Atributo no Browser onde o pool fica guardado (morre junto com o browser)
+_POOL_ATTR = "_kop_tab_pool"
+
+# Quem espera aba reconfere a cada N segundos se o browser ainda está vivo
+_WAIT_RECHECK_SECONDS = 5
+
+
+class _StoreTabs:
+    def __init__(self, max_size: int):
+        self.idle: deque[nodriver.Tab] = deque()
+        self.size = 0
+        self.max_size = max(1, max_size)
+        # Sinalizada quando uma aba volta ao pool ou é descartada (libera vaga)
+        self.changed = asyncio.Condition()
+
+    async def notify(self):
+        async with self.changed:
+            self.changed.notify_all()
+
+
+class TabPool:
+    def __init__(self, browser: nodriver.Browser):
+        self.browser = browser
+        self._stores: dict[str, _StoreTabs] = {}
+        self._resets: set[asyncio.Task] = set()
+
+    def _store(self, handler) -> _StoreTabs:
+        if handler.name not in self._stores:
+            self._stores[handler.name] = _StoreTabs(handler.concurrency)
+        return self._stores[handler.name]
+
+    def _is_open(self, tab: nodriver.Tab) -> bool:
+        target_id = tab.target.target_id if tab.target else None
+        return any(t.target.target_id == target_id for t in self.browser.tabs)
+
+    async def _warm(self, tab: nodriver.Tab, handler) -> bool:
+        """Deixa a aba parada na origem da loja. False se a aba não serve mais."""
+        origin = "{0.scheme}://{0.netloc}".format(urlparse(handler.warm_url))
+        try:
+            await tab.get(handler.warm_url)
+            ready = await readiness.wait_for_condition(
+                tab,
+                f"document.readyState === 'complete' && location.origin === {origin!r}",
+                timeout=15,
+            )
+            if not ready:
+                logger.debug(f"{handler.display_name}: aba não carregou a warm_url a tempo")
+            return True
+        except Exception as e:
+            logger.debug(f"{handler.display_name}: falha ao aquecer aba: {e}")
+            return False
+
+    async def _new_tab(self, handler) -> nodriver.Tab:
+        tab = await self.browser.get("about:blank", new_tab=True)
+        await enable_request_filter(tab)
+        await self._warm(tab, handler)
+        return tab
+
+    async def _discard(self, tab: nodriver.Tab, store: _StoreTabs):
+        store.size -= 1
+        await store.notify()
+        with contextlib.suppress(Exception):
+            await tab.close()
+
+    async def _reset_and_return(self, tab: nodriver.Tab, handler):
+        store = self._store(handler)
+        if not self._is_open(tab) or not await self._warm(tab, handler):
+            await self._discard(tab, store)
+            return
+        store.idle.append(tab)
+        await store.notify()
+
+    async def prewarm(self, handler, count: int = 1):
+        """Cria abas quentes antecipadamente (até o limite da loja)."""
+        store = self._store(handler)
+        while count > 0 and store.size < store.max_size:
+            store.size += 1
+            try:
+                store.idle.append(await self._new_tab(handler))
+            except Exception as e:
+                store.size -= 1
+                logger.warning(f"{handler.display_name}: falha ao pré-aquecer aba: {e}")
+                return
+            count -= 1
+
+    @contextlib.asynccontextmanager
+    async def lease(self, handler):
+        """Empresta uma aba quente da loja para um deal (exclusiva até o fim do bloco)."""
+        store = self._store(handler)
+        tab = None
+        while tab is None:
+            if self.browser.stopped:
+                raise RuntimeError(f"{handler.display_name}: browser parado, sem abas para o deal")
+            if store.idle:
+                tab = store.idle.popleft()
+            elif store.size < store.max_size:
+                store.size += 1
+                try:
+                    tab = await self._new_tab(handler)
+                except Exception:
+                    store.size -= 1
+                    await store.notify()
+                    raise
+                break
+            else:
+                # Espera aba voltar ou vaga abrir (descarte); reconfere o browser periodicamente
+                async with store.changed:
+                    with contextlib.suppress(asyncio.TimeoutError):
+                        await asyncio.wait_for(store.changed.wait(), timeout=_WAIT_RECHECK_SECONDS)
+                continue
+            if not self._is_open(tab):
+                await self._discard(tab, store)
+                tab = None
+
+        try:
+            yield tab
+        finally:
+            # Reset fora do caminho crítico: o deal termina sem esperar a navegação
+            task = asyncio.create_task(self._reset_and_return(tab, handler))
+            self._resets.add(task)
+            task.add_done_callback(self._resets.discard)
+
+
+def get_tab_pool(browser: nodriver.Browser) -> TabPool:
+    """Pool de abas do browser (criado na primeira chamada)."""
+    pool = browser.__dict__.get(_POOL_ATTR)
+    if pool is None:
+        pool = TabPool(browser)
+        browser.__dict__[_POOL_ATTR] = pool
+    return pool
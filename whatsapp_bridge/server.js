@@ -1,3 +1,4 @@
+const crypto = require("crypto");
 const express = require("express");
 const { Client, LocalAuth, MessageMedia } = require("whatsapp-web.js");
 const qrcode = require("qrcode-terminal");
@@ -6,9 +7,49 @@ const app = express();
 app.use(express.json());
 
 const PORT = 3001;
+// Quantas imagens baixadas manter em memória (LRU)
+const MEDIA_CACHE_SIZE = parseInt(process.env.MEDIA_CACHE_SIZE || "50", 10);
+// Fila de envios: quantos envios simultâneos e intervalo mínimo entre envios de cada worker
+const SEND_CONCURRENCY = parseInt(process.env.SEND_CONCURRENCY || "1", 10);
+const SEND_INTERVAL_MS = parseInt(process.env.SEND_INTERVAL_MS || "1000", 10);
+// Por quanto tempo um job finalizado continua consultável em GET /jobs/:id
+const JOB_TTL_MS = parseInt(process.env.JOB_TTL_MS || "600000", 10);
 
 let isReady = false;
 
+// imageUrl -> Promise<MessageMedia>. Guardar a Promise faz envios simultâneos
+// da mesma imagem compartilharem um único download.
+const mediaCache = new Map();
+
+function getMedia(imageUrl) {
+  if (mediaCache.has(imageUrl)) {
+    const cached = mediaCache.get(imageUrl);
+    // Reinsere pra marcar como usada recentemente
+    mediaCache.delete(imageUrl);
+    mediaCache.set(imageUrl, cached);
+    return cached;
+  }
+
+  const media = MessageMedia.fromUrl(imageUrl, { unsafeMime: true }).catch((error) => {
+    mediaCache.delete(imageUrl);
+    throw error;
+  });
+  mediaCache.set(imageUrl, media);
+  while (mediaCache.size > MEDIA_CACHE_SIZE) {
+    mediaCache.delete(mediaCache.keys().next().value);
+  }
+  return media;
+}
+
+async function sendToChat(chatId, message, imageUrl) {
+  if (imageUrl) {
+    const media = await getMedia(imageUrl);
+    await client.sendMessage(chatId, media, { caption: message });
+  } else {
+    await client.sendMessage(chatId, message);
+  }
+}
+
 const client = new Client({
   authStrategy: new LocalAuth({ dataPath: ".wwebjs_auth" }),
   puppeteer: {
@@ -72,14 +113,7 @@ app.post("/send", async (req, res) => {
   }
 
   try {
-    if (imageUrl) {
-      const media = await MessageMedia.fromUrl(imageUrl, {
-        unsafeMime: true,
-      });
-      await client.sendMessage(chatId, media, { caption: message });
-    } else {
-      await client.sendMessage(chatId, message);
-    }
+    await sendToChat(chatId, message, imageUrl);
 
     console.log(`[WHATSAPP] Mensagem enviada para ${chatId}`);
     res.json({ success: true });
@@ -89,6 +123,137 @@ app.post("/send", async (req, res) => {
   }
 });
 
+// Mesma mensagem/imagem para vários chats: a imagem é baixada uma vez só
+app.post("/send-batch", async (req, res) => {
+  if (!isReady) {
+    return res.status(503).json({ error: "WhatsApp não está conectado" });
+  }
+
+  const { chatIds, message, imageUrl } = req.body;
+
+  if (!Array.isArray(chatIds) || chatIds.length === 0 || !message) {
+    return res.status(400).json({ error: "chatIds (lista) e message são obrigatórios" });
+  }
+
+  const results = [];
+  for (const chatId of chatIds) {
+    try {
+      await sendToChat(chatId, message, imageUrl);
+      console.log(`[WHATSAPP] Mensagem enviada para ${chatId}`);
+      results.push({ chatId, success: true });
+    } catch (error) {
+      console.error(`[WHATSAPP] Erro ao enviar para ${chatId}:`, error.message);
+      results.push({ chatId, success: false, error: error.message });
+    }
+  }
+
+  const anySuccess = results.some((r) => r.success);
+  res.status(anySuccess ? 200 : 500).json({ success: anySuccess, results });
+});
+
+// ---- Fila de jobs ----
+// Cada job é uma mensagem para N chats; cada chat vira um item da fila.
+const jobs = new Map();
+const queue = [];
+let idleWorkers = [];
+
+function enqueueJob(chatIds, message, imageUrl) {
+  const job = {
+    id: crypto.randomUUID(),
+    status: "queued",
+    message,
+    imageUrl,
+    results: chatIds.map((chatId) => ({ chatId, status: "queued" })),
+    pending: chatIds.length,
+    createdAt: Date.now(),
+    finishedAt: null,
+  };
+  jobs.set(job.id, job);
+  job.results.forEach((result) => queue.push({ job, result }));
+  // Acorda workers parados
+  idleWorkers.splice(0).forEach((wake) => wake());
+  return job;
+}
+
+function nextItem() {
+  if (queue.length > 0) return Promise.resolve(queue.shift());
+  return new Promise((resolve) => idleWorkers.push(() => resolve(nextItem())));
+}
+
+function jobView(job) {
+  return {
+    jobId: job.id,
+    status: job.status,
+    results: job.results,
+    createdAt: job.createdAt,
+    finishedAt: job.finishedAt,
+  };
+}
+
+async function sendWorker(workerId) {
+  for (;;) {
+    const { job, result } = await nextItem();
+    if (job.status === "queued") job.status = "running";
+    const startedAt = Date.now();
+
+    if (!isReady) {
+      result.status = "failed";
+      result.error = "WhatsApp não está conectado";
+    } else {
+      try {
+        await sendToChat(result.chatId, job.message, job.imageUrl);
+        result.status = "sent";
+        console.log(`[WHATSAPP] (worker ${workerId}) Mensagem enviada para ${result.chatId}`);
+      } catch (error) {
+        result.status = "failed";
+        result.error = error.message;
+        console.error(`[WHATSAPP] (worker ${workerId}) Erro ao enviar para ${result.chatId}:`, error.message);
+      }
+    }
+
+    job.pending -= 1;
+    if (job.pending === 0) {
+      job.status = job.results.some((r) => r.status === "sent") ? "done" : "failed";
+      job.finishedAt = Date.now();
+      setTimeout(() => jobs.delete(job.id), JOB_TTL_MS);
+    }
+
+    const elapsed = Date.now() - startedAt;
+    if (elapsed < SEND_INTERVAL_MS) {
+      await new Promise((resolve) => setTimeout(resolve, SEND_INTERVAL_MS - elapsed));
+    }
+  }
+}
+
+// Enfileira e responde na hora (202); resultado em GET /jobs/:id
+app.post("/jobs", (req, res) => {
+  if (!isReady) {
+    return res.status(503).json({ error: "WhatsApp não está conectado" });
+  }
+
+  const { chatIds, message, imageUrl } = req.body;
+
+  if (!Array.isArray(chatIds) || chatIds.length === 0 || !message) {
+    return res.status(400).json({ error: "chatIds (lista) e message são obrigatórios" });
+  }
+
+  const job = enqueueJob(chatIds, message, imageUrl);
+  console.log(`[WHATSAPP] Job ${job.id} enfileirado (${chatIds.length} chats, fila: ${queue.length})`);
+  res.status(202).json({ jobId: job.id, status: job.status });
+});
+
+app.get("/jobs/:id", (req, res) => {
+  const job = jobs.get(req.params.id);
+  if (!job) {
+    return res.status(404).json({ error: "Job não encontrado" });
+  }
+  res.json(jobView(job));
+});
+
+for (let i = 1; i <= SEND_CONCURRENCY; i++) {
+  sendWorker(i);
+}
+
 client.initialize();
 
 app.listen(PORT, () => {